@@ -10,8 +10,10 @@ from dataclasses import dataclass
 from enum import Enum
 import openai
 from datetime import datetime
+from fastapi import HTTPException
 from sqlalchemy.orm import Session
 from . import models
+from .services import recommendation_library
 import os
 import traceback
 
@@ -50,36 +52,31 @@ class SmartRecommendation:
 class AIRecommendationEngine:
     """Engine principale per raccomandazioni AI"""
     
-    def __init__(self):
+    def __init__(self, db: Optional[Session] = None):
+        self.db = db  # per la libreria di raccomandazioni (altrimenti una sessione propria)
         self.openai_api_key = os.getenv("OPENAI_API_KEY")
         self.model = os.getenv("OPENAI_MODEL", "gpt-4")
         if self.openai_api_key:
             openai.api_key = self.openai_api_key
     
-    def generate_advanced_recommendations(self, session_id: str, results: List, session_data: Dict) -> Dict:
-        """Genera raccomandazioni avanzate complete - RICHIEDE OpenAI"""
+    def generate_advanced_recommendations(self, session_id: str, results: List, session_data: Dict,
+                                          use_ai: bool = True) -> Dict:
+        """
+        Genera raccomandazioni avanzate complete. Testo dall'AI se use_ai e
+        OPENAI_API_KEY sono presenti, altrimenti dalla libreria precalcolata
+        (services/recommendation_library.py); analisi, matrice e ROI sono
+        comunque calcolati qui.
+        """
         try:
             print(f"🤖 AI ENGINE: Iniziando analisi avanzata per sessione {session_id}")
             
-            # ✅ CONTROLLO OBBLIGATORIO OpenAI
-            if not self.openai_api_key:
-                raise HTTPException(
-                    status_code=503, 
-                    detail="❌ Sistema AI non configurato. OPENAI_API_KEY richiesta per raccomandazioni."
-                )
-            
             company_context = self._extract_company_context(session_data)
             analysis = self._perform_advanced_analysis(results, company_context)
             
-            # ✅ SEMPRE AI - nessun fallback automatico
-            ai_recommendations = self._generate_smart_recommendations(analysis, company_context)
-            
-            # Verifica che AI abbia funzionato
-            if ai_recommendations.get("error", False):
-                raise HTTPException(
-                    status_code=503,
-                    detail="❌ Errore generazione AI. Verificare configurazione OPENAI_API_KEY e crediti disponibili."
-                )
+            if use_ai and self.openai_api_key:
+                ai_recommendations = self._generate_smart_recommendations(analysis, company_context)
+            else:
+                ai_recommendations = self._create_fallback_recommendations(analysis, company_context)
             
             return {
                 "session_id": session_id,
@@ -91,7 +88,7 @@ class AIRecommendationEngine:
                 "roi_predictions": analysis["roi_predictions"],
                 "benchmark_comparison": analysis["benchmark"],
                 "sector_insights": self._generate_sector_insights(results, company_context),
-                "ai_powered": True,  # ✅ Sempre AI
+                "ai_powered": ai_recommendations["model_used"] != "LIBRARY",
                 "generated_at": datetime.now().isoformat()
             }
             
@@ -113,7 +110,9 @@ class AIRecommendationEngine:
             "sector": session_data.get("settore", "Non specificato"),
             "size": session_data.get("dimensione", "Non specificato"),
             "referente": session_data.get("referente"),
-            "email": session_data.get("email")
+            "email": session_data.get("email"),
+            "peer_benchmark": session_data.get("peer_benchmark"),
+            "similar_companies": session_data.get("similar_companies") or []
         }
     
     def _extract_employee_count(self, size_string: str) -> Dict[str, Any]:
@@ -200,7 +199,9 @@ class AIRecommendationEngine:
         priority_matrix = self._create_priority_matrix(critical_areas, data_by_process)
         roadmap = self._create_implementation_roadmap(priority_matrix, company_context)
         roi_predictions = self._calculate_roi_predictions(priority_matrix, company_context)
-        benchmark = self._create_sector_benchmark(overall_avg, company_context["sector"])
+        benchmark = self._create_sector_benchmark(
+            overall_avg, company_context["sector"], company_context.get("peer_benchmark")
+        )
         
         return {
             "summary": {
@@ -220,6 +221,7 @@ class AIRecommendationEngine:
             "detailed_data": data_by_process,
             "weak_areas": weak_areas,
             "strong_areas": strong_areas,
+            "answers": results,
         }
     
     def _get_criticality_level(self, score):
@@ -440,7 +442,7 @@ class AIRecommendationEngine:
         investment_estimate = base_investment * size_mult * sector_mult
         
         # ✅ BENEFICI SPECIFICI PER TURISMO
-        if any(keyword in sector for keyword in ["turismo", "hospitality", "hotel", "travel"]):
+        if recommendation_library.library_sector(sector) == "turismo":
             benefits = {
                 "productivity_increase": f"{(high_priority_items * 0.12 + medium_priority_items * 0.08) * 100:.1f}%",
                 "customer_satisfaction": f"{(high_priority_items * 0.18 + medium_priority_items * 0.12) * 100:.1f}%",
@@ -468,8 +470,33 @@ class AIRecommendationEngine:
             "confidence_level": "MEDIO" if high_priority_items < 5 else "ALTO"
         }
     
-    def _create_sector_benchmark(self, overall_score, sector):
-        """Benchmark settoriale con turismo"""
+    def _create_sector_benchmark(self, overall_score, sector, peer_stats=None):
+        """Benchmark settoriale: dati reali di portafoglio se disponibili, altrimenti riferimenti statici"""
+        if peer_stats and peer_stats.get("avg") is not None:
+            from app.services.portfolio import histogram_rank
+            average = peer_stats["avg"]
+            excellence = peer_stats.get("excellence") or average
+            if overall_score >= excellence:
+                position = "ECCELLENTE"
+            elif overall_score >= average + 0.3:
+                position = "SOPRA LA MEDIA"
+            elif overall_score <= average - 0.3:
+                position = "SOTTO LA MEDIA"
+            else:
+                position = "NELLA MEDIA"
+            return {
+                "sector": sector,
+                "your_score": overall_score,
+                "sector_average": average,
+                "excellence_threshold": excellence,
+                "position": position,
+                "gap_to_excellence": round(excellence - overall_score, 2),
+                "percentile_estimate": histogram_rank(peer_stats["histogram"], peer_stats["peers"], overall_score),
+                "percentiles": peer_stats.get("percentiles"),
+                "peers": peer_stats["peers"],
+                "source": "portfolio"
+            }
+        
         # ✅ BENCHMARK SETTORIALI - INCLUSO TURISMO
         sector_benchmarks = {
             "automotive": {"avg": 3.2, "excellence": 4.1},
@@ -516,7 +543,8 @@ class AIRecommendationEngine:
             "excellence_threshold": benchmark_data["excellence"],
             "position": position,
             "gap_to_excellence": round(benchmark_data["excellence"] - overall_score, 2),
-            "percentile_estimate": max(10, min(90, int((overall_score / 5) * 100)))
+            "percentile_estimate": max(10, min(90, int((overall_score / 5) * 100))),
+            "source": "static"
         }
     
     def _get_maturity_level(self, score):
@@ -572,7 +600,7 @@ class AIRecommendationEngine:
             sector = company_context["sector"]
             
             # ✅ PROMPT SPECIFICO PER TURISMO
-            if any(keyword in sector.lower() for keyword in ["turismo", "hospitality", "hotel", "travel", "restaurant"]):
+            if recommendation_library.library_sector(sector) == "turismo":
                 sector_context = f"""
 SETTORE TURISMO - SPECIFICITÀ:
 - Focus su Customer Experience e Digital Transformation
@@ -614,8 +642,8 @@ TOP 3 AREE CRITICHE (solo applicabili):
             prompt += f"""
 
 BUDGET: €{analysis["roi_predictions"]["investment_range"]["min"]:,} - €{analysis["roi_predictions"]["investment_range"]["max"]:,}
-BENCHMARK: {analysis["benchmark"]["position"]} nel settore {sector}
-
+BENCHMARK: {analysis["benchmark"]["position"]} nel settore {sector}{f' (media reale {analysis["benchmark"]["sector_average"]} su {analysis["benchmark"]["peers"]} aziende, percentile {analysis["benchmark"]["percentile_estimate"]})' if analysis["benchmark"].get("source") == "portfolio" else ""}
+{self._format_similar_companies(company_context.get("similar_companies"))}
 CONTESTO DIMENSIONALE ({employee_info["category"]}):
 {self._get_size_specific_context(employee_info["category"])}
 
@@ -665,21 +693,40 @@ Tono: Consulente senior esperto. Risposte LUNGHE e DETTAGLIATE. Fornisci nomi sp
             print(f"❌ Errore OpenAI: {e}")
             return self._create_fallback_recommendations(analysis, company_context)
     
+    def _format_similar_companies(self, neighbours) -> str:
+        """Aziende con profilo simile (services/similar_companies.py), anonime nel prompt"""
+        if not neighbours:
+            return ""
+        text = "\nAZIENDE CON PROFILO DI MATURITÀ SIMILE (assessment chiusi, anonimi):\n"
+        for i, item in enumerate(neighbours, 1):
+            text += f"- Azienda {chr(64 + i)} ({item.get('settore') or 'settore n.d.'}, {item.get('dimensione') or 'dimensione n.d.'}): punteggio {item['overall']}/5"
+            if item.get("ahead"):
+                text += "; più avanti in " + ", ".join(
+                    f"{c['process']} - {c['category']} (+{c['gap']})" for c in item["ahead"]
+                )
+            text += "\n"
+        text += "Usa questi profili come riferimento per priorità e roadmap, senza attribuire loro risultati non indicati.\n"
+        return text
+
     def _create_fallback_recommendations(self, analysis, company_context):
-        """Messaggio di errore quando OpenAI non è disponibile"""
+        """Raccomandazioni dalla libreria precalcolata quando l'AI non è richiesta o non risponde"""
+        db = self.db
+        if db is None:
+            from app.database import SessionLocal
+            db = SessionLocal()
+        try:
+            report = recommendation_library.build_report(
+                db, analysis["answers"], company_context["sector"], company_context["name"]
+            )
+        finally:
+            if self.db is None:
+                db.close()
         return {
-            "content": "❌ ERRORE: Sistema di raccomandazioni AI non configurato.\n\n" +
-                      "Per ottenere raccomandazioni personalizzate è necessario:\n" +
-                      "1. Configurare OPENAI_API_KEY nel file .env\n" +
-                      "2. Verificare che la chiave API sia valida\n" +
-                      "3. Assicurarsi di avere crediti OpenAI disponibili\n\n" +
-                      f"📊 Dati disponibili: {len(analysis['priority_matrix']['high_priority'])} aree critiche identificate\n" +
-                      f"🏢 Azienda: {company_context['name']} - {company_context['sector']}\n" +
-                      f"💡 Punteggio: {analysis['summary']['overall_score']}/5",
-            "model_used": "ERROR_NO_AI",
-            "error": True,
-            "confidence": "NONE",
-            "customization_level": "NONE"
+            "content": report["content"],
+            "model_used": "LIBRARY",
+            "error": False,
+            "confidence": "MEDIUM" if report["entries"] else "LOW",
+            "customization_level": "LIBRARY"
         }
     
     def _generate_sector_insights(self, results, company_context):
@@ -748,10 +795,11 @@ Tono: Consulente senior esperto. Risposte LUNGHE e DETTAGLIATE. Fornisci nomi sp
 # 🎯 FUNZIONI HELPER PER INTEGRAZIONE
 # ============================================================================
 
-def get_ai_recommendations_advanced(session_id: str, results: List, session_data: Dict) -> Dict:
+def get_ai_recommendations_advanced(session_id: str, results: List, session_data: Dict, use_ai: bool = True,
+                                    db: Optional[Session] = None) -> Dict:
     """Funzione helper per integrazione in radar.py"""
-    engine = AIRecommendationEngine()
-    return engine.generate_advanced_recommendations(session_id, results, session_data)
+    engine = AIRecommendationEngine(db)
+    return engine.generate_advanced_recommendations(session_id, results, session_data, use_ai)
 
 def get_sector_insights(results: List, company_context: Dict) -> Dict:
     """Funzione helper per insights settoriali"""
@@ -1,7 +1,13 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 import os
+import threading
+import time
+import uuid
 from dotenv import load_dotenv
 
 load_dotenv()  # Carica il .env se presente
@@ -19,7 +25,101 @@ if not SQLALCHEMY_DATABASE_URL:
         f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
     )
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    if value is None or value.strip() == "":
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        print(f"⚠️ {name}={value!r} non valido, uso default {default}")
+        return default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None or value.strip() == "":
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# ✅ Configurazione pool da variabili d'ambiente
+DB_POOL_SIZE = _env_int("DB_POOL_SIZE", 10)
+DB_MAX_OVERFLOW = _env_int("DB_MAX_OVERFLOW", 20)
+DB_POOL_TIMEOUT = _env_int("DB_POOL_TIMEOUT", 30)            # secondi di attesa per una connessione libera
+DB_POOL_RECYCLE = _env_int("DB_POOL_RECYCLE", 1800)          # secondi, -1 per disabilitare
+DB_POOL_PRE_PING = _env_bool("DB_POOL_PRE_PING", True)
+DB_STATEMENT_TIMEOUT_MS = _env_int("DB_STATEMENT_TIMEOUT_MS", 0)  # 0 = nessun limite
+DB_APPLICATION_NAME = os.getenv("DB_APPLICATION_NAME", "assessment-platform")
+# Modalità compatibile PgBouncer (transaction pooling): niente parametri di startup
+# non supportati e nessuna cache di prepared statement lato driver
+DB_PGBOUNCER = _env_bool("DB_PGBOUNCER", False)
+
+
+class _WaitStatsMixin:
+    """Misura il tempo di attesa per ottenere una connessione dal pool"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.total_checkouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.timeouts = 0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._stats_lock:
+                self.total_checkouts += 1
+                self.total_wait += elapsed
+                if elapsed > self.max_wait:
+                    self.max_wait = elapsed
+
+
+class InstrumentedQueuePool(_WaitStatsMixin, QueuePool):
+    """QueuePool con statistiche di attesa (engine sincrono)"""
+
+
+class InstrumentedAsyncQueuePool(_WaitStatsMixin, AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool con statistiche di attesa (engine asyncio)"""
+
+
+def _connect_args() -> dict:
+    if not SQLALCHEMY_DATABASE_URL.startswith("postgresql"):
+        return {}
+    args = {"application_name": DB_APPLICATION_NAME}
+    # PgBouncer rifiuta il parametro di startup "options": in quel caso il
+    # timeout viene impostato con SET LOCAL all'inizio di ogni transazione
+    if DB_STATEMENT_TIMEOUT_MS > 0 and not DB_PGBOUNCER:
+        args["options"] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
+    return args
+
+
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    poolclass=InstrumentedQueuePool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+    connect_args=_connect_args(),
+)
+
+if DB_PGBOUNCER and DB_STATEMENT_TIMEOUT_MS > 0:
+    @event.listens_for(engine, "begin")
+    def _set_statement_timeout(conn):
+        conn.exec_driver_sql(f"SET LOCAL statement_timeout = {DB_STATEMENT_TIMEOUT_MS}")
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -29,3 +129,102 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+# ============================================================================
+# ACCESSO ASINCRONO (asyncpg) - per gli handler async def
+# ============================================================================
+
+def _async_database_url(url: str) -> str:
+    """Converte l'URL sincrono (psycopg2) nell'equivalente asyncpg"""
+    for prefix in ("postgresql+psycopg2://", "postgresql+psycopg://", "postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    return url
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or _async_database_url(SQLALCHEMY_DATABASE_URL)
+
+
+def _async_connect_args() -> dict:
+    if not ASYNC_DATABASE_URL.startswith("postgresql+asyncpg"):
+        return {}
+    server_settings = {"application_name": DB_APPLICATION_NAME}
+    if DB_STATEMENT_TIMEOUT_MS > 0 and not DB_PGBOUNCER:
+        server_settings["statement_timeout"] = str(DB_STATEMENT_TIMEOUT_MS)
+    args = {"server_settings": server_settings}
+    if DB_PGBOUNCER:
+        # PgBouncer in transaction mode non garantisce la stessa connessione
+        # server tra PREPARE ed EXECUTE: niente cache e nomi univoci
+        args.update({
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+        })
+    return args
+
+
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    poolclass=InstrumentedAsyncQueuePool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+    connect_args=_async_connect_args(),
+)
+
+if DB_PGBOUNCER and DB_STATEMENT_TIMEOUT_MS > 0:
+    @event.listens_for(async_engine.sync_engine, "begin")
+    def _set_async_statement_timeout(conn):
+        conn.exec_driver_sql(f"SET LOCAL statement_timeout = {DB_STATEMENT_TIMEOUT_MS}")
+
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def _pool_stats(pool) -> dict:
+    """Fotografia dello stato di un pool di connessioni"""
+    stats = {
+        "pool_class": type(pool).__name__,
+        "pool_size": pool.size() if hasattr(pool, "size") else None,
+        "checked_out": pool.checkedout() if hasattr(pool, "checkedout") else None,
+        "checked_in": pool.checkedin() if hasattr(pool, "checkedin") else None,
+        "overflow": pool.overflow() if hasattr(pool, "overflow") else None,
+        "max_overflow": DB_MAX_OVERFLOW,
+    }
+    if isinstance(pool, _WaitStatsMixin):
+        with pool._stats_lock:
+            checkouts = pool.total_checkouts
+            total_wait = pool.total_wait
+            stats.update({
+                "total_checkouts": checkouts,
+                "timeouts": pool.timeouts,
+                "avg_wait_ms": round(total_wait / checkouts * 1000, 3) if checkouts else 0.0,
+                "max_wait_ms": round(pool.max_wait * 1000, 3),
+                "total_wait_ms": round(total_wait * 1000, 3),
+            })
+    return stats
+
+
+def get_pool_stats() -> dict:
+    """Statistiche del pool e configurazione attiva"""
+    return {
+        "sync": _pool_stats(engine.pool),
+        "async": _pool_stats(async_engine.pool),
+        "config": {
+            "pool_size": DB_POOL_SIZE,
+            "max_overflow": DB_MAX_OVERFLOW,
+            "pool_timeout": DB_POOL_TIMEOUT,
+            "pool_recycle": DB_POOL_RECYCLE,
+            "pool_pre_ping": DB_POOL_PRE_PING,
+            "statement_timeout_ms": DB_STATEMENT_TIMEOUT_MS,
+            "application_name": DB_APPLICATION_NAME,
+            "pgbouncer_mode": DB_PGBOUNCER,
+        },
+    }
@@ -1,19 +1,40 @@
-from fastapi import FastAPI, APIRouter, Depends, HTTPException
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, Query, UploadFile, File
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
+from sqlalchemy import select, tuple_
+from sqlalchemy.orm import Session, load_only, undefer_group
+from sqlalchemy.ext.asyncio import AsyncSession
 from uuid import UUID
 from typing import List, Optional
+from datetime import datetime
+import base64
 from app.routers import pdf
 
-from app.database import get_db
+from app.database import SessionLocal, get_db, get_async_db
 from app import schemas, models
 from app.routers import radar, admin, auth_routes
 from app.routers import assessment_update
 from app.routers import excel_export
+from app.routers import analytics
+from app.services.session_scores import refresh_session_scores
+from app.services import (
+    answer_grid, maturity_clusters, model_versions, portfolio, recommendation_library, session_comparison, session_factory,
+)
 
 # ✅ Init FastAPI app
 app = FastAPI()
 
+# 📚 Libreria di raccomandazioni in memoria prima della prima richiesta
+@app.on_event("startup")
+def load_recommendation_library():
+    db = SessionLocal()
+    try:
+        recommendation_library.refresh(db, force=True)
+    except Exception as e:
+        print(f"⚠️ Libreria raccomandazioni non caricata (migrations/009?): {e}")
+    finally:
+        db.close()
+
 # ✅ Middleware CORS
 app.add_middleware(
     CORSMiddleware,
@@ -27,76 +48,149 @@ app.add_middleware(
 api_router = APIRouter(prefix="/api")
 
 
-# Funzione per pre-popolare le risposte
-def prepopulate_assessment_responses(session_id: UUID, model_name: str, db: Session):
-    """Pre-crea tutte le risposte con score=0 quando viene creato un assessment"""
-    import json
-    from pathlib import Path
-    
-    model_path = Path(f"frontend/public/{model_name}.json")
-    if not model_path.exists():
-        print(f"⚠️ Modello {model_name} non trovato")
-        return
-    
-    try:
-        with open(model_path, 'r', encoding='utf-8') as f:
-            model_data = json.load(f)
-    except Exception as e:
-        print(f"⚠️ Errore caricamento modello: {e}")
-        return
-    
-    responses_to_create = []
-    
-    for process_data in model_data:
-        process_name = process_data.get('process', '')
-        for activity in process_data.get('activities', []):
-            activity_name = activity.get('name', '')
-            for category_name, dimensions in activity.get('categories', {}).items():
-                for dimension_name in dimensions.keys():
-                    response = models.AssessmentResult(
-                        session_id=session_id,
-                        process=process_name,
-                        activity=activity_name,
-                        category=category_name,
-                        dimension=dimension_name,
-                        score=0,
-                        note='',
-                        is_not_applicable=False
-                    )
-                    responses_to_create.append(response)
-    
-    if responses_to_create:
-        db.bulk_save_objects(responses_to_create)
-        db.commit()
-        print(f"✅ Pre-popolate {len(responses_to_create)} risposte")
-
-# 📥 Crea sessione di assessment
+# 📥 Crea sessione di assessment (risposte vuote implicite, vedi services/session_factory.py)
 @api_router.post("/assessment/session", response_model=schemas.AssessmentSessionOut)
 def create_session(data: schemas.AssessmentSessionCreate, db: Session = Depends(get_db)):
-    obj = models.AssessmentSession(**data.dict())
-    db.add(obj)
-    db.commit()
-    db.refresh(obj)
-    
-    # Pre-popola risposte
-    model_name = data.model_name or "i40_assessment_fto"
-    prepopulate_assessment_responses(obj.id, model_name, db)
-    return obj
+    return session_factory.create_session(db, data.dict())
+
+# 📑 Ri-assessment: nuova sessione con le risposte di una esistente (copiate nel database)
+@api_router.post("/assessment/{session_id}/clone", response_model=schemas.AssessmentSessionOut)
+def clone_session(session_id: UUID, data: schemas.AssessmentSessionClone, db: Session = Depends(get_db)):
+    to_version = data.to_version
+    if to_version is None and data.latest_version:
+        model_name = db.query(models.AssessmentSession.model_name).filter(
+            models.AssessmentSession.id == session_id
+        ).scalar()
+        to_version = model_versions.current_version(model_name or session_factory.DEFAULT_MODEL)
+    try:
+        session = session_factory.clone_session(db, session_id, to_version, data.dict())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return session
+
+# 📈 Confronto con un assessment precedente della stessa azienda (default: il più recente prima di questo)
+@api_router.get("/assessment/{session_id}/compare")
+def compare_session(session_id: UUID, baseline: Optional[UUID] = Query(None), db: Session = Depends(get_db)):
+    if baseline is None:
+        baseline = session_comparison.previous_session_id(db, session_id)
+        if baseline is None:
+            raise HTTPException(status_code=404, detail="No previous session to compare with")
+    try:
+        comparison = session_comparison.compare_sessions(db, baseline, session_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if comparison is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return comparison
+
+# 🧩 Cluster di maturità della sessione (job services/maturity_clusters.py)
+@api_router.get("/assessment/{session_id}/cluster")
+def session_cluster(session_id: UUID, db: Session = Depends(get_db)):
+    cluster = maturity_clusters.session_cluster(db, session_id)
+    if cluster is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return cluster
+
+# 📥 Onboarding di un lotto di aziende da CSV (una sessione per riga, tutto o niente)
+@api_router.post("/assessment/sessions/import-csv")
+def import_sessions_csv(file: UploadFile = File(...), db: Session = Depends(get_db)):
+    items, errors = session_factory.read_sessions_csv(file.file)
+    if errors:
+        raise HTTPException(status_code=400, detail=errors)
+    if not items:
+        raise HTTPException(status_code=400, detail="Nessuna azienda nel file")
+    try:
+        sessions = session_factory.create_sessions(db, items)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "created": len(sessions),
+        "sessions": [{"id": str(s.id), "azienda_nome": s.azienda_nome} for s in sessions],
+    }
 
 # 📋 Lista sessioni
 @api_router.get("/assessment/sessions", response_model=List[schemas.AssessmentSessionOut])
 def list_sessions(user_id: Optional[str] = None, company_id: Optional[int] = None, db: Session = Depends(get_db)):
-    q = db.query(models.AssessmentSession)
+    q = db.query(models.AssessmentSession).options(
+        undefer_group("answers"), undefer_group("ai_text")
+    )
     if user_id:
         q = q.filter(models.AssessmentSession.user_id == user_id)
     if company_id:
         q = q.filter(models.AssessmentSession.company_id == company_id)
     return q.order_by(models.AssessmentSession.creato_il.desc()).all()
 
+# Cursore keyset opaco: "<creato_il ISO>|<id>" in base64 url-safe
+def _encode_session_cursor(creato_il: datetime, session_id: UUID) -> str:
+    raw = f"{creato_il.isoformat()}|{session_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def _decode_session_cursor(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created, sid = base64.urlsafe_b64decode(padded.encode()).decode().split("|", 1)
+        return datetime.fromisoformat(created), UUID(sid)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursore non valido")
+
+# 📋 Lista sessioni paginata (keyset su creato_il, id) - solo colonne leggere
+@api_router.get("/assessment/sessions/page", response_model=schemas.AssessmentSessionPage)
+async def list_sessions_page(
+    limit: int = Query(25, ge=1, le=200),
+    cursor: Optional[str] = None,
+    settore: Optional[str] = None,
+    dimensione: Optional[str] = None,
+    status: Optional[str] = Query(None, pattern="^(open|closed)$"),
+    q: Optional[str] = None,
+    user_id: Optional[str] = None,
+    company_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Lista sessioni a pagine: costo costante indipendentemente dal numero di assessment"""
+    S = models.AssessmentSession
+    stmt = select(S).options(load_only(
+        S.id, S.user_id, S.company_id, S.azienda_nome, S.settore, S.dimensione,
+        S.referente, S.email, S.effettuato_da, S.model_name, S.logo_path,
+        S.creato_il, S.data_chiusura
+    ))
+    if user_id:
+        stmt = stmt.where(S.user_id == user_id)
+    if company_id:
+        stmt = stmt.where(S.company_id == company_id)
+    if settore:
+        stmt = stmt.where(S.settore == settore)
+    if dimensione:
+        stmt = stmt.where(S.dimensione == dimensione)
+    if status == "open":
+        stmt = stmt.where(S.data_chiusura.is_(None))
+    elif status == "closed":
+        stmt = stmt.where(S.data_chiusura.is_not(None))
+    if q:
+        stmt = stmt.where(S.azienda_nome.ilike(f"%{q}%"))
+    if cursor:
+        cursor_created, cursor_id = _decode_session_cursor(cursor)
+        stmt = stmt.where(tuple_(S.creato_il, S.id) < tuple_(cursor_created, cursor_id))
+
+    # Una riga in più per sapere se esiste la pagina successiva
+    stmt = stmt.order_by(S.creato_il.desc(), S.id.desc()).limit(limit + 1)
+    rows = (await db.execute(stmt)).scalars().all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = _encode_session_cursor(last.creato_il, last.id)
+
+    return {"items": rows, "next_cursor": next_cursor, "limit": limit}
+
 # 📋 Dettaglio singola sessione
 @api_router.get("/assessment/session/{session_id}", response_model=schemas.AssessmentSessionOut)
 def get_session(session_id: UUID, db: Session = Depends(get_db)):
-    session = db.query(models.AssessmentSession).filter(models.AssessmentSession.id == session_id).first()
+    session = db.query(models.AssessmentSession).options(
+        undefer_group("answers"), undefer_group("ai_text")
+    ).filter(models.AssessmentSession.id == session_id).first()
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     return session
@@ -105,24 +199,39 @@ def get_session(session_id: UUID, db: Session = Depends(get_db)):
 @api_router.post("/assessment/{session_id}/submit", response_model=dict)
 def submit(session_id: UUID, results: List[schemas.AssessmentResultCreate], db: Session = Depends(get_db)):
     # Verifica che la sessione esista
-    session = db.query(models.AssessmentSession).filter(models.AssessmentSession.id == session_id).first()
+    S = models.AssessmentSession
+    session = db.query(
+        S.id, S.data_chiusura, S.model_name, S.model_version
+    ).filter(S.id == session_id).first()
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     
     updated = 0
     created = 0
+    removed = 0
+    
+    # Id delle domande nel catalogo del modello e risposte già salvate, lette una volta sola
+    dimension_ids = answer_grid.cell_ids(
+        session.model_name, session.model_version,
+        [(r.process, r.activity, r.category, r.dimension) for r in results],
+    )
+    A = models.AssessmentAnswer
+    existing_rows = {row.dimension_id: row for row in db.query(A).filter(A.session_id == session_id)}
     
     for r in results:
-        # Cerca se esiste già un risultato per questa combinazione
-        existing = db.query(models.AssessmentResult).filter(
-            models.AssessmentResult.session_id == session_id,
-            models.AssessmentResult.process == r.process,
-            models.AssessmentResult.activity == r.activity,
-            models.AssessmentResult.category == r.category,
-            models.AssessmentResult.dimension == r.dimension
-        ).first()
+        key = dimension_ids[(r.process, r.activity, r.category, r.dimension)]
+        existing = existing_rows.get(key)
         
-        if existing:
+        if session_factory.SPARSE_ANSWERS and answer_grid.is_default(r.score, r.note, r.is_not_applicable):
+            # Cella vuota: non si salva, e se era salvata torna al default
+            if existing is not None:
+                if existing in db.new:
+                    db.expunge(existing)  # inserita poco sopra nella stessa richiesta
+                else:
+                    db.delete(existing)
+                del existing_rows[key]
+                removed += 1
+        elif existing:
             # UPDATE
             existing.score = r.score
             existing.note = r.note
@@ -130,44 +239,45 @@ def submit(session_id: UUID, results: List[schemas.AssessmentResultCreate], db:
             updated += 1
         else:
             # INSERT
-            db.add(models.AssessmentResult(session_id=session_id, **r.dict()))
+            existing_rows[key] = models.AssessmentAnswer(
+                session_id=session_id, dimension_id=key,
+                score=r.score, note=r.note, is_not_applicable=r.is_not_applicable,
+            )
+            db.add(existing_rows[key])
             created += 1
     
+    # Aggiorna lo snapshot punteggi JSONB nella stessa transazione
+    refresh_session_scores(db, session_id, commit=False)
+    if session.data_chiusura is not None:
+        portfolio.sync_session_rollup(db, session_id, commit=False)
     db.commit()
-    return {"status": "submitted", "created": created, "updated": updated, "total": len(results)}
+    return {"status": "submitted", "created": created, "updated": updated, "removed": removed, "total": len(results)}
 
 # 📊 Visualizza risultati sessione
 @api_router.get("/assessment/{session_id}/results", response_model=List[schemas.AssessmentResultOut])
-def results(session_id: UUID, db: Session = Depends(get_db)):
+async def results(session_id: UUID, db: AsyncSession = Depends(get_async_db)):
     """Restituisce i risultati ordinati secondo il modello JSON"""
     
-    # Ottieni risultati dal DB
-    results = db.query(models.AssessmentResult).filter(
-        models.AssessmentResult.session_id == session_id
-    ).all()
-    
-    # Ottieni il nome del modello dalla sessione
-    session = db.query(models.AssessmentSession).filter(
-        models.AssessmentSession.id == session_id
-    ).first()
+    # Ottieni il nome del modello dalla sessione (solo la colonna necessaria)
+    S = models.AssessmentSession
+    session = (await db.execute(
+        select(S.id, S.model_name, S.model_version).where(S.id == session_id)
+    )).first()
+    if not session:
+        return []
     
-    if not session or not results:
+    # Griglia completa: risposte salvate + celle vuote del modello
+    model_name = session.model_name or session_factory.DEFAULT_MODEL
+    results = await answer_grid.load_answers_async(db, session_id, model_name, session.model_version)
+    if not results:
         return results
     
-    model_name = session.model_name or 'casoin'
-    
-    # Carica il JSON del modello per ottenere l'ordine
+    # Carica il JSON del modello (versione della sessione) per ottenere l'ordine
     try:
-        import json
-        from pathlib import Path
-        
-        model_path = Path(f"frontend/public/{model_name}.json")
-        if not model_path.exists():
+        model_data = await run_in_threadpool(model_versions.session_model, model_name, session.model_version)
+        if model_data is None:
             return results  # Se il modello non esiste, restituisci senza ordinare
         
-        with open(model_path, 'r', encoding='utf-8') as f:
-            model_data = json.load(f)
-        
         # Crea mappa di ordinamento: process -> category -> [activities in order]
         order_map = {}
         for proc in model_data:
@@ -226,10 +336,10 @@ def results(session_id: UUID, db: Session = Depends(get_db)):
         if scores:
             process_ratings[proc] = round(sum(scores) / len(scores), 2)
     
-    for result in results:
-        result.processRating = process_ratings.get(result.process, 0)
-
-    return results
+    return [
+        {**result._asdict(), "processRating": process_ratings.get(result.process, 0)}
+        for result in results
+    ]
 
 # 🗑️ Cancella assessment completo (sessione + risultati)
 @api_router.delete("/assessment/{session_id}")
@@ -246,16 +356,14 @@ def delete_assessment(session_id: UUID, db: Session = Depends(get_db)):
         if not session:
             raise HTTPException(status_code=404, detail="Assessment not found")
         
-        # Conta i risultati da cancellare
-        results_count = db.query(models.AssessmentResult).filter(
-            models.AssessmentResult.session_id == session_id
-        ).count()
-        
         # Cancella prima tutti i risultati associati
-        deleted_results = db.query(models.AssessmentResult).filter(
-            models.AssessmentResult.session_id == session_id
+        deleted_results = db.query(models.AssessmentAnswer).filter(
+            models.AssessmentAnswer.session_id == session_id
         ).delete()
         
+        # Toglie il contributo della sessione dai rollup di portafoglio
+        portfolio.remove_session_rollup(db, session_id)
+        
         # Poi cancella la sessione
         db.delete(session)
         db.commit()
@@ -281,26 +389,27 @@ app.include_router(auth_routes.router, prefix="/api/auth", tags=["auth"])
 app.include_router(admin.router, prefix="/api/admin", tags=["admin"])
 app.include_router(assessment_update.router, prefix="/api", tags=["assessment"])
 app.include_router(excel_export.router, prefix="/api/excel", tags=["excel"])
+app.include_router(analytics.router, prefix="/api/analytics", tags=["analytics"])
 
 @app.put("/api/assessment/{session_id}/save-ai-conclusions")
-async def save_ai_conclusions(session_id: str, conclusions: dict, db: Session = Depends(get_db)):
+async def save_ai_conclusions(session_id: UUID, conclusions: dict, db: AsyncSession = Depends(get_async_db)):
     """Salva le conclusioni AI nel database"""
     try:
-        session = db.query(models.AssessmentSession).filter(
-            models.AssessmentSession.id == session_id
-        ).first()
+        session = (await db.execute(
+            select(models.AssessmentSession).where(models.AssessmentSession.id == session_id)
+        )).scalars().first()
         
         if not session:
             raise HTTPException(status_code=404, detail="Session not found")
         
         # Salva nel campo raccomandazioni
         session.raccomandazioni = conclusions.get('text', '')
-        db.commit()
+        await db.commit()
         
         return {"message": "Conclusioni salvate con successo"}
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
 
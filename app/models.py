@@ -1,6 +1,6 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Text, DateTime, Boolean
-from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.orm import declarative_base, relationship
+from sqlalchemy import Column, Integer, SmallInteger, String, ForeignKey, Text, DateTime, Boolean, Float, LargeBinary, UniqueConstraint
+from sqlalchemy.dialects.postgresql import UUID, JSON, JSONB
+from sqlalchemy.orm import declarative_base, relationship, deferred
 from datetime import datetime
 import uuid
 
@@ -28,25 +28,153 @@ class AssessmentSession(Base):
     effettuato_da = Column(Text, nullable=True)  # Chi esegue l'assessment
     email = Column(Text, nullable=True)
     model_name = Column(Text, nullable=True, default='i40_assessment_fto')  # Nome del modello JSON usato
-    risposte_json = Column(Text, nullable=True)
-    punteggi_json = Column(Text, nullable=True)
-    raccomandazioni = Column(Text, nullable=True)
-    pareto_recommendations = Column(Text, nullable=True)  # Raccomandazioni basate su Pareto
+    model_version = Column(Text, ForeignKey("model_version.id"), nullable=True)  # Versione del modello (NULL: file corrente)
+    # Colonne testuali pesanti: caricate solo su richiesta (undefer / undefer_group)
+    risposte_json = deferred(Column(JSONB, nullable=True), group="answers")
+    punteggi_json = deferred(Column(JSONB, nullable=True), group="answers")  # Snapshot punteggi (services/session_scores.py)
+    raccomandazioni = deferred(Column(Text, nullable=True), group="ai_text")
+    pareto_recommendations = deferred(Column(Text, nullable=True), group="ai_text")  # Raccomandazioni basate su Pareto
     creato_il = Column(DateTime, default=datetime.now, nullable=False)
     data_chiusura = Column(DateTime, nullable=True)  # Data di completamento assessment
     logo_path = Column(Text, nullable=True)  # Percorso file logo azienda
 
-    results = relationship("AssessmentResult", backref="session")
+    # assessment_result è una vista (migrations/005): relazione in sola lettura
+    results = relationship("AssessmentResult", backref="session", viewonly=True)
+
+class ModelVersion(Base):
+    """Versione immutabile di un modello: id = SHA-256 di nome + JSON canonico (services/model_versions.py)"""
+    __tablename__ = "model_version"
+
+    id = Column(Text, primary_key=True)
+    model_name = Column(Text, nullable=False)
+    content = deferred(Column(JSON, nullable=True))  # versioni precedenti a migrations/007
+    base_id = Column(Text, ForeignKey("model_version.id"), nullable=True)  # NULL: keyframe
+    depth = Column(SmallInteger, nullable=False, default=0)  # differenze fino al keyframe
+    payload = deferred(Column(LargeBinary, nullable=True))  # testo o differenza, compressi (zlib)
+    size = Column(Integer, nullable=False)          # JSON canonico
+    stored_size = Column(Integer, nullable=False)   # byte salvati
+    created_at = Column(DateTime, default=datetime.now, nullable=False)
+
+class ModelDimension(Base):
+    """Catalogo delle domande di un modello: una riga per processo/attività/dominio/domanda"""
+    __tablename__ = "model_dimension"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    model_name = Column(Text, nullable=False)
+    ordinal = Column(Integer, nullable=False, default=0)  # posizione nel modello
+    process = Column(Text, nullable=False)
+    activity = Column(Text, nullable=False)
+    category = Column(Text, nullable=False)
+    dimension = Column(Text, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("model_name", "process", "activity", "category", "dimension", name="uq_model_dimension_cell"),
+    )
+
+class AssessmentAnswer(Base):
+    """Risposta salvata di una sessione (solo le celle risposte, vedi services/answer_grid.py)"""
+    __tablename__ = "assessment_answer"
+
+    session_id = Column(UUID(as_uuid=True), ForeignKey("assessment_session.id", ondelete="CASCADE"), primary_key=True)
+    dimension_id = Column(Integer, ForeignKey("model_dimension.id"), primary_key=True)
+    score = Column(SmallInteger, nullable=False, default=0)
+    is_not_applicable = Column(Boolean, default=False, nullable=False)
+    note = Column(Text, nullable=True)
 
 class AssessmentResult(Base):
+    """
+    Vista di compatibilità (migrations/005): le risposte con le colonne
+    testuali di un tempo. In sola lettura, si scrive su AssessmentAnswer.
+    """
     __tablename__ = "assessment_result"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True)
     session_id = Column(UUID(as_uuid=True), ForeignKey("assessment_session.id"), nullable=False)
     process = Column(String, nullable=False)
     activity = Column(String, nullable=False)
     category = Column(String, nullable=False)
     dimension = Column(String, nullable=False)
-    score = Column(Integer, nullable=False, default=0)  # Default 0, accetta 0-5
+    score = Column(Integer, nullable=False, default=0)
     note = Column(Text, nullable=True)
-    is_not_applicable = Column(Boolean, default=False, nullable=False)  # ✅ NUOVO CAMPO
+    is_not_applicable = Column(Boolean, default=False, nullable=False)
+    dimension_id = Column(Integer, nullable=False)
+
+class PortfolioRollup(Base):
+    """Statistiche precalcolate per gruppo di sessioni chiuse (settore, dimensione, modello)"""
+    __tablename__ = "portfolio_rollup"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    group_type = Column(String, nullable=False)   # all | settore | dimensione | model_name
+    group_value = Column(String, nullable=False, default="")
+    process = Column(String, nullable=False, default="")    # "" = tutti i processi
+    category = Column(String, nullable=False, default="")   # "" = tutti i domini
+    n = Column(Integer, nullable=False, default=0)
+    score_sum = Column(Float, nullable=False, default=0.0)
+    score_sum_sq = Column(Float, nullable=False, default=0.0)
+    histogram = Column(JSONB, nullable=False)  # conteggi per bin di ampiezza fissa su 0-5
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("group_type", "group_value", "process", "category", name="uq_portfolio_rollup_key"),
+    )
+
+class PortfolioMember(Base):
+    """Contributo di una sessione chiusa ai rollup (serve a sottrarlo se riaperta o modificata)"""
+    __tablename__ = "portfolio_member"
+
+    session_id = Column(UUID(as_uuid=True), ForeignKey("assessment_session.id", ondelete="CASCADE"), primary_key=True)
+    groups = Column(JSONB, nullable=False)    # [[group_type, group_value], ...]
+    snapshot = Column(JSONB, nullable=False)  # punteggi_json al momento dell'inclusione
+    added_at = Column(DateTime, default=datetime.now, nullable=False)
+
+class MaturityClustering(Base):
+    """Clustering dei profili processo × dominio di un modello (services/maturity_clusters.py)"""
+    __tablename__ = "maturity_clustering"
+
+    model_name = Column(Text, primary_key=True)
+    columns = Column(JSONB, nullable=False)   # [[process, category], ...]
+    k = Column(SmallInteger, nullable=False)
+    sessions = Column(Integer, nullable=False)  # sessioni nell'ultima ricostruzione completa
+    inertia = Column(Float, nullable=True)
+    built_at = Column(DateTime, default=datetime.now, nullable=False)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now, nullable=False)
+
+class MaturityCluster(Base):
+    """Centroide di un cluster (0 = profilo meno maturo) con le raccomandazioni del cluster"""
+    __tablename__ = "maturity_cluster"
+
+    model_name = Column(Text, ForeignKey("maturity_clustering.model_name", ondelete="CASCADE"), primary_key=True)
+    cluster = Column(SmallInteger, primary_key=True)
+    centroid = Column(JSONB, nullable=False)  # nell'ordine di MaturityClustering.columns
+    size = Column(Integer, nullable=False, default=0)
+    recommendations = deferred(Column(Text, nullable=True))
+    recommendations_at = Column(DateTime, nullable=True)
+
+class SessionCluster(Base):
+    """Cluster assegnato a una sessione"""
+    __tablename__ = "session_cluster"
+
+    session_id = Column(UUID(as_uuid=True), ForeignKey("assessment_session.id", ondelete="CASCADE"), primary_key=True)
+    model_name = Column(Text, nullable=False)
+    cluster = Column(SmallInteger, nullable=False)
+    distance = Column(Float, nullable=False)
+    assigned_at = Column(DateTime, default=datetime.now, nullable=False)
+
+class RecommendationEntry(Base):
+    """Testo della libreria di raccomandazioni (services/recommendation_library.py); "" = qualsiasi"""
+    __tablename__ = "recommendation_entry"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    process = Column(Text, nullable=False, default="")
+    category = Column(Text, nullable=False, default="")
+    dimension = Column(Text, nullable=False, default="")
+    band = Column(SmallInteger, nullable=False)   # 0 critico, 1 debole, 2 in sviluppo, 3 avanzato
+    settore = Column(Text, nullable=False, default="")  # minuscolo
+    title = Column(Text, nullable=False)
+    body = Column(Text, nullable=False)  # markdown
+    priority = Column(SmallInteger, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("process", "category", "dimension", "band", "settore", name="uq_recommendation_entry_key"),
+    )
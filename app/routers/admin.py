@@ -1,180 +1,107 @@
 import os
+import re
+from typing import List, Optional
 from pydantic import BaseModel
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response
 from sqlalchemy.orm import Session
 from app import database
-from app.services.excel_parser import ExcelAssessmentParser
-import shutil
-import json
+from app.services import model_catalog, model_history, model_migration, model_store, model_upload, model_versions
+from app.services.model_upload import convert_parser_to_frontend_format  # noqa: F401 (compatibilità)
 from pathlib import Path
-from datetime import datetime
 
 router = APIRouter()
 
-
-def convert_parser_to_frontend_format(parsed_data: dict) -> list:
-    """
-    Converte il formato del parser Excel nel formato atteso dal frontend
-    
-    Parser format:
-    {
-      "questions": {"Governance": [...], ...},
-      "processes": [{"name": "...", "categories": {"Governance": [scores]}}]
-    }
-    
-    Frontend format:
-    [
-      {
-        "process": "PROCESSO",
-        "activities": [
-          {
-            "name": "activity",
-            "categories": {
-              "Governance": {"domanda1": score1, ...}
-            }
-          }
-        ]
-      }
-    ]
-    """
-    frontend_data = []
-    questions = parsed_data.get("questions", {})
-    processes_raw = parsed_data.get("processes", [])
-    
-    # Raggruppa per processo
-    processes_dict = {}
-    for proc in processes_raw:
-        proc_name_parts = proc["name"].split("::")
-        if len(proc_name_parts) == 2:
-            process, activity = proc_name_parts
-        else:
-            # Se non ha ::, usa il primo processo come default
-            process = "GENERALE"
-            activity = proc["name"]
-        
-        if process not in processes_dict:
-            processes_dict[process] = []
-        
-        # Converti categories da array a dict domanda->valore
-        activity_data = {
-            "name": activity,
-            "categories": {}
-        }
-        
-        for cat_name, scores in proc["categories"].items():
-            if cat_name in questions:
-                cat_questions = questions[cat_name]
-                activity_data["categories"][cat_name] = {}
-                
-                for i, score in enumerate(scores):
-                    if i < len(cat_questions) and score is not None:
-                        question = cat_questions[i]
-                        if question != "note":  # Salta colonne note
-                            activity_data["categories"][cat_name][question] = float(score)
-        
-        processes_dict[process].append(activity_data)
-    
-    # Converti in formato finale
-    for process, activities in processes_dict.items():
-        frontend_data.append({
-            "process": process,
-            "activities": activities
-        })
-    
-    return frontend_data
+# Nomi modello usati come nomi file: niente separatori di percorso
+MODEL_NAME_PATTERN = re.compile(r"^[\w\-. ]+$")
 
 
 @router.post("/upload-excel-model")
 async def upload_excel_model(
-    file: UploadFile = File(...),
+    request: Request,
+    background_tasks: BackgroundTasks,
     model_name: str = None,
-    db: Session = Depends(database.get_db)
 ):
     """
-    Carica un file Excel e genera un nuovo modello JSON
+    Carica un file Excel (campo multipart "file") e genera un nuovo modello JSON
+    
+    L'upload è ricevuto in streaming con un limite di dimensione
+    (model_upload.receive_upload), il parsing gira in un thread e il JSON è
+    scritto una volta, in modo atomico. Oltre MODEL_UPLOAD_ASYNC_BYTES l'import
+    prosegue in background e la risposta (202) contiene il job_id da
+    interrogare su /upload-jobs/{job_id}.
     """
+    file = None
     try:
+        # Riceve il file: 413 appena si supera il limite, senza leggere il resto
+        file = await model_upload.receive_upload(request)
+        
         # Verifica estensione file
-        if not file.filename.endswith(('.xlsx', '.xls')):
+        if not file.filename or not file.filename.endswith(('.xlsx', '.xls')):
             raise HTTPException(status_code=400, detail="File deve essere Excel (.xlsx o .xls)")
         
         # Nome modello (default: nome file senza estensione)
         if not model_name:
             model_name = Path(file.filename).stem
+        if not MODEL_NAME_PATTERN.match(model_name):
+            raise HTTPException(status_code=400, detail=f"Nome modello non valido: {model_name}")
         
-        # Salva file temporaneamente
-        temp_path = f"/tmp/{file.filename}"
-        with open(temp_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        # Parse Excel
-        parser = ExcelAssessmentParser()
-        parsed_data = parser.parse_excel_file(temp_path)
-        
-        # Valida dati
-        is_valid, errors = parser.validate_parsed_data(parsed_data)
-        if not is_valid:
-            raise HTTPException(status_code=400, detail=f"Excel non valido: {', '.join(errors)}")
-        
-        # Salva JSON in frontend/public
-        json_filename = f"{model_name}.json"
-        json_path = Path("frontend/public") / json_filename
-        
-        # Converti nel formato frontend
-        frontend_data = convert_parser_to_frontend_format(parsed_data)
-        
-        with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(frontend_data, f, ensure_ascii=False, indent=2)
+        # Dimensione esatta del file (il limite sul corpo include il multipart)
+        size = file.size if file.size is not None else model_upload.upload_size(file.file)
+        if size > model_upload.MAX_UPLOAD_SIZE:
+            raise model_upload.UploadTooLarge(size)
         
-        # Copia anche in frontend/dist per nginx
-        dist_path = Path("frontend/dist") / json_filename
-        if dist_path.parent.exists():
-            with open(dist_path, 'w', encoding='utf-8') as dist_f:
-                json.dump(frontend_data, dist_f, ensure_ascii=False, indent=2)
-            print(f"✅ Copiato anche in: {dist_path}")
-        
-        # Rimuovi file temporaneo
-        Path(temp_path).unlink()
+        # Workbook grandi: import in background, il file dell'upload viene chiuso a fine richiesta
+        if size > model_upload.ASYNC_UPLOAD_SIZE:
+            spool = await run_in_threadpool(model_upload.spool_copy, file.file)
+            job = model_upload.create_job(model_name, file.filename, size)
+            background_tasks.add_task(model_upload.run_job, job["job_id"], spool, file.filename, model_name)
+            return JSONResponse(status_code=202, content={
+                "success": True,
+                "message": f"Import del modello '{model_name}' avviato",
+                "job_id": job["job_id"],
+                "status": job["status"]
+            })
         
+        result = await run_in_threadpool(model_upload.import_workbook, file.file, file.filename, model_name)
         return JSONResponse({
             "success": True,
             "message": f"Modello '{model_name}' creato con successo",
-            "json_file": json_filename,
-            "stats": {
-                "processes": len(parsed_data.get("processes", [])),
-                "dimensions": len(parsed_data.get("dimensions", [])),
-                "questions_total": sum(len(q) for q in parsed_data.get("questions", {}).values())
-            }
+            **result
         })
         
     except HTTPException:
         raise
+    except model_upload.UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except model_upload.ModelImportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Errore: {str(e)}")
+    finally:
+        if file is not None:
+            await file.close()
+
+
+@router.get("/upload-jobs/{job_id}")
+async def upload_job_status(job_id: str):
+    """Stato di un import in background (queued, running, done, error)"""
+    job = model_upload.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job non trovato")
+    return job
 
 @router.get("/list-models")
 async def list_models():
-    """Lista tutti i modelli JSON disponibili"""
+    """
+    Lista tutti i modelli JSON disponibili
+    
+    I dati (dimensione, mtime, conteggi, hash) vengono dal catalogo in
+    app/services/model_catalog.py: si rileggono solo i modelli cambiati.
+    """
     try:
-        public_path = Path("frontend/public")
-        json_files = list(public_path.glob("*.json"))
-        
-        models = []
-        for json_file in json_files:
-            try:
-                with open(json_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    models.append({
-                        "name": json_file.stem,
-                        "filename": json_file.name,
-                        "processes_count": len(data.get("processes", [])) if isinstance(data, dict) else 0,
-                        "is_default": json_file.stem == "i40_assessment_fto"
-                    })
-            except Exception as e:
-                print(f"Errore lettura {json_file.name}: {e}")
-                continue
-        
+        models = await run_in_threadpool(model_catalog.list_models)
         return {"models": models}
         
     except Exception as e:
@@ -192,42 +119,31 @@ async def save_model(request: SaveModelRequest):
     """
     try:
         # Valida il filename
-        if not request.filename or not request.filename.endswith('.json'):
-            filename = f"{request.filename}.json"
+        filename = request.filename
+        if not filename or not filename.endswith('.json'):
+            filename = f"{filename}.json"
         
         # Path dove salvare
         models_dir = Path("frontend/public")
         models_dir.mkdir(parents=True, exist_ok=True)
         
         target_file = models_dir / filename
+        # Il nome finisce in model_version e nei percorsi di cache: niente separatori di percorso
+        if not MODEL_NAME_PATTERN.match(filename[:-len(".json")]):
+            raise HTTPException(status_code=400, detail=f"Nome modello non valido: {filename}")
         
-        # Se esiste già, crea backup
+        # Se esiste già, il contenuto attuale resta nello storico (model_version, a differenze)
+        previous = None
         if target_file.exists():
-            backup_dir = Path("backups/models")
-            backup_dir.mkdir(parents=True, exist_ok=True)
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            backup_file = backup_dir / f"{target_file.stem}_{timestamp}.json"
-            shutil.copy2(target_file, backup_file)
-        
-        # Salva il nuovo modello
-        with open(target_file, 'w', encoding='utf-8') as f:
-            json.dump(request.model_data, f, indent=2, ensure_ascii=False)
+            previous = await run_in_threadpool(model_versions.current_version, target_file.stem)
         
-        # Copia anche in frontend/dist per nginx
-        dist_dir = Path("frontend/dist")
-        if dist_dir.exists():
-            dist_file = dist_dir / filename
-            with open(dist_file, 'w', encoding='utf-8') as dist_f:
-                json.dump(request.model_data, dist_f, indent=2, ensure_ascii=False)
-            os.chmod(dist_file, 0o644)
-            try:
-                os.chown(dist_file, uid, gid)
-            except:
-                pass
-            print(f"✅ Modello copiato anche in dist: {dist_file}")
+        # Salva il nuovo modello (public e dist, atomico, permessi 644, cache invalidate,
+        # versione pubblicata in model_version): in un thread, i listener di
+        # on_model_change scrivono sul database con il motore sync
+        await run_in_threadpool(model_store.write_model, target_file.stem, request.model_data)
+        version = await run_in_threadpool(model_versions.current_version, target_file.stem)
         
-        # Imposta permessi corretti (644) e proprietario (ubuntu:www-data)
-        os.chmod(target_file, 0o644)
+        # Proprietario (ubuntu:www-data)
         try:
             import pwd, grp
             uid = pwd.getpwnam("ubuntu").pw_uid
@@ -240,8 +156,116 @@ async def save_model(request: SaveModelRequest):
             "success": True,
             "message": f"Modello '{filename}' salvato con successo",
             "filename": filename,
-            "path": str(target_file)
+            "path": str(target_file),
+            "version": version,
+            "previous_version": previous
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Errore salvataggio: {str(e)}")
+
+
+@router.get("/model-versions/{model_name}")
+def list_model_versions(model_name: str, db: Session = Depends(database.get_db)):
+    """Versioni pubblicate di un modello (dalla più recente) con il numero di sessioni legate a ciascuna"""
+    if not MODEL_NAME_PATTERN.match(model_name):
+        raise HTTPException(status_code=400, detail=f"Nome modello non valido: {model_name}")
+    return {"model_name": model_name, "versions": model_versions.list_versions(db, model_name)}
+
+
+def _load_model_version(model_name: str, version: str) -> list:
+    if model_versions.version_model_name(version) != model_name:
+        raise HTTPException(status_code=404, detail=f"Versione {version[:12]} di {model_name} non trovata")
+    return model_versions.load_version(version)
+
+
+@router.get("/model-versions/{model_name}/{version}")
+def get_model_version(model_name: str, version: str):
+    """Contenuto di una versione: immutabile, cacheabile senza scadenza"""
+    model_data = _load_model_version(model_name, version)
+    return Response(
+        content=model_versions.canonical_bytes(model_data),
+        media_type="application/json",
+        headers={"ETag": f'"{version}"', "Cache-Control": "public, max-age=31536000, immutable"},
+    )
+
+
+@router.get("/model-versions/{model_name}/{version}/diff")
+def diff_model_version(model_name: str, version: str, against: Optional[str] = None):
+    """Domande aggiunte/tolte/modificate da `against` (default: la versione precedente) a `version`"""
+    new = _load_model_version(model_name, version)
+    if against is None:
+        against = model_versions.previous_version(version)
+        if against is None:
+            raise HTTPException(status_code=404, detail="Nessuna versione precedente")
+    old = _load_model_version(model_name, against)
+    return {"from": against, "to": version, **model_history.diff_models(old, new)}
+
+
+@router.post("/model-versions/{model_name}/{version}/restore")
+def restore_model_version(model_name: str, version: str):
+    """Riporta il file del modello a una versione dello storico (nessuna nuova versione: il contenuto esiste già)"""
+    model_data = _load_model_version(model_name, version)
+    previous = model_versions.current_version(model_name)
+    model_store.write_model(model_name, model_data)
+    return {
+        "success": True,
+        "model_name": model_name,
+        "version": model_versions.current_version(model_name),
+        "previous_version": previous,
+    }
+
+
+class CellRef(BaseModel):
+    process: str
+    activity: str
+    category: str
+    dimension: str
+
+    def cell(self):
+        return (self.process, self.activity, self.category, self.dimension)
+
+
+class CellRename(BaseModel):
+    old: CellRef
+    new: CellRef
+
+
+class MigrateModelRequest(BaseModel):
+    from_version: Optional[str] = None
+    to_version: Optional[str] = None
+    renames: List[CellRename] = []
+    include_unversioned: bool = False
+    drop_removed: bool = False
+    dry_run: bool = True
+    batch_size: int = model_migration.BATCH_SIZE
+
+
+@router.post("/model-versions/{model_name}/migrate")
+def migrate_model_sessions(model_name: str, request: MigrateModelRequest, db: Session = Depends(database.get_db)):
+    """
+    Porta le sessioni create su versioni precedenti del modello alla versione
+    indicata (default: corrente), rimappando le risposte alle domande rinominate.
+    Con dry_run (default) restituisce solo mappatura e conteggi.
+    """
+    try:
+        return model_migration.migrate_model(
+            db, model_name,
+            to_version=request.to_version,
+            from_version=request.from_version,
+            renames={r.old.cell(): r.new.cell() for r in request.renames},
+            include_unversioned=request.include_unversioned,
+            drop_removed=request.drop_removed,
+            dry_run=request.dry_run,
+            batch_size=max(1, request.batch_size),
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/db-pool-stats")
+async def db_pool_stats():
+    """Statistiche del pool di connessioni al database (checked-out, overflow, tempi di attesa)"""
+    return database.get_pool_stats()
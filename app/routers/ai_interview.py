@@ -46,7 +46,7 @@ async def analyze_interview(
     """Analizza la trascrizione e genera risposte per l'assessment"""
     
     # Carica il modello di assessment
-    session = db.query(models.AssessmentSession).filter(
+    session = db.query(models.AssessmentSession.model_name).filter(
         models.AssessmentSession.id == session_id
     ).first()
     
@@ -0,0 +1,202 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session, load_only
+from uuid import UUID
+from typing import Optional
+from datetime import date
+from app import database, models, schemas
+from app.services import session_scores, portfolio, benchmark, results_export, similar_companies
+
+router = APIRouter()
+
+GROUP_BY_COLUMNS = ("settore", "dimensione", "model_name")
+
+
+def _session_filters(settore: Optional[str], dimensione: Optional[str], model_name: Optional[str], closed_only: bool):
+    S = models.AssessmentSession
+    filters = []
+    if settore:
+        filters.append(S.settore == settore)
+    if dimensione:
+        filters.append(S.dimensione == dimensione)
+    if model_name:
+        filters.append(S.model_name == model_name)
+    if closed_only:
+        filters.append(S.data_chiusura.is_not(None))
+    return filters
+
+
+@router.get("/sessions")
+def sessions_by_score(
+    category: Optional[str] = None,
+    process: Optional[str] = None,
+    op: str = Query("lt", pattern="^(lt|lte|gt|gte|eq)$"),
+    value: Optional[float] = None,
+    settore: Optional[str] = None,
+    dimensione: Optional[str] = None,
+    model_name: Optional[str] = None,
+    closed_only: bool = False,
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(database.get_db)
+):
+    """
+    Sessioni filtrate sui punteggi salvati in JSONB, es.
+    /analytics/sessions?category=Technology&op=lt&value=2
+    """
+    S = models.AssessmentSession
+    if process and category:
+        score_expr = session_scores.process_category_score_expr(process, category)
+    elif category:
+        score_expr = session_scores.category_score_expr(category)
+    elif process:
+        score_expr = session_scores.process_score_expr(process)
+    else:
+        score_expr = session_scores.overall_score_expr()
+
+    query = db.query(S, score_expr.label("score")).options(load_only(
+        S.id, S.azienda_nome, S.settore, S.dimensione, S.model_name, S.creato_il, S.data_chiusura
+    ))
+    for f in _session_filters(settore, dimensione, model_name, closed_only):
+        query = query.filter(f)
+    if value is not None:
+        query = query.filter(session_scores.score_filter(score_expr, op, value))
+    else:
+        query = query.filter(score_expr.is_not(None))
+
+    rows = query.order_by(score_expr.asc(), S.id).limit(limit).all()
+    return {
+        "filter": {"category": category, "process": process, "op": op, "value": value},
+        "count": len(rows),
+        "sessions": [
+            {
+                **schemas.AssessmentSessionSummary.model_validate(s).model_dump(mode="json"),
+                "score": round(score, 2) if score is not None else None,
+            }
+            for s, score in rows
+        ],
+    }
+
+
+@router.get("/category-averages")
+def category_averages(
+    group_by: Optional[str] = None,
+    settore: Optional[str] = None,
+    dimensione: Optional[str] = None,
+    model_name: Optional[str] = None,
+    closed_only: bool = False,
+    db: Session = Depends(database.get_db)
+):
+    """Media per dominio su tutte le sessioni (opzionalmente per settore/dimensione/modello)"""
+    if group_by and group_by not in GROUP_BY_COLUMNS:
+        raise HTTPException(status_code=400, detail=f"group_by deve essere uno tra: {', '.join(GROUP_BY_COLUMNS)}")
+    return {
+        "group_by": group_by,
+        "groups": session_scores.aggregate_category_scores(
+            db, group_by, _session_filters(settore, dimensione, model_name, closed_only)
+        ),
+    }
+
+
+@router.post("/sessions/{session_id}/refresh-scores")
+def refresh_scores(session_id: UUID, db: Session = Depends(database.get_db)):
+    """Ricalcola lo snapshot punteggi JSONB di una sessione"""
+    exists = db.query(models.AssessmentSession.id).filter(models.AssessmentSession.id == session_id).first()
+    if not exists:
+        raise HTTPException(status_code=404, detail="Sessione non trovata")
+    punteggi = session_scores.refresh_session_scores(db, session_id, commit=False)
+    in_portfolio = portfolio.sync_session_rollup(db, session_id, commit=False)
+    db.commit()
+    return {"session_id": str(session_id), "punteggi": punteggi, "in_portfolio": in_portfolio}
+
+
+@router.get("/sessions/{session_id}/benchmark")
+def session_benchmark(session_id: UUID, db: Session = Depends(database.get_db)):
+    """Percentile della sessione per processo e dominio rispetto ai pari (settore/dimensione)"""
+    result = benchmark.session_benchmark(db, session_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Sessione non trovata")
+    return result
+
+
+@router.get("/sessions/{session_id}/similar")
+def similar_sessions(
+    session_id: UUID,
+    k: int = Query(similar_companies.DEFAULT_K, ge=1, le=similar_companies.MAX_K),
+    metric: str = Query("euclidean", pattern="^(euclidean|cosine)$"),
+    settore: Optional[str] = None,
+    dimensione: Optional[str] = None,
+    db: Session = Depends(database.get_db)
+):
+    """Sessioni chiuse di altre aziende con il profilo processo × dominio più simile"""
+    result = similar_companies.similar_sessions(db, session_id, k, metric, settore, dimensione)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Sessione non trovata")
+    return result
+
+
+# ============================================================================
+# PORTAFOGLIO - rollup precalcolati sulle sessioni chiuse
+# ============================================================================
+
+@router.get("/portfolio")
+def portfolio_groups(db: Session = Depends(database.get_db)):
+    """Gruppi di portafoglio disponibili (settore, dimensione, modello) con numero di sessioni chiuse"""
+    return {"groups": portfolio.list_groups(db)}
+
+
+@router.get("/portfolio/rollup")
+def portfolio_rollup(
+    group_type: str = Query("all", pattern="^(all|settore|dimensione|model_name|peer)$"),
+    group_value: Optional[str] = None,
+    db: Session = Depends(database.get_db)
+):
+    """
+    Media, deviazione standard, percentili e distribuzione per processo × dominio, es.
+    /analytics/portfolio/rollup?group_type=settore&group_value=Automotive
+    (per group_type=peer il valore è "settore|dimensione")
+    """
+    if group_type != "all" and not group_value:
+        raise HTTPException(status_code=400, detail="group_value obbligatorio per questo group_type")
+    rollup = portfolio.get_rollup(db, group_type, group_value if group_type != "all" else "")
+    if rollup is None:
+        raise HTTPException(status_code=404, detail="Nessuna sessione chiusa per questo gruppo")
+    return rollup
+
+
+@router.post("/portfolio/rebuild")
+def portfolio_rebuild(db: Session = Depends(database.get_db)):
+    """Ricostruisce da zero i rollup (allineamento dati storici)"""
+    return portfolio.rebuild_rollups(db)
+
+
+# ============================================================================
+# EXPORT RISPOSTE GREZZE
+# ============================================================================
+
+@router.get("/export/results")
+def export_results(
+    format: str = Query("csv", pattern="^(csv|parquet)$"),
+    model_name: Optional[str] = None,
+    settore: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    closed_only: bool = False,
+):
+    """
+    Export in streaming di tutte le risposte (una riga per domanda) delle sessioni filtrate.
+    Memoria costante: cursore lato server e scrittura a blocchi.
+    """
+    if format == "parquet" and not results_export.parquet_available():
+        raise HTTPException(status_code=501, detail="Export Parquet non disponibile: installare pyarrow")
+    filters = {
+        "model_name": model_name, "settore": settore,
+        "date_from": date_from, "date_to": date_to,
+        "closed_only": closed_only,
+    }
+    media_type = "text/csv; charset=utf-8" if format == "csv" else "application/vnd.apache.parquet"
+    filename = f"assessment_results_{date.today().isoformat()}.{format}"
+    return StreamingResponse(
+        results_export.iter_export(format, filters),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
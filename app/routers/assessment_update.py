@@ -4,6 +4,7 @@ from uuid import UUID
 from pydantic import BaseModel
 from typing import Optional
 from app import database, models
+from app.services import portfolio
 
 router = APIRouter()
 
@@ -30,6 +31,8 @@ def update_session(
     if not session:
         raise HTTPException(status_code=404, detail="Sessione non trovata")
     
+    previous = (session.data_chiusura, session.settore, session.dimensione)
+    
     # Aggiorna solo i campi forniti
     if data.azienda_nome is not None:
         session.azienda_nome = data.azienda_nome
@@ -53,6 +56,13 @@ def update_session(
         else:
             session.data_chiusura = data.data_chiusura
     
+    # Chiusura/riapertura o cambio di gruppo di una sessione chiusa: aggiorna i rollup
+    if previous != (session.data_chiusura, session.settore, session.dimensione) and (
+        previous[0] is not None or session.data_chiusura is not None
+    ):
+        db.flush()
+        portfolio.sync_session_rollup(db, session_id, commit=False)
+    
     db.commit()
     db.refresh(session)
     
@@ -71,6 +81,9 @@ def update_session(
 
 
 from fastapi import UploadFile, File
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 import os
 import uuid
 from pathlib import Path
@@ -79,14 +92,14 @@ from pathlib import Path
 async def upload_logo(
     session_id: UUID,
     file: UploadFile = File(...),
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_async_db)
 ):
     """Upload logo aziendale per l'assessment"""
     
     # Verifica che la sessione esista
-    session = db.query(models.AssessmentSession).filter(
-        models.AssessmentSession.id == session_id
-    ).first()
+    session = (await db.execute(
+        select(models.AssessmentSession).where(models.AssessmentSession.id == session_id)
+    )).scalars().first()
     
     if not session:
         raise HTTPException(status_code=404, detail="Sessione non trovata")
@@ -112,8 +125,7 @@ async def upload_logo(
     # Salva file
     try:
         contents = await file.read()
-        with open(file_path, "wb") as f:
-            f.write(contents)
+        await run_in_threadpool(file_path.write_bytes, contents)
         
         # Cancella vecchio logo se esiste
         if session.logo_path:
@@ -123,7 +135,7 @@ async def upload_logo(
         
         # Aggiorna database con path relativo
         session.logo_path = f"/uploads/logos/{unique_filename}"
-        db.commit()
+        await db.commit()
         
         return {
             "success": True,
@@ -138,13 +150,13 @@ async def upload_logo(
 @router.delete("/assessment/session/{session_id}/logo")
 async def delete_logo(
     session_id: UUID,
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_async_db)
 ):
     """Elimina il logo aziendale"""
     
-    session = db.query(models.AssessmentSession).filter(
-        models.AssessmentSession.id == session_id
-    ).first()
+    session = (await db.execute(
+        select(models.AssessmentSession).where(models.AssessmentSession.id == session_id)
+    )).scalars().first()
     
     if not session:
         raise HTTPException(status_code=404, detail="Sessione non trovata")
@@ -155,6 +167,6 @@ async def delete_logo(
             logo_path.unlink()
         
         session.logo_path = None
-        db.commit()
+        await db.commit()
     
     return {"success": True, "message": "Logo eliminato"}
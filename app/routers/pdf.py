@@ -1,22 +1,44 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from app.database import get_db
-from app.models import AssessmentSession, AssessmentResult, LocalUser
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from sqlalchemy.orm import undefer_group
+from uuid import UUID
+from app.database import SessionLocal, get_async_db
+from app.models import AssessmentSession, LocalUser
 from app.services.pdf_generator import PDFReportGenerator
+from app.services import answer_grid, session_comparison
+from app.services.benchmark import session_benchmark
 import io
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 router = APIRouter()
 
+
+def _compare_sessions(baseline_id: UUID, current_id: UUID) -> Dict:
+    """Confronto in un thread con una sessione sync: template e piano di migrazione non girano sul loop"""
+    db = SessionLocal()
+    try:
+        return session_comparison.compare_sessions(db, baseline_id, current_id)
+    finally:
+        db.close()
+
+
 @router.get("/assessment/{session_id}/pdf")
-async def generate_pdf_report(session_id: str, db: Session = Depends(get_db)):
+async def generate_pdf_report(
+    session_id: UUID,
+    compare_with: Optional[UUID] = Query(None),
+    compare_previous: bool = Query(False),
+    db: AsyncSession = Depends(get_async_db)
+):
     """
     Genera e restituisce il report PDF per una sessione di assessment
     
     Args:
         session_id: ID della sessione di assessment
+        compare_with: sessione con cui confrontarla (pagina Confronto)
+        compare_previous: confronta con l'assessment precedente della stessa azienda
         db: Sessione database
         
     Returns:
@@ -26,15 +48,19 @@ async def generate_pdf_report(session_id: str, db: Session = Depends(get_db)):
         HTTPException: 404 se sessione o risultati non trovati
     """
     
-    # Recupera dati sessione
-    session = db.query(AssessmentSession).filter(AssessmentSession.id == session_id).first()
+    # Recupera dati sessione (incluse raccomandazioni AI, servono nel report)
+    session = (await db.execute(
+        select(AssessmentSession)
+        .options(undefer_group("ai_text"))
+        .where(AssessmentSession.id == session_id)
+    )).scalars().first()
     if not session:
         raise HTTPException(status_code=404, detail="Sessione di assessment non trovata")
     
-    # Recupera risultati
-    results = db.query(AssessmentResult).filter(
-        AssessmentResult.session_id == session_id
-    ).all()
+    # Recupera risultati (griglia completa: risposte salvate + celle vuote del modello)
+    results = await answer_grid.load_answers_async(
+        db, session_id, session.model_name or "i40_assessment_fto", session.model_version
+    )
     
     if not results:
         raise HTTPException(status_code=404, detail="Nessun risultato trovato per questa sessione")
@@ -43,7 +69,9 @@ async def generate_pdf_report(session_id: str, db: Session = Depends(get_db)):
     # Recupera nome utente che ha creato l'assessment
     user_name = "N/A"
     if session.user_id:
-        user = db.query(LocalUser).filter(LocalUser.id == session.user_id).first()
+        user = (await db.execute(
+            select(LocalUser).where(LocalUser.id == session.user_id)
+        )).scalars().first()
         if user:
             user_name = user.email
     
@@ -76,21 +104,38 @@ async def generate_pdf_report(session_id: str, db: Session = Depends(get_db)):
         })
     
     # Calcola statistiche dettagliate
-    stats_data = await calculate_pdf_stats(session_id, db)
-    stats_data["session_id"] = session_id
+    stats_data = await calculate_pdf_stats(session_id, db, results)
+    stats_data["session_id"] = str(session_id)
     
     
     # Calcola dati radar per processi (per grafico globale con 4 dimensioni)
-    processes_radar = await calculate_processes_radar(session_id, db)
+    processes_radar = await calculate_processes_radar(session_id, db, results)
     stats_data["processes_radar"] = processes_radar
     
+    # Percentili rispetto ai pari (pagina benchmark, se ci sono abbastanza sessioni chiuse)
+    stats_data["benchmark"] = await db.run_sync(session_benchmark, session_id)
+
+    # Variazioni rispetto a un assessment precedente (pagina Confronto, solo se richiesta)
+    if compare_with is None and compare_previous:
+        compare_with = await db.run_sync(session_comparison.previous_session_id, session_id)
+    if compare_with is not None:
+        try:
+            comparison = await run_in_threadpool(_compare_sessions, compare_with, session_id)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if comparison is None:
+            raise HTTPException(status_code=404, detail="Sessione di confronto non trovata")
+        stats_data["comparison"] = comparison
+    
     
     # Recupera conclusioni AI dalla sessione già caricata
     ai_conclusions = session.raccomandazioni if session.raccomandazioni else None
     try:
-        # Genera PDF
+        # Genera PDF (CPU-bound: fuori dall'event loop)
         pdf_generator = PDFReportGenerator()
-        pdf_bytes = pdf_generator.generate_assessment_report(session_data, results_data, stats_data, ai_conclusions)
+        pdf_bytes = await run_in_threadpool(
+            pdf_generator.generate_assessment_report, session_data, results_data, stats_data, ai_conclusions
+        )
         
         # Prepara nome file pulito
         clean_company_name = session.azienda_nome.replace(' ', '_').replace('/', '_') if session.azienda_nome else 'Assessment'
@@ -98,7 +143,7 @@ async def generate_pdf_report(session_id: str, db: Session = Depends(get_db)):
         import re
         clean_company_name = re.sub(r'[^\w\-_]', '', clean_company_name)
         
-        filename = f"Assessment_Report_{clean_company_name}_{session_id[:8]}.pdf"
+        filename = f"Assessment_Report_{clean_company_name}_{str(session_id)[:8]}.pdf"
         
         # Restituisci PDF come streaming response
         return StreamingResponse(
@@ -114,7 +159,7 @@ async def generate_pdf_report(session_id: str, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Errore nella generazione del PDF: {str(e)}")
 
 
-async def calculate_pdf_stats(session_id: str, db: Session) -> Dict:
+async def calculate_pdf_stats(session_id: UUID, db: AsyncSession, answers: Optional[List] = None) -> Dict:
     """
     Calcola statistiche dettagliate per il PDF
     Riusa e ottimizza la logica esistente da radar.py
@@ -122,27 +167,23 @@ async def calculate_pdf_stats(session_id: str, db: Session) -> Dict:
     Args:
         session_id: ID della sessione
         db: Sessione database
+        answers: griglia risposte già caricata (answer_grid), altrimenti letta qui
         
     Returns:
         Dict: Statistiche complete per il PDF
     """
     
-    # Query base per i risultati della sessione
-    base_query = db.query(AssessmentResult).filter(
-        AssessmentResult.session_id == session_id
-    )
-    
-    # Statistiche generali
-    total_questions = base_query.count()
-    applicable_results = base_query.filter(AssessmentResult.is_not_applicable == False)
-    applicable_questions = applicable_results.count()
+    # Statistiche generali sulla griglia completa: conteggi e medie in Python
+    if answers is None:
+        answers = await answer_grid.load_answers_async(db, session_id)
+    total_questions = len(answers)
+    process_groups = answer_grid.applicable(answers)
+    applicable_questions = len(process_groups)
     not_applicable_questions = total_questions - applicable_questions
     
     # Calcola media generale (solo domande applicabili)
     if applicable_questions > 0:
-        overall_average = applicable_results.with_entities(
-            func.avg(AssessmentResult.score)
-        ).scalar() or 0.0
+        overall_average = float(sum(r.score for r in process_groups)) / applicable_questions
     else:
         overall_average = 0.0
     
@@ -150,7 +191,6 @@ async def calculate_pdf_stats(session_id: str, db: Session) -> Dict:
     processes_stats = {}
     
     # Raggruppa per processo
-    process_groups = applicable_results.all()
     processes_dict = {}
     
     for result in process_groups:
@@ -218,7 +258,7 @@ async def calculate_pdf_stats(session_id: str, db: Session) -> Dict:
 
 
 @router.get("/assessment/{session_id}/pdf-preview")
-async def get_pdf_stats_preview(session_id: str, db: Session = Depends(get_db)):
+async def get_pdf_stats_preview(session_id: UUID, db: AsyncSession = Depends(get_async_db)):
     """
     Endpoint per preview delle statistiche che saranno incluse nel PDF
     Utile per debugging e verifica dati prima della generazione
@@ -232,21 +272,23 @@ async def get_pdf_stats_preview(session_id: str, db: Session = Depends(get_db)):
     """
     
     # Verifica che la sessione esista
-    session = db.query(AssessmentSession).filter(AssessmentSession.id == session_id).first()
+    session = (await db.execute(
+        select(AssessmentSession).where(AssessmentSession.id == session_id)
+    )).scalars().first()
     if not session:
         raise HTTPException(status_code=404, detail="Sessione non trovata")
     
     # Verifica che ci siano risultati
-    results_count = db.query(AssessmentResult).filter(
-        AssessmentResult.session_id == session_id
-    ).count()
+    answers = await answer_grid.load_answers_async(
+        db, session_id, session.model_name or "i40_assessment_fto", session.model_version
+    )
     
-    if results_count == 0:
+    if not answers:
         raise HTTPException(status_code=404, detail="Nessun risultato trovato")
     
     # Calcola e restituisci statistiche
-    stats_data = await calculate_pdf_stats(session_id, db)
-    stats_data["session_id"] = session_id
+    stats_data = await calculate_pdf_stats(session_id, db, answers)
+    stats_data["session_id"] = str(session_id)
     
     # Aggiungi metadati sessione
     stats_data["session_info"] = {
@@ -260,32 +302,26 @@ async def get_pdf_stats_preview(session_id: str, db: Session = Depends(get_db)):
     
     return {
         "message": "Preview statistiche PDF",
-        "session_id": session_id,
+        "session_id": str(session_id),
         "ready_for_pdf": True,
         "stats": stats_data
     }
 
 
-async def calculate_processes_radar(session_id: str, db: Session) -> List[Dict]:
+async def calculate_processes_radar(session_id: UUID, db: AsyncSession, answers: Optional[List] = None) -> List[Dict]:
     """
     Calcola i dati radar per ogni processo con le 4 dimensioni
     (Governance, Monitoring & Control, Technology, Organization)
     Usa la logica "media delle medie delle righe" come nel frontend
     """
     
-    # Query per ottenere TUTTI i risultati grezzi
-    results = (
-        db.query(
-            AssessmentResult.process,
-            AssessmentResult.category,
-            AssessmentResult.activity,
-            AssessmentResult.dimension,
-            AssessmentResult.score,
-            AssessmentResult.is_not_applicable
-        )
-        .filter(AssessmentResult.session_id == session_id)
-        .all()
-    )
+    # TUTTI i risultati (griglia completa, celle non risposte incluse)
+    if answers is None:
+        answers = await answer_grid.load_answers_async(db, session_id)
+    results = [
+        (a.process, a.category, a.activity, a.dimension, a.score, a.is_not_applicable)
+        for a in answers
+    ]
     
     if not results:
         return []
@@ -2,11 +2,13 @@
 from app.ai_recommendations import get_ai_recommendations_advanced, get_sector_insights
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import StreamingResponse, Response
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy.orm import Session, undefer
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
 from uuid import UUID
-from app.database import get_db
+from app.database import get_db, get_async_db
 from app import database, models
+from app.services import answer_grid, portfolio, benchmark, recommendation_library, similar_companies
 from dotenv import load_dotenv
 from urllib.parse import unquote
 from datetime import datetime
@@ -35,23 +37,17 @@ router = APIRouter()
 # ============================================================================
 
 @router.get("/assessment/{session_id}/processes-radar")
-def processes_radar_data(session_id: UUID, db: Session = Depends(database.get_db)):
+async def processes_radar_data(session_id: UUID, db: AsyncSession = Depends(get_async_db)):
     """Restituisce i dati radar separati per ogni processo - ESCLUDE NON APPLICABILI"""
     try:
         print(f"🎯 DEBUG: processes_radar_data per sessione {session_id}")
         
-        # ✅ QUERY AGGIORNATA - ESCLUDE is_not_applicable = True
-        results = (
-            db.query(
-                models.AssessmentResult.process,
-                models.AssessmentResult.category,
-                func.avg(models.AssessmentResult.score).label("avg_score")
-            )
-            .filter(models.AssessmentResult.session_id == session_id)
-            .filter(models.AssessmentResult.is_not_applicable.is_(False))  # ✅ FILTRO CHIAVE
-            .group_by(models.AssessmentResult.process, models.AssessmentResult.category)
-            .all()
-        )
+        # ✅ MEDIE SOLO SULLE RISPOSTE APPLICABILI (griglia completa, vedi answer_grid)
+        answers = await answer_grid.load_answers_async(db, session_id)
+        results = [
+            (process, category, avg_score)
+            for (process, category), avg_score in answer_grid.average_by(answers, "process", "category").items()
+        ]
 
         print(f"🔍 DEBUG: Trovati {len(results) if results else 0} risultati applicabili")
 
@@ -136,22 +132,14 @@ def processes_radar_data(session_id: UUID, db: Session = Depends(database.get_db
         raise HTTPException(status_code=500, detail=f"Errore nel calcolo dei dati radar per processo: {str(e)}")
 
 @router.get("/assessment/{session_id}/radar")
-def radar_data(session_id: UUID, db: Session = Depends(database.get_db)):
+async def radar_data(session_id: UUID, db: AsyncSession = Depends(get_async_db)):
     """Restituisce i dati aggregati per il radar chart - ESCLUDE NON APPLICABILI"""
     try:
         print(f"🎯 DEBUG: radar_data per sessione {session_id}")
         
-        # ✅ QUERY AGGIORNATA - ESCLUDE is_not_applicable = True
-        results = (
-            db.query(
-                models.AssessmentResult.process,
-                func.avg(models.AssessmentResult.score).label("avg_score")
-            )
-            .filter(models.AssessmentResult.session_id == session_id)
-            .filter(models.AssessmentResult.is_not_applicable.is_(False))  # ✅ FILTRO CHIAVE
-            .group_by(models.AssessmentResult.process)
-            .all()
-        )
+        # ✅ MEDIE SOLO SULLE RISPOSTE APPLICABILI (griglia completa, vedi answer_grid)
+        answers = await answer_grid.load_answers_async(db, session_id)
+        results = list(answer_grid.average_by(answers, "process").items())
 
         print(f"🔍 DEBUG: radar_data trovati {len(results) if results else 0} processi applicabili")
 
@@ -204,17 +192,9 @@ def radar_image(session_id: UUID, db: Session = Depends(database.get_db)):
     try:
         print(f"🎯 RADAR IMAGE: Inizio generazione radar classico per sessione {session_id}")
         
-        # ✅ QUERY AGGIORNATA - ESCLUDE is_not_applicable = True
-        results = (
-            db.query(
-                models.AssessmentResult.process,
-                func.avg(models.AssessmentResult.score).label("avg_score")
-            )
-            .filter(models.AssessmentResult.session_id == session_id)
-            .filter(models.AssessmentResult.is_not_applicable.is_(False))  # ✅ FILTRO CHIAVE
-            .group_by(models.AssessmentResult.process)
-            .all()
-        )
+        # ✅ MEDIE SOLO SULLE RISPOSTE APPLICABILI (griglia completa, vedi answer_grid)
+        answers = answer_grid.load_answers(db, session_id)
+        results = list(answer_grid.average_by(answers, "process").items())
 
         print(f"🔍 RADAR IMAGE: Trovati {len(results) if results else 0} processi applicabili")
         
@@ -245,17 +225,9 @@ def summary_radar_svg(session_id: UUID, db: Session = Depends(database.get_db)):
     try:
         print(f"🎯 SVG RADAR: Generando per sessione {session_id}")
         
-        # ✅ QUERY AGGIORNATA - ESCLUDE is_not_applicable = True
-        results = (
-            db.query(
-                models.AssessmentResult.process,
-                func.avg(models.AssessmentResult.score).label("avg_score")
-            )
-            .filter(models.AssessmentResult.session_id == session_id)
-            .filter(models.AssessmentResult.is_not_applicable.is_(False))  # ✅ FILTRO CHIAVE
-            .group_by(models.AssessmentResult.process)
-            .all()
-        )
+        # ✅ MEDIE SOLO SULLE RISPOSTE APPLICABILI (griglia completa, vedi answer_grid)
+        answers = answer_grid.load_answers(db, session_id)
+        results = list(answer_grid.average_by(answers, "process").items())
 
         print(f"🔍 SVG RADAR: Trovati {len(results) if results else 0} processi applicabili")
 
@@ -289,18 +261,9 @@ def process_radar_svg_fixed(session_id: UUID, process_name: str, db: Session = D
     try:
         print(f"🎯 [FIXED] Generando radar SVG per processo: {process_name}")
         
-        # ✅ QUERY AGGIORNATA - ESCLUDE is_not_applicable = True
-        results = (
-            db.query(
-                models.AssessmentResult.category,
-                func.avg(models.AssessmentResult.score).label("avg_score")
-            )
-            .filter(models.AssessmentResult.session_id == session_id)
-            .filter(models.AssessmentResult.process == process_name)
-            .filter(models.AssessmentResult.is_not_applicable.is_(False))  # ✅ FILTRO CHIAVE
-            .group_by(models.AssessmentResult.category)
-            .all()
-        )
+        # ✅ MEDIE SOLO SULLE RISPOSTE APPLICABILI (griglia completa, vedi answer_grid)
+        answers = [a for a in answer_grid.load_answers(db, session_id) if a.process == process_name]
+        results = list(answer_grid.average_by(answers, "category").items())
 
         if not results:
             print(f"❌ [FIXED] Nessun risultato applicabile per processo {process_name}")
@@ -344,18 +307,9 @@ def process_radar_image_fixed(session_id: UUID, process_name: str, db: Session =
     try:
         print(f"🎯 [FIXED] Generando radar matplotlib per processo: {process_name}")
         
-        # ✅ QUERY AGGIORNATA - ESCLUDE is_not_applicable = True
-        results = (
-            db.query(
-                models.AssessmentResult.category,
-                func.avg(models.AssessmentResult.score).label("avg_score")
-            )
-            .filter(models.AssessmentResult.session_id == session_id)
-            .filter(models.AssessmentResult.process == process_name)
-            .filter(models.AssessmentResult.is_not_applicable.is_(False))  # ✅ FILTRO CHIAVE
-            .group_by(models.AssessmentResult.category)
-            .all()
-        )
+        # ✅ MEDIE SOLO SULLE RISPOSTE APPLICABILI (griglia completa, vedi answer_grid)
+        answers = [a for a in answer_grid.load_answers(db, session_id) if a.process == process_name]
+        results = list(answer_grid.average_by(answers, "category").items())
 
         if not results:
             raise HTTPException(status_code=404, detail=f"No applicable results found for process {process_name}")
@@ -440,18 +394,9 @@ def process_radar_svg_legacy(session_id: UUID, process_name: str, db: Session =
         print(f"🔍 [LEGACY] Process decodificato: {decoded_process_name}")
         print(f"🎯 [LEGACY] Generando radar SVG per processo: {decoded_process_name}")
         
-        # ✅ QUERY AGGIORNATA - ESCLUDE is_not_applicable = True
-        results = (
-            db.query(
-                models.AssessmentResult.category,
-                func.avg(models.AssessmentResult.score).label("avg_score")
-            )
-            .filter(models.AssessmentResult.session_id == session_id)
-            .filter(models.AssessmentResult.process == decoded_process_name)
-            .filter(models.AssessmentResult.is_not_applicable.is_(False))  # ✅ FILTRO CHIAVE
-            .group_by(models.AssessmentResult.category)
-            .all()
-        )
+        # ✅ MEDIE SOLO SULLE RISPOSTE APPLICABILI (griglia completa, vedi answer_grid)
+        answers = [a for a in answer_grid.load_answers(db, session_id) if a.process == decoded_process_name]
+        results = list(answer_grid.average_by(answers, "category").items())
 
         if not results:
             print(f"❌ [LEGACY] Nessun risultato applicabile per processo {decoded_process_name}")
@@ -501,18 +446,9 @@ def process_radar_image_legacy(session_id: UUID, process_name: str, db: Session
         print(f"🔍 [LEGACY] Process decodificato: {decoded_process_name}")
         print(f"🎯 [LEGACY] Generando radar matplotlib per processo: {decoded_process_name}")
         
-        # ✅ QUERY AGGIORNATA - ESCLUDE is_not_applicable = True
-        results = (
-            db.query(
-                models.AssessmentResult.category,
-                func.avg(models.AssessmentResult.score).label("avg_score")
-            )
-            .filter(models.AssessmentResult.session_id == session_id)
-            .filter(models.AssessmentResult.process == decoded_process_name)
-            .filter(models.AssessmentResult.is_not_applicable.is_(False))  # ✅ FILTRO CHIAVE
-            .group_by(models.AssessmentResult.category)
-            .all()
-        )
+        # ✅ MEDIE SOLO SULLE RISPOSTE APPLICABILI (griglia completa, vedi answer_grid)
+        answers = [a for a in answer_grid.load_answers(db, session_id) if a.process == decoded_process_name]
+        results = list(answer_grid.average_by(answers, "category").items())
 
         if not results:
             raise HTTPException(status_code=404, detail=f"No applicable results found for process {decoded_process_name}. Try using query parameter: ?process_name={decoded_process_name}")
@@ -583,32 +519,19 @@ def detailed_stats(session_id: UUID, db: Session = Depends(database.get_db)):
     try:
         print(f"📊 DETAILED STATS: Iniziando per sessione {session_id}")
         
-        # Conta totali
-        total_results = db.query(models.AssessmentResult).filter(
-            models.AssessmentResult.session_id == session_id
-        ).count()
-        
-        applicable_results = db.query(models.AssessmentResult).filter(
-            models.AssessmentResult.session_id == session_id,
-            models.AssessmentResult.is_not_applicable.is_(False)
-        ).count()
-        
-        not_applicable_results = db.query(models.AssessmentResult).filter(
-            models.AssessmentResult.session_id == session_id,
-            models.AssessmentResult.is_not_applicable.is_(True)
-        ).count()
+        # Conta totali sulla griglia completa (celle non risposte incluse)
+        answers = answer_grid.load_answers(db, session_id)
+        total_results = len(answers)
+        applicable_results = len(answer_grid.applicable(answers))
+        not_applicable_results = total_results - applicable_results
         
         print(f"📊 TOTALI: {total_results} totali, {applicable_results} applicabili, {not_applicable_results} non applicabili")
         
         # Distribuzione per processo
-        process_stats = db.query(
-            models.AssessmentResult.process,
-            func.count(func.case([(models.AssessmentResult.is_not_applicable.is_(False), 1)])).label("applicable_count"),
-            func.count(func.case([(models.AssessmentResult.is_not_applicable.is_(True), 1)])).label("not_applicable_count"),
-            func.avg(func.case([(models.AssessmentResult.is_not_applicable.is_(False), models.AssessmentResult.score)])).label("avg_score")
-        ).filter(
-            models.AssessmentResult.session_id == session_id
-        ).group_by(models.AssessmentResult.process).all()
+        process_stats = [
+            (process, stats.applicable, stats.not_applicable, stats.average)
+            for process, stats in answer_grid.group_stats(answers, "process").items()
+        ]
         
         print(f"📊 PROCESSI: Analizzati {len(process_stats)} processi")
         
@@ -637,17 +560,34 @@ def detailed_stats(session_id: UUID, db: Session = Depends(database.get_db)):
         print(f"❌ Traceback: {traceback.format_exc()}")
         raise HTTPException(status_code=500, detail=f"Errore statistiche: {str(e)}")
 
+def _library_suggestions(db: Session, session, results, critical_count: int, **extra) -> Dict:
+    """Suggerimenti dalla libreria di raccomandazioni precalcolate (services/recommendation_library.py)"""
+    report = recommendation_library.build_report(
+        db, results,
+        session.settore if session else None,
+        session.azienda_nome if session else None,
+    )
+    return {
+        "critical_count": critical_count,
+        "suggestions": report["content"],
+        "enhanced_mode": False,
+        "source": "library",
+        "enrich_available": bool(openai.api_key),
+        **extra
+    }
+
 @router.get("/assessment/{session_id}/ai-suggestions-enhanced")
-def ai_suggestions_enhanced(session_id: UUID, include_roadmap: bool = False, regenerate: bool = False, db: Session = Depends(database.get_db)):
-    """Versione migliorata dell'endpoint ai-suggestions originale"""
+def ai_suggestions_enhanced(session_id: UUID, include_roadmap: bool = False, regenerate: bool = False, enrich: bool = False, db: Session = Depends(database.get_db)):
+    """
+    Versione migliorata dell'endpoint ai-suggestions originale.
+    Di default il testo viene dalla libreria precalcolata (istantaneo, non
+    salvato); con enrich=true lo genera OpenAI e lo salva nella sessione.
+    """
     try:
         print(f"🤖 AI SUGGESTIONS ENHANCED: Per sessione {session_id}")
         
         # Carica risultati applicabili (come versione originale)
-        results = db.query(models.AssessmentResult).filter(
-            models.AssessmentResult.session_id == session_id,
-            models.AssessmentResult.is_not_applicable.is_(False)
-        ).all()
+        results = answer_grid.applicable(answer_grid.load_answers(db, session_id))
 
         if not results:
             raise HTTPException(status_code=404, detail="No applicable assessment results found")
@@ -673,7 +613,9 @@ def ai_suggestions_enhanced(session_id: UUID, include_roadmap: bool = False, reg
             }
 
         # Carica la sessione
-        session = db.query(models.AssessmentSession).filter(
+        session = db.query(models.AssessmentSession).options(
+            undefer(models.AssessmentSession.raccomandazioni)
+        ).filter(
             models.AssessmentSession.id == session_id
         ).first()
         
@@ -693,24 +635,32 @@ def ai_suggestions_enhanced(session_id: UUID, include_roadmap: bool = False, reg
                 session_data = {
                     "azienda_nome": session.azienda_nome,
                     "settore": session.settore,
-                    "dimensione": session.dimensione
+                    "dimensione": session.dimensione,
+                    "peer_benchmark": portfolio.sector_benchmark(db, session.settore),
+                    # Aziende simili solo per il prompt AI: il report della libreria non le usa
+                    "similar_companies": (
+                        similar_companies.prompt_neighbours(db, session_id, session.settore)
+                        if enrich and openai.api_key else []
+                    )
                 }
                 
-                # Usa il modulo AI avanzato
+                # Usa il modulo AI avanzato (testo dalla libreria se non è richiesto l'arricchimento)
                 advanced_recommendations = get_ai_recommendations_advanced(
-                    str(session_id), results, session_data
+                    str(session_id), results, session_data, use_ai=enrich, db=db
                 )
                 
-                # Salva le raccomandazioni nel database
+                # Salva nel database solo il testo generato dall'AI
                 ai_content = advanced_recommendations["ai_recommendations"]["content"]
-                session.raccomandazioni = ai_content
-                db.commit()
-                print(f"💾 Raccomandazioni AI salvate per sessione {session_id}")
+                if advanced_recommendations["ai_powered"]:
+                    session.raccomandazioni = ai_content
+                    db.commit()
+                    print(f"💾 Raccomandazioni AI salvate per sessione {session_id}")
                 
                 return {
                     "critical_count": len(critical_areas),
                     "suggestions": ai_content,
                     "enhanced_mode": True,
+                    "source": "ai" if advanced_recommendations["ai_powered"] else "library",
                     "roadmap_included": True,
                     "priority_matrix": advanced_recommendations["priority_matrix"],
                     "roi_predictions": advanced_recommendations["roi_predictions"]
@@ -719,13 +669,9 @@ def ai_suggestions_enhanced(session_id: UUID, include_roadmap: bool = False, reg
         except Exception as e:
             print(f"⚠️ Fallback to basic AI: {e}")
         
-        # Fallback alla versione originale migliorata
-        if not openai.api_key:
-            return {
-                "critical_count": len(critical_areas),
-                "suggestions": "⚠️ API OpenAI non configurata. Configurare OPENAI_API_KEY per suggerimenti personalizzati.",
-                "enhanced_available": False
-            }
+        # Percorso di default, e senza OpenAI: libreria di raccomandazioni precalcolate
+        if not enrich or not openai.api_key:
+            return _library_suggestions(db, session, results, len(critical_areas))
 
         # Prompt migliorato rispetto all'originale
         prompt = f"""Sei un esperto di trasformazione digitale per aziende italiane.
@@ -768,11 +714,7 @@ Rispondi in italiano, tono professionale ma accessibile."""
             
         except Exception as e:
             print(f"❌ Errore OpenAI enhanced: {e}")
-            return {
-                "critical_count": len(critical_areas),
-                "suggestions": f"⚠️ Errore generazione AI: {str(e)}\n\n{len(critical_areas)} aree critiche identificate necessitano attenzione.",
-                "enhanced_available": False
-            }
+            return _library_suggestions(db, session, results, len(critical_areas), enrich_error=str(e))
             
     except Exception as e:
         print(f"❌ Errore ai_suggestions_enhanced: {e}")
@@ -787,21 +729,18 @@ print("   - /smart-recommendations")
 print("   - /enhanced-summary")
 
 @router.get("/assessment/{session_id}/summary")
-def assessment_summary(session_id: UUID, db: Session = Depends(database.get_db)):
+async def assessment_summary(session_id: UUID, db: AsyncSession = Depends(get_async_db)):
     """Riepilogo completo assessment - ESCLUDE NON APPLICABILI DALLE MEDIE"""
     try:
         print(f"📋 SUMMARY: Iniziando per sessione {session_id}")
         
         # Totale domande (include anche non applicabili per statistica)
-        total_questions = db.query(models.AssessmentResult).filter(
-            models.AssessmentResult.session_id == session_id
-        ).count()
+        answers = await answer_grid.load_answers_async(db, session_id)
+        total_questions = len(answers)
         
         # ✅ CONTA SOLO QUELLE APPLICABILI
-        applicable_questions = db.query(models.AssessmentResult).filter(
-            models.AssessmentResult.session_id == session_id,
-            models.AssessmentResult.is_not_applicable.is_(False)
-        ).count()
+        applicable_answers = answer_grid.applicable(answers)
+        applicable_questions = len(applicable_answers)
         
         not_applicable_questions = total_questions - applicable_questions
         
@@ -811,29 +750,17 @@ def assessment_summary(session_id: UUID, db: Session = Depends(database.get_db))
             raise HTTPException(status_code=404, detail="No applicable assessment data found")
         
         # ✅ MEDIA SOLO SU QUELLE APPLICABILI
-        avg_score = db.query(func.avg(models.AssessmentResult.score)).filter(
-            models.AssessmentResult.session_id == session_id,
-            models.AssessmentResult.is_not_applicable.is_(False)
-        ).scalar()
+        avg_score = sum(a.score for a in applicable_answers) / applicable_questions
         
         # ✅ DISTRIBUZIONE SOLO SU QUELLE APPLICABILI
-        score_distribution = db.query(
-            models.AssessmentResult.score,
-            func.count(models.AssessmentResult.score).label('count')
-        ).filter(
-            models.AssessmentResult.session_id == session_id,
-            models.AssessmentResult.is_not_applicable.is_(False)
-        ).group_by(models.AssessmentResult.score).all()
+        score_distribution = answer_grid.score_distribution(answers)
         
         # ✅ PUNTEGGI PER PROCESSO SOLO SU QUELLE APPLICABILI
-        process_scores = db.query(
-            models.AssessmentResult.process,
-            func.avg(models.AssessmentResult.score).label("avg_score"),
-            func.count(models.AssessmentResult.score).label("applicable_count")
-        ).filter(
-            models.AssessmentResult.session_id == session_id,
-            models.AssessmentResult.is_not_applicable.is_(False)
-        ).group_by(models.AssessmentResult.process).all()
+        process_scores = [
+            (process, stats.average, stats.applicable)
+            for process, stats in answer_grid.group_stats(answers, "process").items()
+            if stats.applicable
+        ]
         
         print(f"📋 SUMMARY: Media generale applicabili: {avg_score:.2f}")
         
@@ -961,21 +888,13 @@ def test_radar_debug(session_id: UUID, db: Session = Depends(database.get_db)):
     try:
         print(f"🔍 DEBUG TEST: Iniziando per sessione {session_id}")
         
-        # Test 1: Verifica connessione DB
-        total_results = db.query(models.AssessmentResult).filter(
-            models.AssessmentResult.session_id == session_id
-        ).count()
+        # Test 1: Verifica connessione DB (griglia completa)
+        answers = answer_grid.load_answers(db, session_id)
+        total_results = len(answers)
         
         # ✅ CONTA APPLICABILI E NON APPLICABILI
-        applicable_results = db.query(models.AssessmentResult).filter(
-            models.AssessmentResult.session_id == session_id,
-            models.AssessmentResult.is_not_applicable.is_(False)
-        ).count()
-        
-        not_applicable_results = db.query(models.AssessmentResult).filter(
-            models.AssessmentResult.session_id == session_id,
-            models.AssessmentResult.is_not_applicable.is_(True)
-        ).count()
+        applicable_results = len(answer_grid.applicable(answers))
+        not_applicable_results = total_results - applicable_results
         
         print(f"📊 DEBUG TEST: Totale risultati DB: {total_results} (applicabili: {applicable_results}, non applicabili: {not_applicable_results})")
         
@@ -990,16 +909,7 @@ def test_radar_debug(session_id: UUID, db: Session = Depends(database.get_db)):
             }
         
         # Test 2: Query processi applicabili
-        results = (
-            db.query(
-                models.AssessmentResult.process,
-                func.avg(models.AssessmentResult.score).label("avg_score")
-            )
-            .filter(models.AssessmentResult.session_id == session_id)
-            .filter(models.AssessmentResult.is_not_applicable.is_(False))  # ✅ SOLO APPLICABILI
-            .group_by(models.AssessmentResult.process)
-            .all()
-        )
+        results = list(answer_grid.average_by(answers, "process").items())  # ✅ SOLO APPLICABILI
         
         print(f"📈 DEBUG TEST: Processi applicabili trovati: {len(results)}")
         
@@ -1054,13 +964,8 @@ def force_working_radar(session_id: UUID, db: Session = Depends(database.get_db)
         print(f"🎯 FORCE RADAR: Iniziando per {session_id}")
         
         # Prova dati applicabili
-        results = db.query(
-            models.AssessmentResult.process,
-            func.avg(models.AssessmentResult.score).label("avg_score")
-        ).filter(
-            models.AssessmentResult.session_id == session_id,
-            models.AssessmentResult.is_not_applicable.is_(False)  # ✅ SOLO APPLICABILI
-        ).group_by(models.AssessmentResult.process).all()
+        answers = answer_grid.load_answers(db, session_id)
+        results = list(answer_grid.average_by(answers, "process").items())  # ✅ SOLO APPLICABILI
         
         if results and len(results) > 0:
             # Usa dati applicabili
@@ -1507,27 +1412,10 @@ def create_error_summary_radar_svg():
 
 @router.get("/assessment/{session_id}/ai-recommendations-advanced")
 def ai_recommendations_advanced(session_id: UUID, db: Session = Depends(database.get_db)):
-    """Sistema di raccomandazioni AI avanzato - RICHIEDE OpenAI configurato"""
+    """Sistema di raccomandazioni AI avanzato (testo dalla libreria precalcolata se OpenAI non è configurato)"""
     try:
         print(f"🤖 AI ADVANCED: Iniziando per sessione {session_id}")
         
-        # ✅ CONTROLLO PRELIMINARE OpenAI
-        openai_key = os.getenv("OPENAI_API_KEY")
-        if not openai_key:
-            raise HTTPException(
-                status_code=503,
-                detail={
-                    "error": "AI_NOT_CONFIGURED",
-                    "message": "Sistema AI non configurato",
-                    "instructions": [
-                        "1. Aggiungere OPENAI_API_KEY al file .env",
-                        "2. Riavviare il server",
-                        "3. Verificare che la chiave API sia valida"
-                    ],
-                    "fallback_available": False
-                }
-            )
-        
         # Carica dati sessione
         session = db.query(models.AssessmentSession).filter(
             models.AssessmentSession.id == session_id
@@ -1537,10 +1425,7 @@ def ai_recommendations_advanced(session_id: UUID, db: Session = Depends(database
             raise HTTPException(status_code=404, detail="Session not found")
         
         # Carica risultati applicabili
-        results = db.query(models.AssessmentResult).filter(
-            models.AssessmentResult.session_id == session_id,
-            models.AssessmentResult.is_not_applicable.is_(False)
-        ).all()
+        results = answer_grid.applicable(answer_grid.load_answers(db, session_id))
         
         if not results:
             raise HTTPException(
@@ -1556,14 +1441,17 @@ def ai_recommendations_advanced(session_id: UUID, db: Session = Depends(database
             "settore": session.settore,
             "dimensione": session.dimensione,
             "referente": session.referente,
-            "email": session.email
+            "email": session.email,
+            "peer_benchmark": portfolio.sector_benchmark(db, session.settore),
+            "similar_companies": similar_companies.prompt_neighbours(db, session_id, session.settore)
         }
         
         # ✅ USA IL MODULO AI (può lanciare HTTPException se problemi)
         recommendations = get_ai_recommendations_advanced(
             str(session_id), 
             results, 
-            session_data
+            session_data,
+            db=db
         )
         
         print(f"✅ AI Analysis completata: {recommendations['ai_recommendations']['model_used']}")
@@ -1600,10 +1488,7 @@ def sector_insights_advanced(session_id: UUID, db: Session = Depends(database.ge
             raise HTTPException(status_code=404, detail="Session not found")
         
         # Carica risultati applicabili
-        results = db.query(models.AssessmentResult).filter(
-            models.AssessmentResult.session_id == session_id,
-            models.AssessmentResult.is_not_applicable.is_(False)
-        ).all()
+        results = answer_grid.applicable(answer_grid.load_answers(db, session_id))
         
         if not results:
             raise HTTPException(status_code=404, detail="No applicable results found")
@@ -1643,10 +1528,7 @@ def smart_recommendations_combined(session_id: UUID, include_insights: bool = Tr
         if not session:
             raise HTTPException(status_code=404, detail="Session not found")
         
-        results = db.query(models.AssessmentResult).filter(
-            models.AssessmentResult.session_id == session_id,
-            models.AssessmentResult.is_not_applicable.is_(False)
-        ).all()
+        results = answer_grid.applicable(answer_grid.load_answers(db, session_id))
         
         if not results:
             raise HTTPException(status_code=404, detail="No applicable results found")
@@ -1657,7 +1539,9 @@ def smart_recommendations_combined(session_id: UUID, include_insights: bool = Tr
             "settore": session.settore,
             "dimensione": session.dimensione,
             "referente": session.referente,
-            "email": session.email
+            "email": session.email,
+            "peer_benchmark": portfolio.sector_benchmark(db, session.settore),
+            "similar_companies": similar_companies.prompt_neighbours(db, session_id, session.settore)
         }
         
         company_context = {
@@ -1911,26 +1795,29 @@ def list_supported_sectors():
 # ============================================================================
 
 @router.get("/assessment/{session_id}/enhanced-summary")
-def enhanced_summary_with_ai(session_id: UUID, db: Session = Depends(database.get_db)):
+async def enhanced_summary_with_ai(session_id: UUID, db: AsyncSession = Depends(get_async_db)):
     """Summary potenziato con preview raccomandazioni AI"""
     try:
         print(f"📊 ENHANCED SUMMARY: Per sessione {session_id}")
         
         # Usa la funzione summary esistente come base
-        base_summary = assessment_summary(session_id, db)
+        base_summary = await assessment_summary(session_id, db)
         
         # Carica sessione per contesto AI
-        session = db.query(models.AssessmentSession).filter(
-            models.AssessmentSession.id == session_id
-        ).first()
+        session = (await db.execute(
+            select(models.AssessmentSession).where(models.AssessmentSession.id == session_id)
+        )).scalars().first()
         
         if session and base_summary.get("applicable_questions", 0) > 0:
             # Aggiungi preview AI se ci sono dati applicabili
             sector = session.settore if session.settore else "Generico"
             overall_score = base_summary["overall_score"]
             
+            # Percentili reali rispetto ai pari (rollup precalcolati)
+            peer_benchmark = await db.run_sync(benchmark.session_benchmark, session_id)
+            
             # Preview raccomandazioni senza chiamata completa AI
-            ai_preview = generate_quick_ai_preview(overall_score, sector, base_summary)
+            ai_preview = generate_quick_ai_preview(overall_score, sector, base_summary, peer_benchmark)
             
             # Arricchisci summary
             enhanced_summary = {
@@ -1952,9 +1839,9 @@ def enhanced_summary_with_ai(session_id: UUID, db: Session = Depends(database.ge
     except Exception as e:
         print(f"❌ Errore enhanced summary: {e}")
         # Fallback al summary base se AI non funziona
-        return assessment_summary(session_id, db)
+        return await assessment_summary(session_id, db)
 
-def generate_quick_ai_preview(overall_score: float, sector: str, summary_data: Dict) -> Dict:
+def generate_quick_ai_preview(overall_score: float, sector: str, summary_data: Dict, peer_benchmark: Optional[Dict] = None) -> Dict:
     """Genera preview veloce raccomandazioni senza OpenAI"""
     
     # Identifica focus settoriale
@@ -1991,13 +1878,27 @@ def generate_quick_ai_preview(overall_score: float, sector: str, summary_data: D
         priority_level = "🟢 BUONO - Ottimizzazioni incrementali"
         investment_range = "€8,000 - €20,000"
     
-    return {
+    preview = {
         "sector_focus": sector_focus,
         "priority_level": priority_level,
         "investment_estimate": investment_range,
         "confidence": "PREVIEW" if overall_score > 0 else "LOW",
         "full_analysis_available": True
     }
+    
+    # Posizionamento reale tra i pari, se ci sono abbastanza sessioni chiuse
+    if peer_benchmark and peer_benchmark.get("peer_group") and peer_benchmark.get("overall"):
+        by_category = peer_benchmark["by_category"]
+        ranked = [c for c in by_category if by_category[c]["percentile"] is not None]
+        preview["peer_benchmark"] = {
+            "peer_group": peer_benchmark["peer_group"],
+            "overall_percentile": peer_benchmark["overall"]["percentile"],
+            "peer_median": peer_benchmark["overall"]["peer_median"],
+            "weakest_domain_vs_peers": min(ranked, key=lambda c: by_category[c]["percentile"]) if ranked else None,
+            "strongest_domain_vs_peers": max(ranked, key=lambda c: by_category[c]["percentile"]) if ranked else None,
+        }
+    
+    return preview
 
 def get_suggested_next_steps(overall_score: float, sector: str) -> List[str]:
     """Suggerisce prossimi step basati su score e settore"""
@@ -2036,16 +1937,17 @@ def get_suggested_next_steps(overall_score: float, sector: str) -> List[str]:
 # Sostituisci l'endpoint ai-suggestions esistente con questa versione migliorata:
 
 @router.get("/assessment/{session_id}/ai-suggestions-enhanced")
-def ai_suggestions_enhanced(session_id: UUID, include_roadmap: bool = False, regenerate: bool = False, db: Session = Depends(database.get_db)):
-    """Versione migliorata dell'endpoint ai-suggestions originale"""
+def ai_suggestions_enhanced(session_id: UUID, include_roadmap: bool = False, regenerate: bool = False, enrich: bool = False, db: Session = Depends(database.get_db)):
+    """
+    Versione migliorata dell'endpoint ai-suggestions originale.
+    Di default il testo viene dalla libreria precalcolata (istantaneo, non
+    salvato); con enrich=true lo genera OpenAI e lo salva nella sessione.
+    """
     try:
         print(f"🤖 AI SUGGESTIONS ENHANCED: Per sessione {session_id}")
         
         # Carica risultati applicabili (come versione originale)
-        results = db.query(models.AssessmentResult).filter(
-            models.AssessmentResult.session_id == session_id,
-            models.AssessmentResult.is_not_applicable.is_(False)
-        ).all()
+        results = answer_grid.applicable(answer_grid.load_answers(db, session_id))
 
         if not results:
             raise HTTPException(status_code=404, detail="No applicable assessment results found")
@@ -2071,7 +1973,9 @@ def ai_suggestions_enhanced(session_id: UUID, include_roadmap: bool = False, reg
             }
 
         # Carica la sessione
-        session = db.query(models.AssessmentSession).filter(
+        session = db.query(models.AssessmentSession).options(
+            undefer(models.AssessmentSession.raccomandazioni)
+        ).filter(
             models.AssessmentSession.id == session_id
         ).first()
         
@@ -2091,24 +1995,32 @@ def ai_suggestions_enhanced(session_id: UUID, include_roadmap: bool = False, reg
                 session_data = {
                     "azienda_nome": session.azienda_nome,
                     "settore": session.settore,
-                    "dimensione": session.dimensione
+                    "dimensione": session.dimensione,
+                    "peer_benchmark": portfolio.sector_benchmark(db, session.settore),
+                    # Aziende simili solo per il prompt AI: il report della libreria non le usa
+                    "similar_companies": (
+                        similar_companies.prompt_neighbours(db, session_id, session.settore)
+                        if enrich and openai.api_key else []
+                    )
                 }
                 
-                # Usa il modulo AI avanzato
+                # Usa il modulo AI avanzato (testo dalla libreria se non è richiesto l'arricchimento)
                 advanced_recommendations = get_ai_recommendations_advanced(
-                    str(session_id), results, session_data
+                    str(session_id), results, session_data, use_ai=enrich, db=db
                 )
                 
-                # Salva le raccomandazioni nel database
+                # Salva nel database solo il testo generato dall'AI
                 ai_content = advanced_recommendations["ai_recommendations"]["content"]
-                session.raccomandazioni = ai_content
-                db.commit()
-                print(f"💾 Raccomandazioni AI salvate per sessione {session_id}")
+                if advanced_recommendations["ai_powered"]:
+                    session.raccomandazioni = ai_content
+                    db.commit()
+                    print(f"💾 Raccomandazioni AI salvate per sessione {session_id}")
                 
                 return {
                     "critical_count": len(critical_areas),
                     "suggestions": ai_content,
                     "enhanced_mode": True,
+                    "source": "ai" if advanced_recommendations["ai_powered"] else "library",
                     "roadmap_included": True,
                     "priority_matrix": advanced_recommendations["priority_matrix"],
                     "roi_predictions": advanced_recommendations["roi_predictions"]
@@ -2117,13 +2029,9 @@ def ai_suggestions_enhanced(session_id: UUID, include_roadmap: bool = False, reg
         except Exception as e:
             print(f"⚠️ Fallback to basic AI: {e}")
         
-        # Fallback alla versione originale migliorata
-        if not openai.api_key:
-            return {
-                "critical_count": len(critical_areas),
-                "suggestions": "⚠️ API OpenAI non configurata. Configurare OPENAI_API_KEY per suggerimenti personalizzati.",
-                "enhanced_available": False
-            }
+        # Percorso di default, e senza OpenAI: libreria di raccomandazioni precalcolate
+        if not enrich or not openai.api_key:
+            return _library_suggestions(db, session, results, len(critical_areas))
 
         # Prompt migliorato rispetto all'originale
         prompt = f"""Sei un esperto di trasformazione digitale per aziende italiane.
@@ -2166,11 +2074,7 @@ Rispondi in italiano, tono professionale ma accessibile."""
             
         except Exception as e:
             print(f"❌ Errore OpenAI enhanced: {e}")
-            return {
-                "critical_count": len(critical_areas),
-                "suggestions": f"⚠️ Errore generazione AI: {str(e)}\n\n{len(critical_areas)} aree critiche identificate necessitano attenzione.",
-                "enhanced_available": False
-            }
+            return _library_suggestions(db, session, results, len(critical_areas), enrich_error=str(e))
             
     except Exception as e:
         print(f"❌ Errore ai_suggestions_enhanced: {e}")
@@ -2243,7 +2147,9 @@ async def generate_pareto_recommendations(
         # Prima controlla se esistono già raccomandazioni salvate
         from uuid import UUID as PyUUID
         session_uuid = PyUUID(request.session_id)
-        session = db.query(models.AssessmentSession).filter(
+        session = db.query(models.AssessmentSession).options(
+            undefer(models.AssessmentSession.pareto_recommendations)
+        ).filter(
             models.AssessmentSession.id == session_uuid
         ).first()
         
@@ -1,5 +1,6 @@
 from pydantic import BaseModel, validator
-from typing import Optional
+from typing import Optional, List, Any
+import json
 from uuid import UUID
 from datetime import datetime
 
@@ -56,19 +57,65 @@ class AssessmentSessionCreate(BaseModel):
     email: Optional[str] = None
     effettuato_da: Optional[str] = None
     model_name: Optional[str] = 'i40_assessment_fto'
-    risposte_json: Optional[str] = None
-    punteggi_json: Optional[str] = None
+    risposte_json: Optional[Any] = None  # JSONB: accetta oggetto o stringa JSON
+    punteggi_json: Optional[Any] = None
     raccomandazioni: Optional[str] = None
     logo_path: Optional[str] = None
 
+    @validator('risposte_json', 'punteggi_json', pre=True)
+    def parse_json_string(cls, v):
+        # Compatibilità con i client che inviano il JSON serializzato come stringa
+        if isinstance(v, str):
+            if not v.strip():
+                return None
+            try:
+                return json.loads(v)
+            except ValueError:
+                raise ValueError('Deve essere un JSON valido')
+        return v
+
 class AssessmentSessionOut(AssessmentSessionCreate):
     id: UUID
+    model_version: Optional[str] = None
     data_chiusura: Optional[datetime] = None
     creato_il: Optional[datetime] = None
 
     class Config:
         from_attributes = True
 
+# 📑 Clonazione di una sessione (ri-assessment): campi non indicati copiati dall'originale
+class AssessmentSessionClone(BaseModel):
+    to_version: Optional[str] = None     # versione del modello della nuova sessione
+    latest_version: bool = False         # True: versione corrente del modello
+    user_id: Optional[str] = None
+    effettuato_da: Optional[str] = None
+    referente: Optional[str] = None
+    email: Optional[str] = None
+
+# 📋 Assessment Session - versione leggera per le liste (senza colonne testuali pesanti)
+class AssessmentSessionSummary(BaseModel):
+    id: UUID
+    user_id: Optional[str] = None
+    company_id: Optional[int] = None
+    azienda_nome: str
+    settore: Optional[str] = None
+    dimensione: Optional[str] = None
+    referente: Optional[str] = None
+    email: Optional[str] = None
+    effettuato_da: Optional[str] = None
+    model_name: Optional[str] = None
+    logo_path: Optional[str] = None
+    creato_il: Optional[datetime] = None
+    data_chiusura: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class AssessmentSessionPage(BaseModel):
+    items: List[AssessmentSessionSummary]
+    next_cursor: Optional[str] = None
+    limit: int
+
 # 🏢 Company
 class CompanyCreate(BaseModel):
     name: str
@@ -0,0 +1,237 @@
+"""
+Griglia completa delle risposte di una sessione (storage sparso)
+
+Con session_factory.SPARSE_ANSWERS attivo (default) assessment_answer
+contiene solo le celle risposte: una cella assente vale score 0, nota vuota,
+applicabile, cioè esattamente la riga che prima veniva pre-popolata alla
+creazione della sessione. La griglia completa si ricostruisce in memoria unendo le righe
+salvate al template della versione del modello a cui la sessione è legata
+(session_factory.session_template, in cache per id versione) per id di
+model_dimension, nell'ordine del modello.
+
+Le sessioni create con le righe pre-popolate restano valide: ogni cella trova
+la sua riga e l'unione non aggiunge nulla. Le righe salvate che non
+corrispondono a celle del modello (modello modificato dopo le risposte) sono
+mantenute in coda.
+"""
+
+import uuid
+from collections import Counter
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+from uuid import UUID
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app import models
+from app.services import dimension_catalog, session_factory
+
+DEFAULT_SCORE = 0
+DEFAULT_NOTE = ""
+
+
+class Answer(NamedTuple):
+    id: UUID
+    session_id: UUID
+    process: str
+    activity: str
+    category: str
+    dimension: str
+    score: int
+    note: Optional[str]
+    is_not_applicable: bool
+
+
+class GroupStats(NamedTuple):
+    applicable: int
+    not_applicable: int
+    score_sum: float
+
+    @property
+    def average(self) -> Optional[float]:
+        return self.score_sum / self.applicable if self.applicable else None
+
+
+def is_default(score, note, is_not_applicable) -> bool:
+    """True se la risposta coincide con la cella vuota (e quindi non va salvata)"""
+    return not is_not_applicable and (score or 0) == DEFAULT_SCORE and not note
+
+
+def _answer_id(session_id: UUID, cell: tuple) -> UUID:
+    # Stabile tra le letture e prima/dopo la risposta: il frontend usa l'id come chiave delle righe
+    return uuid.uuid5(session_id, "\x1f".join(cell))
+
+
+def merge_answers(
+    session_id: UUID,
+    rows: Iterable,
+    template: Optional[session_factory.AnswerTemplate],
+    extra_cells: Optional[Dict[int, tuple]] = None,
+) -> List[Answer]:
+    """
+    Righe salvate (dimension_id, score, note, is_not_applicable) + celle mancanti
+    del modello con i valori di default. extra_cells: celle delle righe che non
+    appartengono al modello (vedi dimension_catalog.cells_by_id), messe in coda.
+    """
+    cells = template.cells if template else ()
+    positions = template.positions if template else {}
+    stored = [None] * len(cells)
+    extras = {}
+    for row in rows:
+        position = positions.get(row.dimension_id)
+        if position is None:
+            extras[row.dimension_id] = row
+        else:
+            stored[position] = row
+
+    answers = []
+    for cell, row in zip(cells, stored):
+        if row is None:
+            answers.append(Answer(_answer_id(session_id, cell), session_id, *cell, DEFAULT_SCORE, DEFAULT_NOTE, False))
+        else:
+            answers.append(Answer(
+                _answer_id(session_id, cell), session_id, *cell, row.score, row.note, bool(row.is_not_applicable),
+            ))
+    for dimension_id, cell in (extra_cells or {}).items():
+        row = extras.get(dimension_id)
+        if row is not None:
+            answers.append(Answer(
+                _answer_id(session_id, cell), session_id, *cell, row.score, row.note, bool(row.is_not_applicable),
+            ))
+    return answers
+
+
+def load_answers(
+    db: Session, session_id: UUID, model_name: Optional[str] = None, model_version: Optional[str] = None,
+) -> List[Answer]:
+    """
+    Griglia completa di una sessione; lista vuota se la sessione non esiste.
+    model_name/model_version: quelli della sessione, se il chiamante li ha già letti.
+    """
+    if model_name is None:
+        S = models.AssessmentSession
+        session = db.execute(select(S.model_name, S.model_version).where(S.id == session_id)).first()
+        if session is None:
+            return []
+        model_name, model_version = session.model_name, session.model_version
+
+    return load_answers_with_template(db, session_id, session_factory.session_template(model_name, model_version))
+
+
+def load_answers_with_template(
+    db: Session, session_id: UUID, template: Optional[session_factory.AnswerTemplate],
+) -> List[Answer]:
+    """Come load_answers, con il template già risolto: solo letture dal database"""
+    A = models.AssessmentAnswer
+    rows = db.execute(
+        select(A.dimension_id, A.score, A.note, A.is_not_applicable).where(A.session_id == session_id)
+    ).all()
+    positions = template.positions if template else {}
+    extra_cells = dimension_catalog.cells_by_id(db, (r.dimension_id for r in rows if r.dimension_id not in positions))
+    return merge_answers(session_id, rows, template, extra_cells)
+
+
+def cell_ids(model_name: Optional[str], model_version: Optional[str], cells: Iterable[tuple]) -> Dict[tuple, int]:
+    """Id model_dimension delle celle: dal template della sessione, registrando quelle fuori modello"""
+    template = session_factory.session_template(model_name, model_version)
+    known = dict(zip(template.cells, template.dimension_ids)) if template else {}
+    ids = {}
+    missing = []
+    for cell in cells:
+        if cell in known:
+            ids[cell] = known[cell]
+        elif cell not in ids:
+            missing.append(cell)
+            ids[cell] = None
+    if missing:
+        ids.update(dimension_catalog.ensure_cells(
+            model_name or session_factory.DEFAULT_MODEL, missing, ordinals=False
+        ))
+    return ids
+
+
+async def load_answers_async(
+    db: AsyncSession, session_id: UUID, model_name: Optional[str] = None, model_version: Optional[str] = None,
+) -> List[Answer]:
+    """
+    Come load_answers. Il template si risolve in un thread: può leggere il file
+    del modello e pubblicare la versione con il motore sync, cose che sul loop
+    lo bloccherebbero (run_sync gira sul thread del loop). Le letture delle
+    risposte passano invece dalla connessione async.
+    """
+    if model_name is None:
+        S = models.AssessmentSession
+        session = (await db.execute(select(S.model_name, S.model_version).where(S.id == session_id))).first()
+        if session is None:
+            return []
+        model_name, model_version = session.model_name, session.model_version
+    template = await run_in_threadpool(session_factory.session_template, model_name, model_version)
+    return await db.run_sync(load_answers_with_template, session_id, template)
+
+
+def applicable(answers: Iterable[Answer]) -> List[Answer]:
+    return [a for a in answers if not a.is_not_applicable]
+
+
+def group_stats(answers: Iterable[Answer], *fields: str) -> Dict[Any, GroupStats]:
+    """
+    Conteggi e somma punteggi (solo applicabili) per gruppo, nell'ordine del modello.
+    Con un solo campo la chiave è il valore, con più campi una tupla.
+    """
+    acc: Dict[Any, List] = {}
+    for a in answers:
+        key = getattr(a, fields[0]) if len(fields) == 1 else tuple(getattr(a, f) for f in fields)
+        item = acc.setdefault(key, [0, 0, 0.0])
+        if a.is_not_applicable:
+            item[1] += 1
+        else:
+            item[0] += 1
+            item[2] += a.score or 0
+    return {key: GroupStats(*item) for key, item in acc.items()}
+
+
+def process_category_stats(
+    rows: Iterable,
+    template: Optional[session_factory.AnswerTemplate],
+    extra_cells: Optional[Dict[int, tuple]] = None,
+) -> Dict[tuple, GroupStats]:
+    """
+    group_stats(merge_answers(...), "process", "category") calcolato dalle sole
+    righe salvate: si parte dai conteggi della sessione vuota del template e si
+    applica ogni risposta, senza costruire la griglia (ricalcoli su molte sessioni)
+    """
+    acc: Dict[tuple, List] = {
+        (process, category): [applicable, not_applicable, score_sum]
+        for process, category, score_sum, applicable, not_applicable in (template.aggregate_rows if template else ())
+    }
+    cells = template.cells if template else ()
+    positions = template.positions if template else {}
+    for row in rows:
+        position = positions.get(row.dimension_id)
+        if position is not None:
+            cell = cells[position]
+            item = acc[(cell[0], cell[2])]
+            item[0] -= 1  # la cella vuota contava come applicabile con score 0
+        else:
+            cell = (extra_cells or {}).get(row.dimension_id)
+            if cell is None:
+                continue
+            item = acc.setdefault((cell[0], cell[2]), [0, 0, 0.0])
+        if row.is_not_applicable:
+            item[1] += 1
+        else:
+            item[0] += 1
+            item[2] += row.score or 0
+    return {key: GroupStats(*item) for key, item in acc.items()}
+
+
+def average_by(answers: Iterable[Answer], *fields: str) -> Dict[Any, float]:
+    """Media dei punteggi applicabili per gruppo (i gruppi senza applicabili sono esclusi, come AVG in SQL)"""
+    return {key: s.average for key, s in group_stats(answers, *fields).items() if s.applicable}
+
+
+def score_distribution(answers: Iterable[Answer]) -> List[tuple]:
+    """(score, conteggio) sulle risposte applicabili, per score crescente"""
+    return sorted(Counter(a.score for a in answers if not a.is_not_applicable).items())
@@ -0,0 +1,107 @@
+"""
+Benchmark percentile di una sessione rispetto ai pari (stesso settore/dimensione)
+
+Gli sketch quantili sono gli istogrammi a bin fissi dei rollup di portafoglio
+(app/services/portfolio.py): 101 contatori per cella processo × dominio e per
+gruppo, quindi memoria costante al crescere delle sessioni e rank calcolato in
+tempo costante. Rispetto a un t-digest l'istogramma è esatto a 0.05 punti sul
+dominio limitato 0-5 e, soprattutto, è sottraibile: una sessione riaperta o
+modificata si toglie dallo sketch senza ricostruirlo.
+
+Il gruppo di confronto è il primo con almeno MIN_PEERS sessioni tra:
+stesso settore e dimensione, stesso settore, stessa dimensione, tutte.
+"""
+
+from typing import Dict, Optional
+from uuid import UUID
+
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Session, load_only, undefer
+
+from app import models
+from app.services import portfolio
+
+
+def _peer_candidates(session) -> list:
+    candidates = []
+    peer = portfolio.peer_group_value(session.settore, session.dimensione)
+    if peer:
+        candidates.append(("peer", peer))
+    if session.settore:
+        candidates.append(("settore", session.settore))
+    if session.dimensione:
+        candidates.append(("dimensione", session.dimensione))
+    candidates.append(("all", ""))
+    return candidates
+
+
+def _select_peer_group(db: Session, session):
+    """Primo gruppo di confronto con abbastanza sessioni chiuse (una query)"""
+    R = models.PortfolioRollup
+    candidates = _peer_candidates(session)
+    sizes = dict(
+        ((g, v), n) for g, v, n in db.query(R.group_type, R.group_value, R.n).filter(
+            tuple_(R.group_type, R.group_value).in_(candidates),
+            R.process == "", R.category == "",
+        )
+    )
+    for key in candidates:
+        if sizes.get(key, 0) >= portfolio.MIN_PEERS:
+            return key, sizes[key]
+    return (None, None), 0
+
+
+def _cell(value: Optional[float], row) -> Dict:
+    if row is None or row.n <= 0 or value is None:
+        return {"score": value, "percentile": None, "peer_mean": None, "peer_median": None}
+    return {
+        "score": round(value, 2),
+        "percentile": portfolio.histogram_rank(row.histogram, row.n, value),
+        "peer_mean": round(row.score_sum / row.n, 2),
+        "peer_median": portfolio.histogram_percentile(row.histogram, row.n, 50),
+    }
+
+
+def session_benchmark(db: Session, session_id: UUID) -> Optional[Dict]:
+    """
+    Percentile della sessione per processo, dominio e processo × dominio.
+    None se la sessione non esiste; peer_group None se non ci sono abbastanza pari.
+    """
+    S = models.AssessmentSession
+    session = db.query(S).options(
+        load_only(S.id, S.settore, S.dimensione),
+        undefer(S.punteggi_json),
+    ).filter(S.id == session_id).first()
+    if session is None:
+        return None
+
+    snapshot = session.punteggi_json or {}
+    output = {
+        "session_id": str(session_id),
+        "peer_group": None,
+        "overall": None,
+        "by_category": {},
+        "by_process": {},
+        "by_process_category": {},
+    }
+    (group_type, group_value), peers = _select_peer_group(db, session)
+    if group_type is None or snapshot.get("overall") is None:
+        return output
+
+    R = models.PortfolioRollup
+    rows = {
+        (r.process, r.category): r
+        for r in db.query(R).filter(R.group_type == group_type, R.group_value == group_value)
+    }
+    output["peer_group"] = {"type": group_type, "value": group_value or None, "peers": peers}
+    for process, category, value in portfolio.snapshot_cells(snapshot):
+        cell = _cell(value, rows.get((process, category)))
+        if not process and not category:
+            output["overall"] = cell
+        elif not process:
+            output["by_category"][category] = cell
+        elif not category:
+            output["by_process"][process] = cell
+        else:
+            output["by_process_category"].setdefault(process, {})[category] = cell
+    return output
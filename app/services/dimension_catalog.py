@@ -0,0 +1,81 @@
+"""
+Catalogo delle domande dei modelli (tabella model_dimension, migrations/005)
+
+Ogni cella processo/attività/dominio/domanda di un modello ha un id intero:
+le risposte (assessment_answer) lo usano al posto delle quattro stringhe.
+Una domanda che resta uguale tra due revisioni del modello mantiene l'id, per
+cui le risposte date sulla revisione precedente restano agganciate.
+
+Le celle vengono registrate quando serve il template del modello
+(session_factory.answer_template, quindi anche subito dopo il salvataggio del
+modello) in una transazione propria: gli id sono visibili e validi anche se la
+richiesta che li ha creati fa rollback.
+"""
+
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app import database, models
+
+Cell = Tuple[str, str, str, str]  # (process, activity, category, dimension)
+
+
+def _select_model_cells(conn, model_name: str) -> Dict[Cell, Tuple[int, int]]:
+    D = models.ModelDimension.__table__
+    rows = conn.execute(
+        select(D.c.id, D.c.ordinal, D.c.process, D.c.activity, D.c.category, D.c.dimension)
+        .where(D.c.model_name == model_name)
+    )
+    return {(r.process, r.activity, r.category, r.dimension): (r.id, r.ordinal) for r in rows}
+
+
+def ensure_cells(model_name: str, cells: Sequence[Cell], ordinals: bool = True) -> Dict[Cell, int]:
+    """
+    Id delle celle del modello, creando quelle mancanti. Con ordinals=True
+    `cells` è il modello completo e la posizione di ogni cella viene riallineata.
+    """
+    if not cells:
+        return {}
+    D = models.ModelDimension.__table__
+    with database.engine.begin() as conn:
+        known = _select_model_cells(conn, model_name)
+        missing = []
+        for ordinal, cell in enumerate(cells, start=1):
+            if cell not in known:
+                missing.append({
+                    "model_name": model_name, "ordinal": ordinal if ordinals else 0,
+                    "process": cell[0], "activity": cell[1], "category": cell[2], "dimension": cell[3],
+                })
+        if missing:
+            conn.execute(pg_insert(D).on_conflict_do_nothing(constraint="uq_model_dimension_cell"), missing)
+            known = _select_model_cells(conn, model_name)
+
+        if ordinals:
+            moved = [
+                {"b_id": known[cell][0], "b_ordinal": ordinal}
+                for ordinal, cell in enumerate(cells, start=1)
+                if known[cell][1] != ordinal
+            ]
+            if moved:
+                conn.execute(
+                    update(D).where(D.c.id == bindparam("b_id")).values(ordinal=bindparam("b_ordinal")),
+                    moved,
+                )
+    return {cell: known[cell][0] for cell in cells}
+
+
+def cells_by_id(db: Session, ids: Iterable[int]) -> Dict[int, Cell]:
+    """Celle di un insieme di id (es. risposte a domande tolte dal modello), nell'ordine del modello"""
+    ids: List[int] = list(set(ids))
+    if not ids:
+        return {}
+    D = models.ModelDimension
+    rows = db.execute(
+        select(D.id, D.process, D.activity, D.category, D.dimension)
+        .where(D.id.in_(ids))
+        .order_by(D.ordinal, D.id)
+    ).all()
+    return {r.id: (r.process, r.activity, r.category, r.dimension) for r in rows}
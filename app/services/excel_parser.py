@@ -1,15 +1,112 @@
 import pandas as pd
 import json
-from typing import Dict, List, Any, Tuple
+from typing import Dict, List, Any, Optional, Tuple
 from pathlib import Path
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Backend di lettura: "openpyxl" legge le righe in streaming (read_only, values_only),
+# "pandas" carica il foglio in un DataFrame; "auto" usa openpyxl per i formati OOXML
+PARSER_BACKENDS = ("auto", "pandas", "openpyxl")
+STREAMING_SUFFIXES = (".xlsx", ".xlsm")
+
+# Testi che pd.read_excel legge come NaN (na_values di default) e codici errore Excel
+NA_VALUES = frozenset({
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan",
+    "1.#IND", "1.#QNAN", "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+    "#NULL!", "#DIV/0!", "#VALUE!", "#REF!", "#NAME?", "#NUM!",
+})
+
+
+def _cell_value(value):
+    """Valore di una cella come lo vede pd.read_excel (None al posto di NaN)"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return None if value in NA_VALUES else value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _as_number(value):
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        for convert in (int, float):
+            try:
+                return convert(value)
+            except ValueError:
+                pass
+    return None
+
+
+class _ColumnTypes:
+    """
+    Tipo che pandas assegnerebbe a ogni colonna: se tutti i valori sono numerici
+    la colonna diventa int64 (senza vuoti) o float64, e "3" viene letto come 3.0;
+    solo booleani e nessun vuoto restano bool. Nelle colonne di testo 0/1 e
+    False/True sono unificati sul primo incontrato (1 dopo True diventa True).
+    Serve solo a formattare i testi (domande, nomi) esattamente come il DataFrame.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.filled: List[int] = []
+        self.numeric: List[bool] = []
+        self.integer: List[bool] = []
+        self.boolean: List[bool] = []
+        self.first_seen: List[dict] = []
+
+    def update(self, values: list) -> None:
+        self.rows += 1
+        missing = len(values) - len(self.filled)
+        if missing > 0:
+            self.filled.extend([0] * missing)
+            self.numeric.extend([True] * missing)
+            self.integer.extend([True] * missing)
+            self.boolean.extend([True] * missing)
+            self.first_seen.extend({} for _ in range(missing))
+        for col, value in enumerate(values):
+            if value is None:
+                continue
+            self.filled[col] += 1
+            if not isinstance(value, bool):
+                self.boolean[col] = False
+            if isinstance(value, int) and value in (0, 1):
+                self.first_seen[col].setdefault(value, value)
+            if self.numeric[col]:
+                number = _as_number(value)
+                if number is None:
+                    self.numeric[col] = False
+                elif not isinstance(number, int):
+                    self.integer[col] = False
+
+    def value(self, col: int, value):
+        """Valore tipizzato come nel DataFrame (chiamare dopo l'ultima riga, con rows aggiornato)"""
+        if col < len(self.numeric) and self.numeric[col]:
+            complete = self.filled[col] == self.rows
+            if self.boolean[col] and complete:
+                return value
+            number = _as_number(value)
+            if self.integer[col] and complete:
+                return int(number)
+            return float(number)
+        if isinstance(value, int) and col < len(self.first_seen):
+            return self.first_seen[col].get(value, value)
+        return value
+
+
 class ExcelAssessmentParser:
     """Parser per convertire file Excel di assessment in formato JSON strutturato"""
     
-    def __init__(self):
+    def __init__(self, backend: str = "auto"):
+        if backend not in PARSER_BACKENDS:
+            raise ValueError(f"Backend non supportato: {backend}")
+        self.backend = backend
         # Mapping standard delle dimensioni (colonne Excel)
         self.dimension_mapping = {
             "Governance": {"start": 1, "end": 6, "questions": []},
@@ -18,28 +115,32 @@ class ExcelAssessmentParser:
             "Organization": {"start": 19, "end": 20, "questions": []}
         }
     
-    def parse_excel_file(self, file_path: str) -> Dict[str, Any]:
+    def parse_excel_file(self, file_path, filename: Optional[str] = None) -> Dict[str, Any]:
         """
         Parsa un file Excel di assessment e restituisce struttura JSON
         
         Args:
-            file_path: Path al file Excel
+            file_path: Path al file Excel o file binario già aperto
+            filename: Nome originale del file (sceglie il backend se file_path è un file aperto)
             
         Returns:
             Dict con struttura del modello di assessment
         """
         try:
-            # Leggi il file Excel
-            df = pd.read_excel(file_path, sheet_name=0, header=None)
-            
-            # Estrai metadata del modello
-            model_info = self._extract_model_info(df)
-            
-            # Estrai le domande per ogni dimensione
-            questions = self._extract_questions(df)
-            
-            # Estrai i processi con le loro valutazioni
-            processes = self._extract_processes(df)
+            if self._use_streaming(filename or file_path):
+                model_info, questions, processes = self._parse_streaming(file_path)
+            else:
+                # Leggi il file Excel
+                df = pd.read_excel(file_path, sheet_name=0, header=None)
+                
+                # Estrai metadata del modello
+                model_info = self._extract_model_info(df)
+                
+                # Estrai le domande per ogni dimensione
+                questions = self._extract_questions(df)
+                
+                # Estrai i processi con le loro valutazioni
+                processes = self._extract_processes(df)
             
             # Costruisci la struttura finale
             result = {
@@ -61,6 +162,116 @@ class ExcelAssessmentParser:
             logger.error(f"Errore parsing Excel: {str(e)}")
             raise ValueError(f"Errore nel parsing del file Excel: {str(e)}")
     
+    def _use_streaming(self, file_path) -> bool:
+        if self.backend == "auto":
+            return str(file_path).lower().endswith(STREAMING_SUFFIXES)
+        return self.backend == "openpyxl"
+    
+    def _parse_streaming(self, file_path) -> Tuple[Dict[str, str], Dict[str, List[str]], List[Dict[str, Any]]]:
+        """
+        Stesso risultato di read_excel + _extract_*, in una sola passata sulle righe
+        con openpyxl read_only/values_only: nessun DataFrame in memoria, solo le
+        righe con un nome processo vengono conservate
+        """
+        from openpyxl import load_workbook
+        
+        columns = _ColumnTypes()
+        title_row: Optional[list] = None
+        question_row: Optional[list] = None
+        candidates = []  # valori delle righe processo, fino all'ultima colonna mappata
+        last_row_with_data = -1
+        last_col = max(mapping["end"] for mapping in self.dimension_mapping.values()) + 1
+        
+        wb = load_workbook(file_path, read_only=True, data_only=True, keep_links=False)
+        try:
+            sheet = wb.worksheets[0]
+            sheet.reset_dimensions()
+            for idx, raw in enumerate(sheet.iter_rows(values_only=True)):
+                end = len(raw)
+                while end and (raw[end - 1] is None or raw[end - 1] == ""):
+                    end -= 1
+                if end:
+                    last_row_with_data = idx
+                values = [_cell_value(v) for v in raw[:end]]
+                columns.update(values)
+                
+                if idx == 0:
+                    title_row = values
+                elif idx == 2:
+                    question_row = values
+                elif idx > 2 and values and values[0] is not None:
+                    candidates.append(values[:last_col])
+        finally:
+            wb.close()
+        
+        # Righe vuote in coda e larghezza come nel DataFrame
+        rows = last_row_with_data + 1
+        columns.rows = rows
+        width = len(columns.filled)
+        
+        def cell(values: list, col: int):
+            return values[col] if col < len(values) else None
+        
+        # Metadata del modello
+        if rows == 0:
+            model_info = {"name": "Assessment Model", "description": "Modello importato da Excel", "version": "1.0"}
+        else:
+            title = cell(title_row, 0)
+            model_info = {
+                "name": str(columns.value(0, title)) if title is not None else "Unknown Model",
+                "description": "Modello importato da Excel",
+                "version": "1.0"
+            }
+        
+        # Domande (riga 3)
+        if rows < 3:
+            raise ValueError("Errore nel parsing delle domande dal file Excel: riga delle domande assente. "
+                             "Verificare che il file abbia la struttura corretta.")
+        questions = {}
+        missing_dimensions = []
+        for dimension, mapping in self.dimension_mapping.items():
+            dim_questions = []
+            for col_idx in range(mapping["start"], min(mapping["end"] + 1, width)):
+                question = cell(question_row, col_idx)
+                if question is not None:
+                    text = str(columns.value(col_idx, question)).strip()
+                    if text:
+                        dim_questions.append(text)
+            if len(dim_questions) == 0:
+                missing_dimensions.append(dimension)
+            else:
+                questions[dimension] = dim_questions
+        if missing_dimensions:
+            error_msg = f"Domande mancanti per le dimensioni: {', '.join(missing_dimensions)}. "
+            error_msg += "Verificare che il file Excel abbia la struttura corretta con domande nella riga 3."
+            raise ValueError(error_msg)
+        
+        # Processi con le loro valutazioni
+        processes = []
+        for values in candidates:
+            process_name = columns.value(0, values[0])
+            if not process_name or str(process_name).strip() == "":
+                continue
+            process_name = str(process_name).strip()
+            process_data = {
+                "name": process_name,
+                "categories": {}
+            }
+            for dimension, mapping in self.dimension_mapping.items():
+                scores = []
+                for col_idx in range(mapping["start"], min(mapping["end"] + 1, width)):
+                    value = cell(values, col_idx)
+                    try:
+                        scores.append(None if value is None else float(value))
+                    except (TypeError, ValueError):
+                        scores.append(None)
+                if any(score is not None for score in scores):
+                    process_data["categories"][dimension] = scores
+            if process_data["categories"]:
+                processes.append(process_data)
+        
+        return model_info, questions, processes
+    
     def _extract_model_info(self, df: pd.DataFrame) -> Dict[str, str]:
         """Estrae informazioni sul modello dalla prima riga"""
         try:
@@ -197,9 +408,9 @@ class ExcelAssessmentParser:
 
 
 # UTILITY FUNCTIONS
-def parse_excel_to_assessment_model(file_path: str) -> Dict[str, Any]:
+def parse_excel_to_assessment_model(file_path: str, backend: str = "auto") -> Dict[str, Any]:
     """Funzione helper per parsing rapido"""
-    parser = ExcelAssessmentParser()
+    parser = ExcelAssessmentParser(backend)
     return parser.parse_excel_file(file_path)
 
 def validate_excel_file(file_path: str) -> Tuple[bool, List[str]]:
@@ -0,0 +1,319 @@
+"""
+Workbook Excel di assessment in modalità write-only (openpyxl)
+
+Stesso layout di export_model_to_excel (Riepilogo Risultati, Gap Analysis,
+uno sheet per processo) ma con le righe scritte in streaming e gli stili
+registrati una volta sola come NamedStyle: ogni cella riceve solo il
+riferimento allo stile condiviso invece di un proprio Font/Fill/Border.
+
+Se viene passato `answers` gli sheet processo contengono i punteggi della
+sessione ("N/A" per le domande non applicabili, ignorato da AVERAGE) e le note.
+"""
+
+from typing import Dict, IO, List, NamedTuple, Optional, Tuple
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill, Alignment, Border, Side, NamedStyle
+from openpyxl.styles.fonts import DEFAULT_FONT
+from openpyxl.utils import get_column_letter
+from openpyxl.worksheet.cell_range import CellRange
+
+from app.services.model_store import model_categories
+
+# (process, activity, category, domanda) -> (score, is_not_applicable, note)
+AnswerKey = Tuple[str, str, str, str]
+Answers = Dict[AnswerKey, Tuple[int, bool, Optional[str]]]
+
+NOT_APPLICABLE = "N/A"
+
+SUMMARY_SHEET = "Riepilogo Risultati"
+GAP_SHEET = "Gap Analysis"
+
+
+def _fill(color: str) -> PatternFill:
+    return PatternFill(start_color=color, end_color=color, fill_type="solid")
+
+
+_border = Border(
+    left=Side(style='thin'),
+    right=Side(style='thin'),
+    top=Side(style='thin'),
+    bottom=Side(style='thin')
+)
+_center = Alignment(horizontal='center', vertical='center')
+_center_wrap = Alignment(horizontal='center', vertical='center', wrap_text=True)
+_left_wrap = Alignment(horizontal='left', vertical='center', wrap_text=True)
+
+_question_header_font = Font(bold=True, size=10)
+_question_header_fill = _fill("B4C7E7")
+_activity_fill = _fill("F2F2F2")
+_media_fill = _fill("E7E6E6")
+
+# Nome -> attributi; registrati come NamedStyle in ogni workbook
+STYLE_DEFS = {
+    "aa_sheet_header": dict(font=Font(bold=True, color="FFFFFF", size=14), fill=_fill("305496"), alignment=_center),
+    "aa_summary_title": dict(font=Font(bold=True, size=16, color="FFFFFF"), fill=_fill("203864"), alignment=_center),
+    "aa_section": dict(font=Font(bold=True, size=14)),
+    "aa_domain_header": dict(font=Font(bold=True, color="FFFFFF", size=12), fill=_fill("4472C4"), alignment=_center),
+    "aa_col_header": dict(font=_question_header_font, fill=_question_header_fill, border=_border, alignment=_center_wrap),
+    "aa_col_header_nowrap": dict(font=_question_header_font, fill=_question_header_fill, border=_border, alignment=_center),
+    "aa_col_header_plain": dict(font=_question_header_font, fill=_question_header_fill, border=_border),
+    "aa_process_label": dict(border=_border, fill=_activity_fill),
+    "aa_score": dict(border=_border, number_format='0.00', alignment=_center),
+    "aa_total": dict(border=_border, fill=_media_fill, number_format='0.00', alignment=_center, font=Font(bold=True)),
+    "aa_gap_pct": dict(border=_border, number_format='0.0"%"', alignment=_center),
+    "aa_bordered": dict(border=_border),
+    "aa_bordered_num": dict(border=_border, number_format='0.00'),
+    "aa_strengths_title": dict(font=Font(bold=True, size=12, color="008000")),
+    "aa_weaknesses_title": dict(font=Font(bold=True, size=12, color="FF0000")),
+    "aa_gap_process": dict(font=Font(bold=True, size=14), fill=_fill("D9E1F2")),
+    "aa_activity": dict(border=_border, fill=_activity_fill, alignment=_left_wrap),
+    "aa_answer": dict(border=_border, alignment=_center),
+    "aa_media": dict(border=_border, fill=_media_fill, alignment=_center, number_format='0.00'),
+    "aa_note": dict(border=_border, alignment=_left_wrap),
+}
+
+
+def _register_styles(wb: Workbook) -> None:
+    for name, attrs in STYLE_DEFS.items():
+        # Senza font esplicito la cella deve restare sul font di default del workbook
+        wb.add_named_style(NamedStyle(name=name, **{"font": DEFAULT_FONT, **attrs}))
+
+
+class _Styled(NamedTuple):
+    value: object
+    style: str
+
+
+class _SheetWriter:
+    """
+    Scrive righe in ordine su un foglio write-only, con stili condivisi.
+    Una riga viene serializzata subito da ws.append, quindi le celle stilizzate
+    sono riusate tra le righe (una per stile e colonna) cambiando solo il valore.
+    """
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.row = 0
+        self._pool: Dict[Tuple[str, int], WriteOnlyCell] = {}
+
+    @staticmethod
+    def cell(value=None, style: Optional[str] = None):
+        return _Styled(value, style) if style else value
+
+    def _resolve(self, idx: int, item):
+        if not isinstance(item, _Styled):
+            return item
+        key = (item.style, idx)
+        c = self._pool.get(key)
+        if c is None:
+            c = self._pool[key] = WriteOnlyCell(self.ws)
+            c.style = item.style
+        c.value = item.value
+        return c
+
+    def append(self, cells: List, height: Optional[float] = None) -> int:
+        self.row += 1
+        if height is not None:
+            self.ws.row_dimensions[self.row].height = height
+        self.ws.append([self._resolve(i, item) for i, item in enumerate(cells)])
+        return self.row
+
+    def skip(self, count: int = 1) -> None:
+        for _ in range(count):
+            self.append([])
+
+    def merge(self, ref: str) -> None:
+        self.ws.merged_cells.add(CellRange(ref))
+
+
+def _process_layout(categories: Dict[str, List[str]], activities: list) -> Tuple[Dict, Dict[str, float]]:
+    """
+    Righe e colonne di uno sheet processo, calcolate prima di scrivere
+    (servono alle formule del Riepilogo e alle larghezze colonna, da fissare
+    prima della prima riga in modalità write-only)
+    """
+    domain_rows = {}
+    widths: Dict[str, float] = {}
+    row_idx = 2
+    for domain_name, questions in categories.items():
+        if not questions:
+            continue
+        header_row = row_idx + 1
+        media_col = 2 + len(questions)
+        widths['A'] = 35
+        for q_idx in range(len(questions)):
+            widths[get_column_letter(2 + q_idx)] = 20
+        widths[get_column_letter(media_col)] = 10
+        widths[get_column_letter(media_col + 1)] = 40
+        start_row = header_row + 1
+        end_row = start_row + len(activities) - 1
+        domain_rows[domain_name] = {
+            'media_col': get_column_letter(media_col),
+            'start_row': start_row,
+            'end_row': end_row,
+        }
+        row_idx = end_row + 2
+    return domain_rows, widths
+
+
+def write_assessment_workbook(
+    model_data: list,
+    target: IO[bytes],
+    answers: Optional[Answers] = None,
+    title: Optional[str] = None,
+) -> None:
+    """Scrive il workbook su `target` (file binario o BytesIO)"""
+    categories = model_categories(model_data)
+
+    wb = Workbook(write_only=True)
+    _register_styles(wb)
+    if title:
+        wb.properties.title = title
+
+    processes = [(p, p['process'][:31]) for p in model_data]
+    layouts = {
+        sheet_name: _process_layout(categories, process['activities'])
+        for process, sheet_name in processes
+    }
+
+    # ============================================
+    # SHEET 1: RIEPILOGO RISULTATI
+    # ============================================
+    sw = _SheetWriter(wb.create_sheet(title=SUMMARY_SHEET))
+    ws = sw.ws
+    ws.column_dimensions['A'].width = 30
+    for col in ['B', 'C', 'D', 'E', 'F', 'G']:
+        ws.column_dimensions[col].width = 15
+
+    sw.merge('A1:G1')
+    sw.append([sw.cell('RIEPILOGO RISULTATI ASSESSMENT', 'aa_summary_title')], height=35)
+    sw.skip()
+    row = sw.append([sw.cell('PUNTEGGI PER PROCESSO E DIMENSIONE', 'aa_section')])
+    sw.merge(f'A{row}:G{row}')
+
+    headers = ['Processo', 'Governance', 'Monitoring & Control', 'Technology', 'Organization', 'Media Totale', 'Gap %']
+    sw.append([sw.cell(h, 'aa_col_header') for h in headers])
+
+    process_data_start_row = sw.row + 1
+    summary_rows = {}
+    for process, sheet_name in processes:
+        current_row = sw.row + 1
+        summary_rows[process['process']] = current_row
+        domain_rows = layouts[sheet_name][0]
+        cells = [sw.cell(process['process'], 'aa_process_label')]
+        for domain_name in categories:
+            info = domain_rows.get(domain_name)
+            value = (
+                f"=AVERAGE('{sheet_name}'!{info['media_col']}{info['start_row']}:{info['media_col']}{info['end_row']})"
+                if info else 0
+            )
+            cells.append(sw.cell(value, 'aa_score'))
+        cells.append(sw.cell(f'=AVERAGE(B{current_row}:E{current_row})', 'aa_total'))
+        cells.append(sw.cell(f'=(5-F{current_row})/5*100', 'aa_gap_pct'))
+        sw.append(cells)
+    process_data_end_row = sw.row
+
+    sw.skip(2)
+    sw.append([sw.cell('DATI RADAR CHART - DIMENSIONI', 'aa_section')])
+    sw.append([sw.cell('Dimensione', 'aa_col_header_plain'), sw.cell('Punteggio Medio', 'aa_col_header_plain')])
+    for dim_idx, domain_name in enumerate(categories.keys()):
+        col_letter = get_column_letter(2 + dim_idx)
+        sw.append([
+            sw.cell(domain_name, 'aa_bordered'),
+            sw.cell(f'=AVERAGE({col_letter}{process_data_start_row}:{col_letter}{process_data_end_row})', 'aa_bordered_num'),
+        ])
+
+    sw.skip(2)
+    row = sw.append([sw.cell('TOP 3 PROCESSI (Punti di Forza)', 'aa_strengths_title')])
+    sw.merge(f'A{row}:C{row}')
+    sw.append(['Ordina la tabella sopra per "Media Totale" in ordine decrescente per identificare i top 3'])
+    sw.skip()
+    row = sw.append([sw.cell('BOTTOM 3 PROCESSI (Aree di Miglioramento)', 'aa_weaknesses_title')])
+    sw.merge(f'A{row}:C{row}')
+    sw.append(['Ordina la tabella sopra per "Media Totale" in ordine crescente per identificare i bottom 3'])
+
+    # ============================================
+    # SHEET 2: GAP ANALYSIS
+    # ============================================
+    gw = _SheetWriter(wb.create_sheet(title=GAP_SHEET))
+    gap_ws = gw.ws
+    gap_ws.column_dimensions['A'].width = 25
+    gap_ws.column_dimensions['B'].width = 12
+    gap_ws.column_dimensions['C'].width = 40
+    gap_ws.column_dimensions['D'].width = 40
+
+    gw.merge('A1:E1')
+    gw.append([gw.cell('GAP ANALYSIS - STRENGTHS & WEAKNESSES', 'aa_sheet_header')], height=30)
+    gw.skip()
+    for process, _ in processes:
+        row = gw.append([gw.cell(process['process'], 'aa_gap_process')])
+        gw.merge(f'A{row}:E{row}')
+        gw.append([gw.cell(h, 'aa_col_header_plain') for h in
+                   ('Dominio', 'Punteggio', 'Strengths (≥ 3.0)', 'Weaknesses (< 2.0)')])
+        for dim_idx, domain_name in enumerate(categories.keys()):
+            # Con i dati di sessione il punteggio è collegato al Riepilogo
+            score = (
+                f"='{SUMMARY_SHEET}'!{get_column_letter(2 + dim_idx)}{summary_rows[process['process']]}"
+                if answers is not None else 0
+            )
+            gw.append([
+                gw.cell(domain_name, 'aa_bordered'),
+                gw.cell(score, 'aa_bordered_num'),
+                gw.cell('', 'aa_bordered'),
+                gw.cell('', 'aa_bordered'),
+            ])
+        gw.skip()
+
+    # ============================================
+    # SHEET PER OGNI PROCESSO
+    # ============================================
+    max_questions = max(len(q) for q in categories.values() if q)
+    total_cols = 1 + max_questions + 1 + 1
+    last_col = get_column_letter(total_cols)
+
+    for process, sheet_name in processes:
+        process_name = process['process']
+        activities = process['activities']
+        pw = _SheetWriter(wb.create_sheet(title=sheet_name))
+        _, widths = layouts[sheet_name]
+        for col, width in widths.items():
+            pw.ws.column_dimensions[col].width = width
+
+        pw.merge(f'A1:{last_col}1')
+        pw.append([pw.cell(process_name, 'aa_sheet_header')], height=30)
+
+        for domain_name, questions in categories.items():
+            if not questions:
+                continue
+            row = pw.append([pw.cell(domain_name, 'aa_domain_header')], height=25)
+            pw.merge(f'A{row}:{last_col}{row}')
+
+            header = [pw.cell('Attività', 'aa_col_header')]
+            header += [pw.cell(q, 'aa_col_header') for q in questions]
+            header += [pw.cell('Media', 'aa_col_header_nowrap'), pw.cell('Note', 'aa_col_header_nowrap')]
+            pw.append(header, height=50)
+
+            last_question_col = get_column_letter(1 + len(questions))
+            for activity in activities:
+                row_idx = pw.row + 1
+                cells = [pw.cell(activity['name'], 'aa_activity')]
+                notes = []
+                for question in questions:
+                    value = None
+                    if answers is not None:
+                        answer = answers.get((process_name, activity['name'], domain_name, question))
+                        if answer is not None:
+                            score, not_applicable, note = answer
+                            value = NOT_APPLICABLE if not_applicable else score
+                            if note and note not in notes:
+                                notes.append(note)
+                    cells.append(pw.cell(value, 'aa_answer'))
+                cells.append(pw.cell(f'=AVERAGE(B{row_idx}:{last_question_col}{row_idx})', 'aa_media'))
+                cells.append(pw.cell("\n".join(notes) if notes else None, 'aa_note'))
+                pw.append(cells, height=20)
+
+            pw.skip()
+
+    wb.save(target)
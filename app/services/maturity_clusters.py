@@ -0,0 +1,473 @@
+"""
+Cluster dei profili di maturità (tabelle maturity_*, migrations/008)
+
+Ogni sessione con risposte è il vettore delle medie processo × dominio del
+suo snapshot punteggi (similar_companies.profile_vector); per ogni modello i
+vettori sono raggruppati con un k-means mini-batch in numpy: inizializzazione
+k-means++ su un campione, poi MAX_ITER passi su lotti casuali di BATCH_SIZE
+sessioni, con il passo di ogni centroide pari a 1 / sessioni viste. Il costo
+di un passo non dipende dal numero di sessioni, quindi la ricostruzione
+completa su 100k sessioni richiede pochi secondi, quasi tutti di lettura.
+I cluster sono numerati per media del centroide (0 = profilo meno maturo).
+
+Il job è incrementale: senza --full riassegna solo le sessioni nuove o con
+snapshot cambiato (punteggi_json->>'updated_at' successivo all'assegnazione)
+e sposta i centroidi con lo stesso passo del mini-batch (le sessioni
+riassegnate escono prima dal conteggio del cluster precedente); se i
+centroidi spostati cambiano ordine di media, cluster, assegnazioni e
+raccomandazioni vengono rinumerati insieme. Si ricostruisce da
+zero quando non c'è ancora un clustering, quando compaiono celle nuove nel
+modello o quando le sessioni cambiate superano REBUILD_FRACTION.
+Le raccomandazioni sono generate una volta per cluster (comando
+recommendations) e azzerate a ogni ricostruzione completa.
+
+Uso (dalla root del repository, con migrations/008 applicata):
+  python -m app.services.maturity_clusters run [--full] [--k 8] [--model NOME]
+  python -m app.services.maturity_clusters recommendations [--model NOME] [--force]
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app import models
+from app.services import session_factory
+from app.services.similar_companies import profile_vector, snapshot_cells
+
+DEFAULT_K = 8
+BATCH_SIZE = 1024
+MAX_ITER = 100
+# Spostamento massimo dei centroidi sotto il quale il mini-batch si ferma
+TOLERANCE = 1e-4
+# Sessioni usate per l'inizializzazione k-means++
+INIT_SAMPLE = 10000
+SEED = 0
+# Quota di sessioni cambiate oltre la quale l'aggiornamento incrementale ricostruisce
+REBUILD_FRACTION = 0.2
+
+Cell = Tuple[str, str]
+
+# Sessioni con almeno una risposta e snapshot punteggi; :changed_only limita a
+# quelle senza cluster o con snapshot successivo all'assegnazione
+SESSIONS_SQL = text("""
+    SELECT s.id, (s.punteggi_json->>'overall')::float8 AS overall,
+           s.punteggi_json->'by_process_category' AS by_process_category
+    FROM assessment_session s
+    LEFT JOIN session_cluster c ON c.session_id = s.id
+    WHERE COALESCE(s.model_name, :default_model) = :model_name
+      AND s.punteggi_json->>'overall' IS NOT NULL
+      AND EXISTS (SELECT 1 FROM assessment_answer a WHERE a.session_id = s.id)
+      AND (NOT :changed_only OR c.session_id IS NULL
+           OR c.model_name <> :model_name
+           OR c.assigned_at < (s.punteggi_json->>'updated_at')::timestamp)
+""")
+
+MODELS_SQL = text("""
+    SELECT DISTINCT COALESCE(model_name, :default_model) AS model_name
+    FROM assessment_session
+    WHERE punteggi_json->>'overall' IS NOT NULL
+    ORDER BY 1
+""")
+
+# Stessa popolazione di SESSIONS_SQL (per il confronto con REBUILD_FRACTION)
+COUNT_SQL = text("""
+    SELECT count(*) FROM assessment_session s
+    WHERE COALESCE(s.model_name, :default_model) = :model_name
+      AND s.punteggi_json->>'overall' IS NOT NULL
+      AND EXISTS (SELECT 1 FROM assessment_answer a WHERE a.session_id = s.id)
+""")
+
+# Cluster attuale delle sessioni da riassegnare (già contate nelle dimensioni dei cluster)
+PREVIOUS_SQL = text("""
+    SELECT cluster FROM session_cluster
+    WHERE model_name = :model_name AND session_id = ANY(CAST(:session_ids AS uuid[]))
+""")
+
+# Rinumerazione dei cluster dopo che i centroidi hanno cambiato ordine di media:
+# assegnazioni e raccomandazioni seguono il proprio centroide (old -> new)
+RELABEL_ASSIGNMENTS_SQL = text("""
+    UPDATE session_cluster c SET cluster = m.new
+    FROM unnest(CAST(:old AS smallint[]), CAST(:new AS smallint[])) AS m(old, new)
+    WHERE c.model_name = :model_name AND c.cluster = m.old
+""")
+
+RELABEL_RECOMMENDATIONS_SQL = text("""
+    UPDATE maturity_cluster c
+    SET recommendations = o.recommendations, recommendations_at = o.recommendations_at
+    FROM maturity_cluster o, unnest(CAST(:old AS smallint[]), CAST(:new AS smallint[])) AS m(old, new)
+    WHERE c.model_name = :model_name AND o.model_name = :model_name
+      AND c.cluster = m.new AND o.cluster = m.old
+""")
+
+ASSIGN_SQL = text("""
+    INSERT INTO session_cluster (session_id, model_name, cluster, distance, assigned_at)
+    SELECT session_id, :model_name, cluster, distance, :assigned_at
+    FROM unnest(CAST(:session_ids AS uuid[]), CAST(:clusters AS smallint[]), CAST(:distances AS real[]))
+         AS t(session_id, cluster, distance)
+    ON CONFLICT (session_id) DO UPDATE
+    SET model_name = EXCLUDED.model_name, cluster = EXCLUDED.cluster,
+        distance = EXCLUDED.distance, assigned_at = EXCLUDED.assigned_at
+""")
+
+SIZES_SQL = text("""
+    SELECT cluster, count(*) FROM session_cluster WHERE model_name = :model_name GROUP BY cluster
+""")
+
+
+# ============================================================================
+# K-MEANS MINI-BATCH
+# ============================================================================
+
+def nearest(X: np.ndarray, centers: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Centroide più vicino di ogni riga e distanza euclidea"""
+    d2 = (X * X).sum(axis=1)[:, None] - 2 * X @ centers.T + (centers * centers).sum(axis=1)[None, :]
+    labels = d2.argmin(axis=1)
+    return labels, np.sqrt(np.maximum(d2[np.arange(len(X)), labels], 0.0))
+
+
+def _kmeans_plus_plus(X: np.ndarray, k: int, rng: np.random.Generator) -> np.ndarray:
+    centers = [X[rng.integers(len(X))]]
+    d2 = ((X - centers[0]) ** 2).sum(axis=1)
+    for _ in range(1, k):
+        total = d2.sum()
+        index = rng.choice(len(X), p=d2 / total) if total > 0 else rng.integers(len(X))
+        centers.append(X[index])
+        d2 = np.minimum(d2, ((X - X[index]) ** 2).sum(axis=1))
+    return np.array(centers, dtype=np.float64)
+
+
+def _step(centers: np.ndarray, counts: np.ndarray, batch: np.ndarray, labels: np.ndarray) -> None:
+    """Passo mini-batch: ogni centroide si sposta verso i suoi punti con peso 1 / punti visti"""
+    k = len(centers)
+    hits = np.bincount(labels, minlength=k)
+    sums = np.zeros_like(centers)
+    np.add.at(sums, labels, batch)
+    counts += hits
+    moved = hits > 0
+    centers[moved] += (sums[moved] - hits[moved, None] * centers[moved]) / counts[moved, None]
+
+
+def minibatch_kmeans(X: np.ndarray, k: int, seed: int = SEED) -> np.ndarray:
+    """Centroidi (k × colonne) ordinati per media crescente"""
+    rng = np.random.default_rng(seed)
+    sample = X[rng.choice(len(X), min(len(X), INIT_SAMPLE), replace=False)]
+    centers = _kmeans_plus_plus(sample, k, rng)
+    counts = np.zeros(k)
+    for _ in range(MAX_ITER):
+        batch = X[rng.integers(0, len(X), min(BATCH_SIZE, len(X)))]
+        previous = centers.copy()
+        _step(centers, counts, batch, nearest(batch, centers)[0])
+        if np.abs(centers - previous).max() < TOLERANCE:
+            break
+    return centers[np.argsort(centers.mean(axis=1), kind="stable")]
+
+
+# ============================================================================
+# JOB
+# ============================================================================
+
+def _load(db: Session, model_name: str, changed_only: bool):
+    rows = db.execute(SESSIONS_SQL, {
+        "model_name": model_name, "default_model": session_factory.DEFAULT_MODEL, "changed_only": changed_only,
+    }).all()
+    # Solo le parti dello snapshot che servono al profilo (meno JSON da leggere)
+    return [str(r.id) for r in rows], [
+        {"overall": r.overall, "by_process_category": r.by_process_category} for r in rows
+    ]
+
+
+def _matrix(snapshots: List[Dict], columns: Dict[Cell, int]) -> np.ndarray:
+    X = np.empty((len(snapshots), len(columns)), dtype=np.float64)
+    for i, snapshot in enumerate(snapshots):
+        X[i] = profile_vector(snapshot, columns)
+    return X
+
+
+def _save_assignments(db: Session, model_name: str, session_ids: List[str], labels, distances) -> None:
+    db.execute(ASSIGN_SQL, {
+        "model_name": model_name,
+        "session_ids": session_ids,
+        "clusters": [int(c) for c in labels],
+        "distances": [float(d) for d in distances],
+        "assigned_at": datetime.now(),
+    })
+
+
+def _save_centers(db: Session, model_name: str, centers: np.ndarray, reset: bool) -> None:
+    sizes = dict(db.execute(SIZES_SQL, {"model_name": model_name}).all())
+    C = models.MaturityCluster
+    if reset:
+        db.query(C).filter(C.model_name == model_name).delete(synchronize_session=False)
+    rows = [
+        {"model_name": model_name, "cluster": i, "centroid": [round(float(v), 4) for v in center],
+         "size": sizes.get(i, 0)}
+        for i, center in enumerate(centers)
+    ]
+    stmt = pg_insert(C).values(rows)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["model_name", "cluster"],
+        set_={"centroid": stmt.excluded.centroid, "size": stmt.excluded.size},
+    ))
+
+
+def rebuild(db: Session, model_name: str, k: int = DEFAULT_K) -> Dict:
+    """Clustering da zero di tutte le sessioni del modello"""
+    started = time.perf_counter()
+    session_ids, snapshots = _load(db, model_name, changed_only=False)
+    if not session_ids:
+        db.query(models.MaturityClustering).filter(
+            models.MaturityClustering.model_name == model_name
+        ).delete(synchronize_session=False)
+        db.commit()
+        return {"model_name": model_name, "mode": "full", "sessions": 0}
+
+    columns: Dict[Cell, int] = {}
+    for snapshot in snapshots:
+        for cell in snapshot_cells(snapshot):
+            columns.setdefault(cell, len(columns))
+    X = _matrix(snapshots, columns)
+    loaded = time.perf_counter()
+
+    # Non più cluster dei profili distinti (k-means++ sceglierebbe centroidi doppi)
+    k = max(1, min(k, len(np.unique(X, axis=0))))
+    centers = minibatch_kmeans(X, k)
+    labels, distances = nearest(X, centers)
+    clustered = time.perf_counter()
+
+    now = datetime.now()
+    db.execute(pg_insert(models.MaturityClustering).values(
+        model_name=model_name, columns=[list(c) for c in columns], k=k, sessions=len(X),
+        inertia=float((distances ** 2).mean()), built_at=now, updated_at=now,
+    ).on_conflict_do_update(
+        index_elements=["model_name"],
+        set_={"columns": [list(c) for c in columns], "k": k, "sessions": len(X),
+              "inertia": float((distances ** 2).mean()), "built_at": now, "updated_at": now},
+    ))
+    db.query(models.SessionCluster).filter(
+        models.SessionCluster.model_name == model_name
+    ).delete(synchronize_session=False)
+    _save_assignments(db, model_name, session_ids, labels, distances)
+    _save_centers(db, model_name, centers, reset=True)
+    db.commit()
+    return {
+        "model_name": model_name, "mode": "full", "sessions": len(X), "k": k,
+        "load_seconds": round(loaded - started, 2),
+        "cluster_seconds": round(clustered - loaded, 2),
+        "save_seconds": round(time.perf_counter() - clustered, 2),
+    }
+
+
+def update(db: Session, model_name: str, k: int = DEFAULT_K) -> Dict:
+    """Assegna le sessioni nuove o cambiate e aggiorna i centroidi; ricostruisce se serve"""
+    clustering = db.get(models.MaturityClustering, model_name)
+    if clustering is None:
+        return rebuild(db, model_name, k)
+    session_ids, snapshots = _load(db, model_name, changed_only=True)
+    if not session_ids:
+        return {"model_name": model_name, "mode": "incremental", "sessions": 0}
+
+    columns = {tuple(c): i for i, c in enumerate(clustering.columns)}
+    total = db.execute(COUNT_SQL, {"model_name": model_name, "default_model": session_factory.DEFAULT_MODEL}).scalar()
+    new_cells = any(cell not in columns for snapshot in snapshots for cell in snapshot_cells(snapshot))
+    if new_cells or len(session_ids) > REBUILD_FRACTION * max(total or 0, 1):
+        return rebuild(db, model_name, k)
+
+    C = models.MaturityCluster
+    clusters = db.query(C).filter(C.model_name == model_name).order_by(C.cluster).all()
+    centers = np.array([c.centroid for c in clusters], dtype=np.float64)
+    counts = np.array([c.size for c in clusters], dtype=np.float64)
+    # Le sessioni cambiate sono già nelle dimensioni con il cluster precedente: _step le riconta
+    previous = db.execute(PREVIOUS_SQL, {"model_name": model_name, "session_ids": session_ids}).scalars().all()
+    counts -= np.bincount(np.array(previous, dtype=np.int64), minlength=len(counts))[:len(counts)]
+    np.maximum(counts, 0, out=counts)
+    X = _matrix(snapshots, columns)
+    _step(centers, counts, X, nearest(X, centers)[0])
+
+    # Cluster 0 = profilo meno maturo: se i centroidi spostati cambiano ordine si rinumera
+    order = np.argsort(centers.mean(axis=1), kind="stable")
+    if (order != np.arange(len(order))).any():
+        centers = centers[order]
+        relabel = {"model_name": model_name, "old": [int(o) for o in order], "new": list(range(len(order)))}
+        db.execute(RELABEL_ASSIGNMENTS_SQL, relabel)
+        db.execute(RELABEL_RECOMMENDATIONS_SQL, relabel)
+    labels, distances = nearest(X, centers)
+
+    _save_assignments(db, model_name, session_ids, labels, distances)
+    _save_centers(db, model_name, centers, reset=False)
+    clustering.updated_at = datetime.now()
+    db.commit()
+    return {"model_name": model_name, "mode": "incremental", "sessions": len(session_ids)}
+
+
+def run(db: Session, model_name: Optional[str] = None, full: bool = False, k: int = DEFAULT_K) -> List[Dict]:
+    """Job su un modello o su tutti quelli con sessioni"""
+    if model_name:
+        names = [model_name]
+    else:
+        names = list(db.execute(MODELS_SQL, {"default_model": session_factory.DEFAULT_MODEL}).scalars())
+    return [rebuild(db, name, k) if full else update(db, name, k) for name in names]
+
+
+# ============================================================================
+# LETTURA E RACCOMANDAZIONI
+# ============================================================================
+
+def _profile(columns: List[list], centroid: List[float]) -> Dict[str, Dict[str, float]]:
+    profile: Dict[str, Dict[str, float]] = {}
+    for (process, category), value in zip(columns, centroid):
+        profile.setdefault(process, {})[category] = value
+    return profile
+
+
+def _extremes(columns: List[list], centroid: List[float], n: int = 3) -> Dict[str, List[Dict]]:
+    order = np.argsort(centroid, kind="stable")
+    cell = lambda i: {"process": columns[i][0], "category": columns[i][1], "score": centroid[i]}
+    return {"weakest": [cell(i) for i in order[:n]], "strongest": [cell(i) for i in order[::-1][:n]]}
+
+
+def session_cluster(db: Session, session_id: UUID) -> Optional[Dict]:
+    """
+    Cluster della sessione con il profilo del centroide. Se la sessione non è
+    ancora stata assegnata dal job (o è cambiata) il cluster è calcolato al
+    volo sui centroidi salvati. None se la sessione non esiste; cluster None se
+    il modello non ha un clustering o la sessione non ha punteggi.
+    """
+    S = models.AssessmentSession
+    session = db.query(S.id, S.model_name, S.punteggi_json).filter(S.id == session_id).first()
+    if session is None:
+        return None
+    model_name = session.model_name or session_factory.DEFAULT_MODEL
+    output = {"session_id": str(session_id), "model_name": model_name, "cluster": None}
+    clustering = db.get(models.MaturityClustering, model_name)
+    snapshot = session.punteggi_json or {}
+    if clustering is None or snapshot.get("overall") is None:
+        return output
+
+    C = models.MaturityCluster
+    stored = db.get(models.SessionCluster, session_id)
+    updated_at = snapshot.get("updated_at")
+    if (stored is not None and stored.model_name == model_name
+            and (not updated_at or stored.assigned_at >= datetime.fromisoformat(updated_at))):
+        cluster, distance, assignment = stored.cluster, stored.distance, "stored"
+    else:
+        centers = db.query(C.cluster, C.centroid).filter(C.model_name == model_name).order_by(C.cluster).all()
+        columns = {tuple(c): i for i, c in enumerate(clustering.columns)}
+        labels, distances = nearest(
+            profile_vector(snapshot, columns)[None, :].astype(np.float64),
+            np.array([c.centroid for c in centers], dtype=np.float64),
+        )
+        cluster, distance, assignment = centers[int(labels[0])].cluster, float(distances[0]), "live"
+
+    row = db.query(C).filter(C.model_name == model_name, C.cluster == cluster).first()
+    output.update({
+        "cluster": cluster,
+        "k": clustering.k,
+        "distance": round(float(distance), 4),
+        "assignment": assignment,
+        "size": row.size,
+        "centroid": {
+            "overall": round(float(np.mean(row.centroid)), 2),
+            "by_process_category": _profile(clustering.columns, row.centroid),
+            **_extremes(clustering.columns, row.centroid),
+        },
+        "recommendations": row.recommendations,
+        "recommendations_at": row.recommendations_at.isoformat() if row.recommendations_at else None,
+        "built_at": clustering.built_at.isoformat(),
+        "updated_at": clustering.updated_at.isoformat(),
+    })
+    return output
+
+
+def _recommendation_prompt(model_name: str, cluster, columns: List[list]) -> str:
+    extremes = _extremes(columns, cluster.centroid, n=5)
+    prompt = f"""Sei un consulente senior di trasformazione digitale per aziende italiane.
+
+Un gruppo di {cluster.size} aziende (modello {model_name}) ha un profilo di maturità simile,
+punteggio medio {float(np.mean(cluster.centroid)):.2f}/5.
+
+AREE PIÙ DEBOLI DEL GRUPPO:
+"""
+    for item in extremes["weakest"]:
+        prompt += f"- {item['process']} - {item['category']}: {item['score']:.2f}/5\n"
+    prompt += "\nAREE PIÙ FORTI DEL GRUPPO:\n"
+    for item in extremes["strongest"]:
+        prompt += f"- {item['process']} - {item['category']}: {item['score']:.2f}/5\n"
+    prompt += """
+Scrivi un modello di raccomandazioni valido per tutte le aziende del gruppo:
+priorità, roadmap a 6-12-24 mesi per le aree deboli e come fare leva su quelle forti.
+Rispondi in italiano, in markdown. NON inventare vendor, prezzi o benchmark."""
+    return prompt
+
+
+def generate_recommendations(db: Session, model_name: Optional[str] = None, force: bool = False) -> List[Dict]:
+    """Raccomandazioni una volta per cluster (OpenAI), solo per i cluster che non le hanno già"""
+    import openai
+
+    if not os.getenv("OPENAI_API_KEY"):
+        raise RuntimeError("OPENAI_API_KEY non configurata")
+    openai.api_key = os.getenv("OPENAI_API_KEY")
+    ai_model = os.getenv("OPENAI_MODEL", "gpt-4o")
+
+    C = models.MaturityCluster
+    query = db.query(C)
+    if model_name:
+        query = query.filter(C.model_name == model_name)
+    if not force:
+        query = query.filter(C.recommendations.is_(None))
+    generated = []
+    for cluster in query.order_by(C.model_name, C.cluster).all():
+        clustering = db.get(models.MaturityClustering, cluster.model_name)
+        response = openai.chat.completions.create(
+            model=ai_model,
+            messages=[
+                {"role": "system", "content": "Sei un consulente senior di trasformazione digitale con 15+ anni di esperienza."},
+                {"role": "user", "content": _recommendation_prompt(cluster.model_name, cluster, clustering.columns)},
+            ],
+            max_tokens=3000,
+            temperature=0.5,
+        )
+        cluster.recommendations = response.choices[0].message.content
+        cluster.recommendations_at = datetime.now()
+        db.commit()
+        generated.append({"model_name": cluster.model_name, "cluster": cluster.cluster})
+    return generated
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Cluster dei profili di maturità")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="assegna le sessioni nuove o cambiate (o ricostruisce con --full)")
+    run_parser.add_argument("--full", action="store_true")
+    run_parser.add_argument("--k", type=int, default=DEFAULT_K)
+    run_parser.add_argument("--model")
+    recommendations = commands.add_parser("recommendations", help="genera le raccomandazioni dei cluster")
+    recommendations.add_argument("--model")
+    recommendations.add_argument("--force", action="store_true", help="rigenera anche quelle esistenti")
+    args = parser.parse_args(argv)
+
+    from app.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        if args.command == "run":
+            for result in run(db, args.model, args.full, args.k):
+                print(f"✅ {result}")
+        else:
+            for result in generate_recommendations(db, args.model, args.force):
+                print(f"✅ Raccomandazioni cluster {result['cluster']} di {result['model_name']}")
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
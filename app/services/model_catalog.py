@@ -0,0 +1,133 @@
+"""
+Catalogo dei modelli (frontend/public/*.json) per /api/admin/list-models
+
+Per ogni modello il manifest conserva nome, dimensione, mtime, conteggi
+(processi, attività, domande) e hash del contenuto. Un modello viene riletto
+solo se mtime o dimensione sono cambiati: la lista costa uno stat per file e,
+dopo il primo avvio, nessun parsing JSON. Il manifest è una cache ricostruibile
+(MODEL_CATALOG_PATH) ed è aggiornato subito quando un modello viene salvato.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from app.services import model_store
+
+CATALOG_PATH = Path(os.getenv("MODEL_CATALOG_PATH", Path(tempfile.gettempdir()) / "assessment_model_catalog.json"))
+CATALOG_VERSION = 1
+DEFAULT_MODEL = "i40_assessment_fto"
+
+_entries: Optional[Dict[str, dict]] = None
+_lock = threading.Lock()
+
+
+def _describe(path: Path, stat: os.stat_result) -> dict:
+    """Voce del catalogo: unica lettura completa del file"""
+    raw = path.read_bytes()
+    entry = {
+        "name": path.stem,
+        "filename": path.name,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "hash": hashlib.sha256(raw).hexdigest(),
+        "processes_count": 0,
+        "activities_count": 0,
+        "questions_count": 0,
+    }
+    try:
+        data = json.loads(raw)
+    except ValueError as e:
+        entry["error"] = str(e)
+        return entry
+    if isinstance(data, list):
+        entry["processes_count"] = len(data)
+        entry["activities_count"] = sum(len(p.get("activities", [])) for p in data if isinstance(p, dict))
+        entry["questions_count"] = sum(len(q) for q in model_store.model_categories(data).values())
+    elif isinstance(data, dict):
+        # Formato del parser Excel: una voce "processo::attività" per riga
+        entry["processes_count"] = len(data.get("processes", []))
+        entry["activities_count"] = entry["processes_count"]
+        entry["questions_count"] = sum(len(q) for q in data.get("questions", {}).values())
+    return entry
+
+
+def _read_manifest() -> Dict[str, dict]:
+    try:
+        with open(CATALOG_PATH, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get("version") != CATALOG_VERSION:
+        return {}
+    return manifest.get("models", {})
+
+
+def _write_manifest(entries: Dict[str, dict]) -> None:
+    payload = json.dumps({"version": CATALOG_VERSION, "models": entries}, ensure_ascii=False)
+    try:
+        CATALOG_PATH.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=CATALOG_PATH.parent, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(payload)
+        os.replace(tmp_name, CATALOG_PATH)
+    except OSError as e:
+        # Il catalogo resta valido in memoria; al prossimo avvio viene ricostruito
+        print(f"⚠️ Scrittura catalogo modelli fallita: {e}")
+
+
+def _loaded() -> Dict[str, dict]:
+    global _entries
+    if _entries is None:
+        _entries = _read_manifest()
+    return _entries
+
+
+def _public_entry(entry: dict) -> dict:
+    public = {k: v for k, v in entry.items() if k != "mtime_ns"}
+    public["mtime"] = datetime.fromtimestamp(entry["mtime_ns"] / 1e9).isoformat()
+    public["is_default"] = entry["name"] == DEFAULT_MODEL
+    return public
+
+
+def list_models() -> List[dict]:
+    """Modelli validi ordinati per nome; rilegge solo i file cambiati dall'ultima volta"""
+    with _lock:
+        entries = _loaded()
+        changed = False
+        seen = set()
+        with os.scandir(model_store.MODELS_DIR) as it:
+            for item in it:
+                if not item.name.endswith(".json") or not item.is_file():
+                    continue
+                path = Path(item.path)
+                stat = item.stat()
+                seen.add(path.stem)
+                entry = entries.get(path.stem)
+                if entry is None or entry["mtime_ns"] != stat.st_mtime_ns or entry["size"] != stat.st_size:
+                    entries[path.stem] = _describe(path, stat)
+                    changed = True
+        for name in set(entries) - seen:
+            del entries[name]
+            changed = True
+        if changed:
+            _write_manifest(entries)
+        return [_public_entry(entries[name]) for name in sorted(entries) if "error" not in entries[name]]
+
+
+@model_store.on_model_change
+def refresh_model(model_name: str) -> None:
+    """Aggiorna la voce di un modello appena salvato (chiamata da model_store.model_changed)"""
+    path = model_store.model_path(model_name)
+    with _lock:
+        entries = _loaded()
+        try:
+            entries[model_name] = _describe(path, path.stat())
+        except FileNotFoundError:
+            entries.pop(model_name, None)
+        _write_manifest(entries)
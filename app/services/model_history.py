@@ -0,0 +1,104 @@
+"""
+Storico dei modelli: confronto tra versioni e import delle copie in backups/models
+
+Le versioni (e il loro storage a differenze) sono in model_versions; qui il
+confronto per domanda tra due versioni usato da /api/admin/model-versions e
+l'import una tantum dei backup completi salvati da save-model prima dello
+storico ({modello}_{AAAAMMGG_HHMMSS}.json), con la data del backup come data
+della versione.
+
+Uso (dalla root del repository, con migrations/007 applicata):
+  python -m app.services.model_history import-backups backups/models
+"""
+
+import argparse
+import json
+import re
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from app.services import model_versions
+
+BACKUP_NAME = re.compile(r"^(?P<model>.+)_(?P<stamp>\d{8}_\d{6})\.json$")
+
+Cell = Tuple[str, str, str, str]  # (process, activity, category, dimension)
+
+
+def model_cells(model_data: list) -> Dict[Cell, object]:
+    """Domande del modello (nell'ordine del modello) con il loro valore"""
+    cells: Dict[Cell, object] = {}
+    for process_data in model_data:
+        process_name = process_data.get('process', '')
+        for activity in process_data.get('activities', []):
+            activity_name = activity.get('name', '')
+            for category_name, dimensions in activity.get('categories', {}).items():
+                for dimension_name, value in dimensions.items():
+                    cells.setdefault((process_name, activity_name, category_name, dimension_name), value)
+    return cells
+
+
+def _cell_dict(cell: Cell) -> dict:
+    return dict(zip(("process", "activity", "category", "dimension"), cell))
+
+
+def diff_models(old: list, new: list) -> dict:
+    """Domande aggiunte, tolte e con valore cambiato passando da old a new"""
+    old_cells, new_cells = model_cells(old), model_cells(new)
+    added = [_cell_dict(c) for c in new_cells if c not in old_cells]
+    removed = [_cell_dict(c) for c in old_cells if c not in new_cells]
+    changed = [
+        {**_cell_dict(c), "from": old_cells[c], "to": value}
+        for c, value in new_cells.items()
+        if c in old_cells and old_cells[c] != value
+    ]
+    old_processes = [p.get('process', '') for p in old]
+    new_processes = [p.get('process', '') for p in new]
+    return {
+        "processes_added": [p for p in new_processes if p not in old_processes],
+        "processes_removed": [p for p in old_processes if p not in new_processes],
+        "reordered": [c for c in new_cells if c in old_cells] != [c for c in old_cells if c in new_cells],
+        "added": added,
+        "removed": removed,
+        "changed": changed,
+    }
+
+
+def import_backups(directory: Path) -> List[Tuple[str, str]]:
+    """Pubblica come versioni le copie complete di backups/models, dalla più vecchia; (file, id versione)"""
+    backups = []
+    for path in Path(directory).glob("*.json"):
+        match = BACKUP_NAME.match(path.name)
+        if match:
+            stamp = datetime.strptime(match["stamp"], "%Y%m%d_%H%M%S")
+            backups.append((stamp, match["model"], path))
+
+    imported = []
+    for stamp, model_name, path in sorted(backups):
+        try:
+            model_data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            print(f"⚠️ {path.name} ignorato: {e}")
+            continue
+        imported.append((path.name, model_versions.publish(model_name, model_data, created_at=stamp)))
+    return imported
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Storico dei modelli")
+    commands = parser.add_subparsers(dest="command", required=True)
+    backups = commands.add_parser("import-backups", help="importa le copie complete di backups/models")
+    backups.add_argument("directory", type=Path)
+    args = parser.parse_args(argv)
+
+    if args.command == "import-backups":
+        imported = import_backups(args.directory)
+        for filename, version in imported:
+            print(f"✅ {filename} -> {version[:12]}")
+        print(f"📦 {len(imported)} backup importati in {len(set(v for _, v in imported))} versioni")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,364 @@
+"""
+Migrazione delle sessioni da una versione del modello a un'altra
+
+Quando un modello viene modificato (domanda rinominata, attività aggiunta o
+tolta) le sessioni restano legate alla versione su cui sono state create
+(model_versions). Questo modulo le porta su una versione più recente:
+
+1. plan: confronto delle celle delle due versioni. Le celle uguali hanno lo
+   stesso id in model_dimension e non vanno toccate; tra le celle tolte e
+   quelle aggiunte si riconoscono le rinomine, dal livello più alto:
+   processo, attività e dominio rinominati (stesso contenuto sotto un nome
+   nuovo, almeno GROUP_OVERLAP in comune), poi domande riformulate nello
+   stesso processo/attività/dominio (similarità del testo >= RENAME_SIMILARITY).
+   Le rinomine esplicite passate dal chiamante hanno la precedenza.
+2. apply: per lotti di sessioni, in una transazione per lotto, UPDATE
+   set-based delle risposte (dimension_id vecchio -> nuovo, con gli array
+   della mappatura in unnest), eventuale DELETE delle risposte alle domande
+   tolte, aggiornamento di model_version e ricalcolo degli snapshot punteggi
+   del lotto con una sola lettura delle risposte.
+
+Una risposta già presente sulla cella di destinazione non viene sovrascritta
+(conflitto: la vecchia resta in coda alla griglia come domanda fuori modello).
+Le risposte alle domande tolte restano, fuori modello, a meno di drop_removed.
+Con dry_run si ottiene solo il report (mappatura e conteggi).
+"""
+
+import difflib
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+from uuid import UUID
+
+from sqlalchemy import bindparam, func, or_, select, text, update
+from sqlalchemy.orm import Session
+
+from app import models
+from app.services import answer_grid, dimension_catalog, model_versions, portfolio, session_factory
+from app.services.session_scores import build_score_snapshot
+
+Cell = Tuple[str, str, str, str]  # (process, activity, category, dimension)
+
+# Quota minima di contenuto in comune perché un gruppo sparito e uno nuovo siano una rinomina
+GROUP_OVERLAP = 0.5
+# Similarità minima (difflib) perché una domanda tolta e una aggiunta siano la stessa riformulata
+RENAME_SIMILARITY = 0.6
+
+BATCH_SIZE = 500
+# Oltre questo numero di sessioni chiuse migrate i rollup si ricostruiscono da zero
+ROLLUP_REBUILD_THRESHOLD = 200
+
+REMAP_SQL = text("""
+    UPDATE assessment_answer a SET dimension_id = m.new_id
+    FROM unnest(CAST(:old_ids AS integer[]), CAST(:new_ids AS integer[])) AS m(old_id, new_id)
+    WHERE a.dimension_id = m.old_id
+      AND a.session_id = ANY(CAST(:session_ids AS uuid[]))
+      AND NOT EXISTS (
+          SELECT 1 FROM assessment_answer b
+          WHERE b.session_id = a.session_id AND b.dimension_id = m.new_id
+      )
+""")
+
+DROP_SQL = text("""
+    DELETE FROM assessment_answer
+    WHERE session_id = ANY(CAST(:session_ids AS uuid[])) AND dimension_id = ANY(CAST(:removed_ids AS integer[]))
+""")
+
+COUNT_SQL = """
+    SELECT count(*) FILTER (WHERE a.dimension_id = ANY(CAST(:old_ids AS integer[]))) AS remapped,
+           count(*) FILTER (WHERE a.dimension_id = ANY(CAST(:removed_ids AS integer[]))) AS on_removed,
+           count(*) FILTER (WHERE EXISTS (
+               SELECT 1 FROM unnest(CAST(:old_ids AS integer[]), CAST(:new_ids AS integer[])) AS m(old_id, new_id)
+               JOIN assessment_answer b ON b.dimension_id = m.new_id
+               WHERE m.old_id = a.dimension_id AND b.session_id = a.session_id
+           )) AS conflicts
+    FROM assessment_answer a
+    WHERE a.session_id IN (SELECT id FROM assessment_session s WHERE {session_filter})
+"""
+
+
+class CellMapping(NamedTuple):
+    renamed: List[Tuple[Cell, Cell]]
+    added: List[Cell]
+    removed: List[Cell]
+
+
+class MigrationPlan(NamedTuple):
+    model_name: str
+    from_version: str
+    to_version: str
+    mapping: CellMapping
+    id_map: Dict[int, int]      # dimension_id vecchio -> nuovo (solo celle rinominate)
+    removed_ids: List[int]
+
+
+def _pair_groups(removed: List[Cell], added: List[Cell], level: int, old_keys: set, new_keys: set) -> Dict[Cell, Cell]:
+    """
+    Rinomine al livello `level` (0 processo, 1 attività, 2 dominio): un gruppo
+    che non esiste più nella nuova versione e uno che non esisteva nella
+    vecchia, con lo stesso genitore e abbastanza celle in comune
+    """
+    def groups(cells, missing_keys):
+        out: Dict[tuple, Dict[tuple, Cell]] = {}
+        for cell in cells:
+            key = cell[:level + 1]
+            if key not in missing_keys:
+                out.setdefault(key, {})[cell[level + 1:]] = cell
+        return out
+
+    gone = groups(removed, new_keys)
+    fresh = groups(added, old_keys)
+    candidates = []
+    for old_key, old_rest in gone.items():
+        for new_key, new_rest in fresh.items():
+            if old_key[:level] != new_key[:level]:
+                continue
+            common = old_rest.keys() & new_rest.keys()
+            overlap = len(common) / len(old_rest.keys() | new_rest.keys())
+            if overlap >= GROUP_OVERLAP:
+                candidates.append((overlap, old_key, new_key))
+
+    pairs: Dict[Cell, Cell] = {}
+    used_old, used_new = set(), set()
+    for _, old_key, new_key in sorted(candidates, reverse=True):
+        if old_key in used_old or new_key in used_new:
+            continue
+        used_old.add(old_key)
+        used_new.add(new_key)
+        for rest in gone[old_key].keys() & fresh[new_key].keys():
+            pairs[gone[old_key][rest]] = fresh[new_key][rest]
+    return pairs
+
+
+def _pair_dimensions(removed: List[Cell], added: List[Cell]) -> Dict[Cell, Cell]:
+    """Domande riformulate nello stesso processo/attività/dominio"""
+    by_parent: Dict[tuple, List[Cell]] = {}
+    for cell in added:
+        by_parent.setdefault(cell[:3], []).append(cell)
+
+    candidates = []
+    for old in removed:
+        for new in by_parent.get(old[:3], ()):
+            ratio = difflib.SequenceMatcher(None, old[3], new[3]).ratio()
+            if ratio >= RENAME_SIMILARITY:
+                candidates.append((ratio, old, new))
+
+    pairs: Dict[Cell, Cell] = {}
+    used = set()
+    for _, old, new in sorted(candidates, reverse=True):
+        if old in pairs or new in used:
+            continue
+        pairs[old] = new
+        used.add(new)
+    return pairs
+
+
+def match_cells(old_cells: Sequence[Cell], new_cells: Sequence[Cell], renames: Optional[Dict[Cell, Cell]] = None) -> CellMapping:
+    """Rinomine, aggiunte e rimozioni passando da old_cells a new_cells (nell'ordine dei modelli)"""
+    new_set = set(new_cells)
+    old_set = set(old_cells)
+    removed = [c for c in old_cells if c not in new_set]
+    added = [c for c in new_cells if c not in old_set]
+
+    pairs: Dict[Cell, Cell] = {
+        old: new for old, new in (renames or {}).items() if old in removed and new in added
+    }
+    for level in (0, 1, 2, None):
+        rest_removed = [c for c in removed if c not in pairs]
+        taken = set(pairs.values())
+        rest_added = [c for c in added if c not in taken]
+        if not rest_removed or not rest_added:
+            break
+        if level is None:
+            pairs.update(_pair_dimensions(rest_removed, rest_added))
+        else:
+            old_keys = {c[:level + 1] for c in old_cells}
+            new_keys = {c[:level + 1] for c in new_cells}
+            pairs.update(_pair_groups(rest_removed, rest_added, level, old_keys, new_keys))
+
+    taken = set(pairs.values())
+    return CellMapping(
+        renamed=[(old, pairs[old]) for old in removed if old in pairs],
+        added=[c for c in added if c not in taken],
+        removed=[c for c in removed if c not in pairs],
+    )
+
+
+def plan(model_name: str, from_version: str, to_version: str, renames: Optional[Dict[Cell, Cell]] = None) -> MigrationPlan:
+    old = session_factory.version_template(from_version)
+    new = session_factory.version_template(to_version)
+    if old is None or new is None:
+        raise ValueError("Versione del modello non trovata")
+    mapping = match_cells(old.cells, new.cells, renames)
+    old_ids = dict(zip(old.cells, old.dimension_ids))
+    new_ids = dict(zip(new.cells, new.dimension_ids))
+    return MigrationPlan(
+        model_name=model_name,
+        from_version=from_version,
+        to_version=to_version,
+        mapping=mapping,
+        id_map={old_ids[o]: new_ids[n] for o, n in mapping.renamed},
+        removed_ids=[old_ids[c] for c in mapping.removed],
+    )
+
+
+def _session_filter(model_name: str, from_version: str, include_unversioned: bool):
+    S = models.AssessmentSession
+    version = S.model_version == from_version
+    if include_unversioned:
+        version = or_(version, S.model_version.is_(None))
+    return func.coalesce(S.model_name, session_factory.DEFAULT_MODEL) == model_name, version
+
+
+def _sql_filter(include_unversioned: bool) -> str:
+    version = "s.model_version = :from_version"
+    if include_unversioned:
+        version = f"({version} OR s.model_version IS NULL)"
+    return f"COALESCE(s.model_name, '{session_factory.DEFAULT_MODEL}') = :model_name AND {version}"
+
+
+def _params(p: MigrationPlan) -> Dict:
+    return {
+        "old_ids": list(p.id_map), "new_ids": list(p.id_map.values()), "removed_ids": p.removed_ids,
+        "model_name": p.model_name, "from_version": p.from_version,
+    }
+
+
+def _cell_dict(cell: Cell) -> dict:
+    return dict(zip(("process", "activity", "category", "dimension"), cell))
+
+
+def report(db: Session, p: MigrationPlan, include_unversioned: bool = False) -> Dict:
+    """Mappatura e conteggi della migrazione, senza modificare nulla"""
+    S = models.AssessmentSession
+    sessions = db.execute(
+        select(func.count()).select_from(S).where(*_session_filter(p.model_name, p.from_version, include_unversioned))
+    ).scalar()
+    counts = db.execute(text(COUNT_SQL.format(session_filter=_sql_filter(include_unversioned))), _params(p)).first()
+    return {
+        "from_version": p.from_version,
+        "to_version": p.to_version,
+        "sessions": sessions,
+        "renamed": [{"from": _cell_dict(o), "to": _cell_dict(n)} for o, n in p.mapping.renamed],
+        "added": [_cell_dict(c) for c in p.mapping.added],
+        "removed": [_cell_dict(c) for c in p.mapping.removed],
+        "answers_remapped": counts.remapped - counts.conflicts,
+        "answers_conflicting": counts.conflicts,
+        "answers_on_removed": counts.on_removed,
+    }
+
+
+def _refresh_snapshots(db: Session, session_ids: List[UUID], template: session_factory.AnswerTemplate) -> None:
+    """Snapshot punteggi di un lotto di sessioni con una sola lettura delle risposte"""
+    A = models.AssessmentAnswer
+    rows_by_session: Dict[UUID, list] = {session_id: [] for session_id in session_ids}
+    for row in db.execute(
+        select(A.session_id, A.dimension_id, A.score, A.note, A.is_not_applicable).where(A.session_id.in_(session_ids))
+    ):
+        rows_by_session[row.session_id].append(row)
+
+    extra_ids = {r.dimension_id for rows in rows_by_session.values() for r in rows if r.dimension_id not in template.positions}
+    extra_cells = dimension_catalog.cells_by_id(db, extra_ids)
+
+    values = []
+    for session_id, rows in rows_by_session.items():
+        aggregate = [
+            (process, category, s.score_sum, s.applicable, s.not_applicable)
+            for (process, category), s in answer_grid.process_category_stats(rows, template, extra_cells).items()
+        ]
+        values.append({"b_id": session_id, "b_snapshot": build_score_snapshot(aggregate)})
+    S = models.AssessmentSession.__table__
+    db.execute(update(S).where(S.c.id == bindparam("b_id")).values(punteggi_json=bindparam("b_snapshot")), values)
+
+
+def apply(db: Session, p: MigrationPlan, include_unversioned: bool = False, drop_removed: bool = False,
+          batch_size: int = BATCH_SIZE) -> Dict:
+    """Migra le sessioni della versione p.from_version a p.to_version, una transazione per lotto"""
+    S = models.AssessmentSession
+    template = session_factory.version_template(p.to_version)
+    params = _params(p)
+    conditions = _session_filter(p.model_name, p.from_version, include_unversioned)
+    migrated = remapped = dropped = 0
+    closed: List[UUID] = []
+    last_id = None
+
+    while True:
+        query = select(S.id, S.data_chiusura).where(*conditions).order_by(S.id).limit(batch_size)
+        if last_id is not None:
+            query = query.where(S.id > last_id)
+        batch = db.execute(query).all()
+        if not batch:
+            break
+        session_ids = [row.id for row in batch]
+        last_id = session_ids[-1]
+        batch_params = {**params, "session_ids": [str(s) for s in session_ids]}
+        try:
+            if p.id_map:
+                remapped += db.execute(REMAP_SQL, batch_params).rowcount
+            if drop_removed and p.removed_ids:
+                dropped += db.execute(DROP_SQL, batch_params).rowcount
+            db.execute(update(S).where(S.id.in_(session_ids)).values(model_version=p.to_version))
+            _refresh_snapshots(db, session_ids, template)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        migrated += len(session_ids)
+        closed.extend(row.id for row in batch if row.data_chiusura is not None)
+
+    # Lo snapshot delle sessioni chiuse è cambiato: riallinea i rollup di portafoglio
+    if len(closed) > ROLLUP_REBUILD_THRESHOLD:
+        portfolio.rebuild_rollups(db)
+    elif closed:
+        for session_id in closed:
+            portfolio.sync_session_rollup(db, session_id, commit=False)
+        db.commit()
+
+    return {"sessions_migrated": migrated, "answers_remapped": remapped, "answers_dropped": dropped}
+
+
+def source_versions(db: Session, model_name: str, to_version: str) -> List[str]:
+    """Versioni del modello (diverse da to_version) con almeno una sessione legata"""
+    S = models.AssessmentSession
+    rows = db.execute(
+        select(S.model_version).distinct()
+        .where(func.coalesce(S.model_name, session_factory.DEFAULT_MODEL) == model_name)
+        .where(S.model_version.is_not(None), S.model_version != to_version)
+    ).scalars()
+    return list(rows)
+
+
+def migrate_model(
+    db: Session,
+    model_name: str,
+    to_version: Optional[str] = None,
+    from_version: Optional[str] = None,
+    renames: Optional[Dict[Cell, Cell]] = None,
+    include_unversioned: bool = False,
+    drop_removed: bool = False,
+    dry_run: bool = True,
+    batch_size: int = BATCH_SIZE,
+) -> Dict:
+    """
+    Migra alla versione to_version (default: quella corrente) le sessioni di
+    from_version (default: tutte le altre versioni). include_unversioned tratta
+    le sessioni senza versione come create su from_version (obbligatoria).
+    """
+    if include_unversioned and not from_version:
+        raise ValueError("include_unversioned richiede from_version")
+    to_version = to_version or model_versions.current_version(model_name)
+    if to_version is None:
+        raise ValueError(f"Modello {model_name} non trovato")
+    for version in filter(None, (to_version, from_version)):
+        if model_versions.version_model_name(version) != model_name:
+            raise ValueError(f"Versione {version[:12]} di {model_name} non trovata")
+
+    sources = [from_version] if from_version else source_versions(db, model_name, to_version)
+    results = []
+    for source in sources:
+        if source == to_version and not include_unversioned:
+            continue
+        p = plan(model_name, source, to_version, renames)
+        item = report(db, p, include_unversioned)
+        if not dry_run:
+            item.update(apply(db, p, include_unversioned, drop_removed, batch_size))
+        results.append(item)
+    return {"model_name": model_name, "to_version": to_version, "dry_run": dry_run, "migrations": results}
@@ -0,0 +1,145 @@
+"""
+Accesso ai modelli di assessment (frontend/public/<nome>.json)
+
+Il JSON viene riletto solo quando il file cambia (mtime/dimensione), così gli
+endpoint che usano il modello a ogni richiesta non rifanno parsing e I/O.
+
+Chi tiene derivati del modello su disco (es. i template Excel) si registra con
+on_model_change e viene avvisato da model_changed quando un modello è riscritto.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+MODELS_DIR = Path("frontend/public")
+# Copia servita direttamente da nginx, aggiornata solo se la build esiste
+DIST_DIR = Path("frontend/dist")
+
+DOMAINS = ["Governance", "Monitoring & Control", "Technology", "Organization"]
+
+_cache: Dict[str, Tuple[Tuple[int, int], list]] = {}
+_hash_cache: Dict[str, Tuple[Tuple[int, int], str]] = {}
+_cache_lock = threading.Lock()
+_listeners: List[Callable[[str], None]] = []
+
+
+def model_path(model_name: str) -> Path:
+    return MODELS_DIR / f"{model_name}.json"
+
+
+def load_model(model_name: str) -> Optional[list]:
+    """Modello parsato (condiviso: non modificarlo), None se il file non esiste"""
+    path = model_path(model_name)
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    signature = (stat.st_mtime_ns, stat.st_size)
+
+    with _cache_lock:
+        cached = _cache.get(model_name)
+        if cached and cached[0] == signature:
+            return cached[1]
+
+    with open(path, "r", encoding="utf-8") as f:
+        model_data = json.load(f)
+
+    with _cache_lock:
+        _cache[model_name] = (signature, model_data)
+    return model_data
+
+
+def model_hash(model_name: str) -> Optional[str]:
+    """SHA-256 del contenuto del file, None se il file non esiste"""
+    path = model_path(model_name)
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    signature = (stat.st_mtime_ns, stat.st_size)
+
+    with _cache_lock:
+        cached = _hash_cache.get(model_name)
+        if cached and cached[0] == signature:
+            return cached[1]
+
+    digest = hashlib.sha256(path.read_bytes()).hexdigest()
+
+    with _cache_lock:
+        _hash_cache[model_name] = (signature, digest)
+    return digest
+
+
+def _replace_file(target: Path, payload: bytes) -> None:
+    fd, tmp_name = tempfile.mkstemp(dir=target.parent, prefix=f".{target.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+        os.chmod(tmp_name, 0o644)
+        os.replace(tmp_name, target)
+    except Exception:
+        if os.path.exists(tmp_name):
+            os.unlink(tmp_name)
+        raise
+
+
+def write_model(model_name: str, model_data: list) -> Path:
+    """
+    Serializza il modello una volta e lo sostituisce atomicamente (file temporaneo
+    + rename) in frontend/public e, se presente, in frontend/dist; poi invalida
+    le cache. I lettori vedono sempre il file vecchio o quello nuovo, mai a metà.
+    """
+    payload = json.dumps(model_data, ensure_ascii=False, indent=2).encode("utf-8")
+    MODELS_DIR.mkdir(parents=True, exist_ok=True)
+    target = model_path(model_name)
+    _replace_file(target, payload)
+    if DIST_DIR.exists():
+        _replace_file(DIST_DIR / target.name, payload)
+    model_changed(model_name)
+    return target
+
+
+def invalidate(model_name: Optional[str] = None) -> None:
+    """Svuota la cache (di un modello o di tutti)"""
+    with _cache_lock:
+        if model_name is None:
+            _cache.clear()
+            _hash_cache.clear()
+        else:
+            _cache.pop(model_name, None)
+            _hash_cache.pop(model_name, None)
+
+
+def on_model_change(callback: Callable[[str], None]) -> Callable[[str], None]:
+    """Registra una funzione chiamata con il nome del modello riscritto"""
+    _listeners.append(callback)
+    return callback
+
+
+def model_changed(model_name: str) -> None:
+    """Da chiamare dopo aver riscritto il file di un modello"""
+    invalidate(model_name)
+    for callback in list(_listeners):
+        try:
+            callback(model_name)
+        except Exception as e:
+            print(f"⚠️ Invalidazione derivati modello {model_name} fallita: {e}")
+
+
+def model_categories(model_data: list) -> Dict[str, List[str]]:
+    """Domande per dominio, lette dalla prima attività del primo processo"""
+    categories = {domain: [] for domain in DOMAINS}
+    if model_data and len(model_data) > 0:
+        first_process = model_data[0]
+        if 'activities' in first_process and len(first_process['activities']) > 0:
+            first_activity = first_process['activities'][0]
+            if 'categories' in first_activity:
+                for cat_name, questions in first_activity['categories'].items():
+                    if cat_name in categories:
+                        categories[cat_name] = list(questions.keys())
+    return categories
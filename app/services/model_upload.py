@@ -0,0 +1,246 @@
+"""
+Import di un modello da Excel (upload /api/admin/upload-excel-model)
+
+Il file caricato non viene copiato su un percorso fisso: si parsa direttamente
+il file temporaneo dell'upload in un thread, si converte nel formato frontend e
+si scrive il JSON una volta sola con model_store.write_model (atomico, cache
+invalidate). I workbook grandi vengono importati in background: l'endpoint
+risponde subito con un job id interrogabile su /api/admin/upload-jobs/{job_id}.
+
+Il corpo multipart è ricevuto da receive_upload e non da FastAPI: i byte
+sono contati mentre arrivano e la richiesta è interrotta appena supera
+MAX_UPLOAD_SIZE, senza ricevere né scrivere su disco il resto del file.
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from typing import Dict, Optional
+
+from starlette.datastructures import UploadFile
+from starlette.formparsers import MultiPartParser
+from starlette.requests import Request
+
+from app.services import model_store
+from app.services.excel_parser import ExcelAssessmentParser
+
+# Dimensione massima accettata per un workbook
+MAX_UPLOAD_SIZE = int(os.getenv("MODEL_UPLOAD_MAX_BYTES", 20 * 1024 * 1024))
+# Oltre questa dimensione l'import diventa un job in background
+ASYNC_UPLOAD_SIZE = int(os.getenv("MODEL_UPLOAD_ASYNC_BYTES", 2 * 1024 * 1024))
+# Parte dell'upload tenuta in RAM prima di passare al disco
+SPOOL_MAX_SIZE = 1024 * 1024
+# Margine per intestazioni e boundary del multipart oltre al file
+MULTIPART_OVERHEAD = 64 * 1024
+# Job conclusi conservati per la consultazione
+JOB_TTL_SECONDS = 3600
+
+_jobs: Dict[str, dict] = {}
+_jobs_lock = threading.Lock()
+
+
+class ModelImportError(ValueError):
+    """Workbook letto ma non valido come modello (errore del client)"""
+
+
+class UploadTooLarge(ValueError):
+    """Upload oltre MAX_UPLOAD_SIZE (received: byte ricevuti o dichiarati)"""
+
+    def __init__(self, received: int):
+        super().__init__(f"File troppo grande (oltre {received // 1024} KB, massimo {MAX_UPLOAD_SIZE // 1024} KB)")
+        self.received = received
+
+
+def convert_parser_to_frontend_format(parsed_data: dict) -> list:
+    """
+    Converte il formato del parser Excel nel formato atteso dal frontend
+
+    Parser format:
+    {
+      "questions": {"Governance": [...], ...},
+      "processes": [{"name": "...", "categories": {"Governance": [scores]}}]
+    }
+
+    Frontend format:
+    [
+      {
+        "process": "PROCESSO",
+        "activities": [
+          {
+            "name": "activity",
+            "categories": {
+              "Governance": {"domanda1": score1, ...}
+            }
+          }
+        ]
+      }
+    ]
+    """
+    frontend_data = []
+    questions = parsed_data.get("questions", {})
+    processes_raw = parsed_data.get("processes", [])
+
+    # Raggruppa per processo
+    processes_dict = {}
+    for proc in processes_raw:
+        proc_name_parts = proc["name"].split("::")
+        if len(proc_name_parts) == 2:
+            process, activity = proc_name_parts
+        else:
+            # Se non ha ::, usa il primo processo come default
+            process = "GENERALE"
+            activity = proc["name"]
+
+        if process not in processes_dict:
+            processes_dict[process] = []
+
+        # Converti categories da array a dict domanda->valore
+        activity_data = {
+            "name": activity,
+            "categories": {}
+        }
+
+        for cat_name, scores in proc["categories"].items():
+            if cat_name in questions:
+                cat_questions = questions[cat_name]
+                activity_data["categories"][cat_name] = {}
+
+                for i, score in enumerate(scores):
+                    if i < len(cat_questions) and score is not None:
+                        question = cat_questions[i]
+                        if question != "note":  # Salta colonne note
+                            activity_data["categories"][cat_name][question] = float(score)
+
+        processes_dict[process].append(activity_data)
+
+    # Converti in formato finale
+    for process, activities in processes_dict.items():
+        frontend_data.append({
+            "process": process,
+            "activities": activities
+        })
+
+    return frontend_data
+
+
+async def receive_upload(request: Request, field: str = "file") -> UploadFile:
+    """
+    Riceve il multipart in streaming in un file temporaneo (SpooledTemporaryFile)
+    con un contatore dei byte: UploadTooLarge subito se Content-Length supera il
+    limite, altrimenti appena i byte ricevuti lo superano. Il chiamante chiude il file.
+    """
+    limit = MAX_UPLOAD_SIZE + MULTIPART_OVERHEAD
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > limit:
+        raise UploadTooLarge(int(length))
+    if not request.headers.get("content-type", "").startswith("multipart/form-data"):
+        raise ModelImportError("Richiesta multipart/form-data attesa")
+
+    async def limited():
+        received = 0
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > limit:
+                raise UploadTooLarge(received)
+            yield chunk
+
+    form = await MultiPartParser(request.headers, limited(), max_files=1, max_fields=10).parse()
+    upload = form.get(field)
+    if not isinstance(upload, UploadFile):
+        await form.close()
+        raise ModelImportError(f"Campo '{field}' mancante nell'upload")
+    return upload
+
+
+def upload_size(fileobj) -> int:
+    """Dimensione di un file aperto, senza leggerlo"""
+    position = fileobj.tell()
+    fileobj.seek(0, os.SEEK_END)
+    size = fileobj.tell()
+    fileobj.seek(position)
+    return size
+
+
+def spool_copy(fileobj) -> tempfile.SpooledTemporaryFile:
+    """Copia dell'upload che sopravvive alla richiesta (per i job in background)"""
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    fileobj.seek(0)
+    shutil.copyfileobj(fileobj, spool)
+    spool.seek(0)
+    return spool
+
+
+def import_workbook(fileobj, filename: str, model_name: str) -> dict:
+    """Parsa, valida, converte e salva il modello; restituisce le statistiche dell'import"""
+    fileobj.seek(0)
+    parser = ExcelAssessmentParser()
+    parsed_data = parser.parse_excel_file(fileobj, filename=filename)
+
+    is_valid, errors = parser.validate_parsed_data(parsed_data)
+    if not is_valid:
+        raise ModelImportError(f"Excel non valido: {', '.join(errors)}")
+
+    model_store.write_model(model_name, convert_parser_to_frontend_format(parsed_data))
+    return {
+        "json_file": f"{model_name}.json",
+        "stats": {
+            "processes": len(parsed_data.get("processes", [])),
+            "dimensions": len(parsed_data.get("dimensions", [])),
+            "questions_total": sum(len(q) for q in parsed_data.get("questions", {}).values())
+        }
+    }
+
+
+def _prune_jobs(now: float) -> None:
+    expired = [
+        job_id for job_id, job in _jobs.items()
+        if job["finished_at"] and now - job["finished_at"] > JOB_TTL_SECONDS
+    ]
+    for job_id in expired:
+        del _jobs[job_id]
+
+
+def create_job(model_name: str, filename: str, size: int) -> dict:
+    now = time.time()
+    job = {
+        "job_id": uuid.uuid4().hex,
+        "status": "queued",
+        "model_name": model_name,
+        "filename": filename,
+        "size": size,
+        "created_at": now,
+        "finished_at": None,
+        "result": None,
+        "error": None,
+    }
+    with _jobs_lock:
+        _prune_jobs(now)
+        _jobs[job["job_id"]] = job
+    return dict(job)
+
+
+def get_job(job_id: str) -> Optional[dict]:
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        return dict(job) if job else None
+
+
+def _update_job(job_id: str, **changes) -> None:
+    with _jobs_lock:
+        if job_id in _jobs:
+            _jobs[job_id].update(changes)
+
+
+def run_job(job_id: str, spool, filename: str, model_name: str) -> None:
+    """Esegue l'import di un job (in un thread: BackgroundTasks con funzione sincrona)"""
+    _update_job(job_id, status="running")
+    try:
+        result = import_workbook(spool, filename, model_name)
+        _update_job(job_id, status="done", result=result, finished_at=time.time())
+    except Exception as e:
+        _update_job(job_id, status="error", error=str(e), finished_at=time.time())
+    finally:
+        spool.close()
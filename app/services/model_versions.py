@@ -0,0 +1,271 @@
+"""
+Versioni immutabili dei modelli, indirizzate per contenuto (tabella model_version, migrations/006-007)
+
+L'id di una versione è lo SHA-256 del nome del modello più il JSON in forma
+canonica (compatta, UTF-8, ordine delle chiavi invariato): salvare due volte
+lo stesso contenuto non crea una nuova versione. Il nome fa parte dell'id
+perché il catalogo delle domande (model_dimension) è per modello.
+Ogni sessione è legata alla versione corrente al momento della creazione
+(assessment_session.model_version), quindi risposte, radar, PDF ed export
+usano sempre il modello su cui la sessione è stata compilata anche se il file
+in frontend/public viene riscritto.
+
+Le versioni sono anche lo storico dei modelli (al posto delle copie complete
+in backups/models): una nuova versione è salvata come differenza per righe
+rispetto all'ultima versione del modello, compressa con zlib; ogni
+KEYFRAME_INTERVAL versioni (o quando la differenza non conviene) si salva il
+testo completo compresso. Per ricostruire una versione si legge la catena
+fino al keyframe con una query e si applicano le differenze.
+
+Le versioni non cambiano mai: contenuto e derivati (es. il template delle
+risposte in session_factory) si tengono in cache per id senza invalidazione.
+Una versione è pubblicata la prima volta che serve il modello corrente e
+subito dopo ogni salvataggio (model_store.on_model_change).
+Le sessioni create prima della migrazione (model_version NULL) continuano a
+usare il file corrente.
+"""
+
+import difflib
+import hashlib
+import json
+import threading
+import zlib
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app import database, models
+from app.services import model_store
+
+# Lunghezza massima della catena di differenze prima di un nuovo keyframe
+KEYFRAME_INTERVAL = 16
+
+_contents: Dict[str, list] = {}
+_current: Dict[str, Tuple[str, str]] = {}  # model_name -> (hash del file, id versione)
+_lock = threading.Lock()
+
+CHAIN_SQL = text("""
+    WITH RECURSIVE chain AS (
+        SELECT id, base_id, content::text AS content, payload, 0 AS n
+        FROM model_version WHERE id = :version_id
+        UNION ALL
+        SELECT v.id, v.base_id, v.content::text, v.payload, chain.n + 1
+        FROM model_version v JOIN chain ON v.id = chain.base_id
+    )
+    SELECT id, base_id, content, payload FROM chain ORDER BY n DESC
+""")
+
+
+def canonical_bytes(model_data) -> bytes:
+    return json.dumps(model_data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def model_lines(model_data) -> List[str]:
+    """Testo del modello per righe, nello stesso formato del file (model_store.write_model)"""
+    return json.dumps(model_data, ensure_ascii=False, indent=2).split("\n")
+
+
+def _digest(model_name: str, payload: bytes) -> str:
+    digest = hashlib.sha256(model_name.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(payload)
+    return digest.hexdigest()
+
+
+def version_id(model_name: str, model_data) -> str:
+    return _digest(model_name, canonical_bytes(model_data))
+
+
+def encode_delta(base_lines: List[str], lines: List[str]) -> bytes:
+    """Differenza compressa: [inizio, fine] copia righe dalla base, una lista di stringhe le inserisce"""
+    ops = []
+    matcher = difflib.SequenceMatcher(None, base_lines, lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append([i1, i2])
+        elif j2 > j1:
+            ops.append(lines[j1:j2])
+    return zlib.compress(json.dumps(ops, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), 9)
+
+
+def apply_delta(base_lines: List[str], delta: bytes) -> List[str]:
+    lines: List[str] = []
+    for op in json.loads(zlib.decompress(delta)):
+        if op and isinstance(op[0], int):
+            lines.extend(base_lines[op[0]:op[1]])
+        else:
+            lines.extend(op)
+    return lines
+
+
+def _latest(conn, model_name: str):
+    V = models.ModelVersion.__table__
+    return conn.execute(
+        select(V.c.id, V.c.depth)
+        .where(V.c.model_name == model_name)
+        .order_by(V.c.created_at.desc())
+        .limit(1)
+    ).first()
+
+
+def _encode(conn, model_name: str, model_data: list) -> Dict:
+    """Colonne di storage della nuova versione: delta sull'ultima versione del modello o keyframe"""
+    lines = model_lines(model_data)
+    full = zlib.compress("\n".join(lines).encode("utf-8"), 9)
+    row = {"base_id": None, "depth": 0, "payload": full}
+
+    latest = _latest(conn, model_name)
+    if latest is not None and latest.depth + 1 < KEYFRAME_INTERVAL:
+        base_data = load_version(latest.id)
+        if base_data is not None:
+            delta = encode_delta(model_lines(base_data), lines)
+            if len(delta) < len(full):
+                row = {"base_id": latest.id, "depth": latest.depth + 1, "payload": delta}
+    row["stored_size"] = len(row["payload"])
+    return row
+
+
+def publish(model_name: str, model_data: list, created_at: Optional[datetime] = None) -> str:
+    """Registra il contenuto come versione (se non esiste già) e ne restituisce l'id"""
+    payload = canonical_bytes(model_data)
+    vid = _digest(model_name, payload)
+    with _lock:
+        if vid in _contents:
+            return vid
+
+    V = models.ModelVersion.__table__
+    # Transazione propria: la versione esiste anche se la richiesta fa rollback
+    with database.engine.begin() as conn:
+        exists = conn.execute(select(V.c.id).where(V.c.id == vid)).first()
+        if exists is None:
+            values = {"id": vid, "model_name": model_name, "size": len(payload), **_encode(conn, model_name, model_data)}
+            if created_at is not None:
+                values["created_at"] = created_at
+            conn.execute(pg_insert(V).values(**values).on_conflict_do_nothing(index_elements=["id"]))
+    with _lock:
+        _contents[vid] = model_data
+    return vid
+
+
+def current_version(model_name: str) -> Optional[str]:
+    """Id della versione del file corrente del modello (pubblicata se nuova), None se il modello non esiste"""
+    file_hash = model_store.model_hash(model_name)
+    if file_hash is None:
+        return None
+    with _lock:
+        cached = _current.get(model_name)
+        if cached and cached[0] == file_hash:
+            return cached[1]
+
+    model_data = model_store.load_model(model_name)
+    if model_data is None:
+        return None
+    vid = publish(model_name, model_data)
+    with _lock:
+        _current[model_name] = (file_hash, vid)
+    return vid
+
+
+def load_version(vid: str) -> Optional[list]:
+    """Contenuto di una versione (condiviso: non modificarlo), None se non esiste"""
+    with _lock:
+        if vid in _contents:
+            return _contents[vid]
+    with database.engine.connect() as conn:
+        chain = conn.execute(CHAIN_SQL, {"version_id": vid}).all()
+    if not chain:
+        return None
+
+    # Dal keyframe alla versione richiesta, ripartendo dall'ultima già in cache
+    start = 0
+    with _lock:
+        for i in range(len(chain) - 1, -1, -1):
+            if chain[i].id in _contents:
+                start = i
+                break
+        base_data = _contents.get(chain[start].id)
+
+    lines = None
+    for i in range(start, len(chain)):
+        row = chain[i]
+        if i == start and base_data is not None:
+            lines = model_lines(base_data)
+        elif row.content is not None:
+            lines = model_lines(json.loads(row.content))
+        elif row.base_id is None:
+            lines = zlib.decompress(row.payload).decode("utf-8").split("\n")
+        else:
+            lines = apply_delta(lines, row.payload)
+
+    content = json.loads("\n".join(lines))
+    with _lock:
+        _contents[vid] = content
+    return content
+
+
+def version_model_name(vid: str) -> Optional[str]:
+    with database.engine.connect() as conn:
+        return conn.execute(
+            select(models.ModelVersion.model_name).where(models.ModelVersion.id == vid)
+        ).scalar()
+
+
+def previous_version(vid: str) -> Optional[str]:
+    """Versione dello stesso modello pubblicata subito prima di vid"""
+    V = models.ModelVersion.__table__
+    target = select(V.c.model_name, V.c.created_at).where(V.c.id == vid).subquery()
+    with database.engine.connect() as conn:
+        return conn.execute(
+            select(V.c.id)
+            .join(target, V.c.model_name == target.c.model_name)
+            .where(V.c.created_at < target.c.created_at)
+            .order_by(V.c.created_at.desc())
+            .limit(1)
+        ).scalar()
+
+
+def session_model(model_name: Optional[str], vid: Optional[str]) -> Optional[list]:
+    """Modello di una sessione: la versione a cui è legata, altrimenti il file corrente"""
+    if vid:
+        content = load_version(vid)
+        if content is not None:
+            return content
+    return model_store.load_model(model_name or "i40_assessment_fto")
+
+
+def list_versions(db: Session, model_name: str) -> List[dict]:
+    """Versioni pubblicate di un modello, dalla più recente, con il numero di sessioni legate"""
+    V, S = models.ModelVersion, models.AssessmentSession
+    current = current_version(model_name)
+    sessions = (
+        select(S.model_version, func.count().label("n"))
+        .group_by(S.model_version)
+        .subquery()
+    )
+    rows = db.execute(
+        select(V.id, V.base_id, V.size, V.stored_size, V.created_at, sessions.c.n)
+        .outerjoin(sessions, sessions.c.model_version == V.id)
+        .where(V.model_name == model_name)
+        .order_by(V.created_at.desc())
+    ).all()
+    return [
+        {
+            "version": row.id,
+            "base": row.base_id,
+            "size": row.size,
+            "stored_size": row.stored_size,
+            "created_at": row.created_at.isoformat() if row.created_at else None,
+            "sessions": row.n or 0,
+            "is_current": row.id == current,
+        }
+        for row in rows
+    ]
+
+
+@model_store.on_model_change
+def publish_saved_model(model_name: str) -> None:
+    """Pubblica subito la versione appena salvata (chiamata da model_store.model_changed)"""
+    current_version(model_name)
@@ -13,6 +13,9 @@ matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import numpy as np
 
+# Colonne delle tabelle Processi × Domini (benchmark e confronto)
+TABLE_DOMAINS = ['Governance', 'Monitoring & Control', 'Technology', 'Organization']
+
 
 class PDFReportGenerator:
     def __init__(self):
@@ -72,6 +75,24 @@ class PDFReportGenerator:
         page_num += 1
         c.showPage()
 
+        # Pagina Benchmark: percentili rispetto ai pari (solo se ci sono abbastanza sessioni chiuse)
+        benchmark = stats_data.get('benchmark') or {}
+        if benchmark.get('peer_group') and benchmark.get('overall'):
+            self._draw_report_page(c)
+            self._add_benchmark_page(c, benchmark)
+            self._add_page_number(c, page_num)
+            page_num += 1
+            c.showPage()
+
+        # Pagina Confronto: variazioni rispetto a un assessment precedente (solo se richiesto)
+        comparison = stats_data.get('comparison')
+        if comparison:
+            self._draw_report_page(c)
+            self._add_comparison_page(c, comparison)
+            self._add_page_number(c, page_num)
+            page_num += 1
+            c.showPage()
+
         # Pagine successive: Strengths & Weaknesses (una per processo)
         page_num = self._add_strengths_weaknesses(c, stats_data, results_data, page_num)
         
@@ -447,6 +468,189 @@ class PDFReportGenerator:
                 preserveAspectRatio=True,
             )
 
+    def _draw_table_page_heading(self, c: canvas.Canvas, title: str, subtitle: str, summary: str) -> float:
+        """Titolo centrato, sottotitolo e riga di sintesi; restituisce la y sotto la sintesi"""
+        c.setFont('Helvetica-Bold', 36)
+        c.setFillColor(colors.HexColor('#3DBFBF'))
+        title_width = c.stringWidth(title, 'Helvetica-Bold', 36)
+        c.drawString((self.page_width - title_width) / 2, self.page_height - 100, title)
+
+        y_pos = self.page_height - self.margin_top - 2 * cm - 30
+        c.setFont('Helvetica-Bold', 16)
+        c.setFillColor(colors.HexColor('#2C3E50'))
+        c.drawString(self.margin_left, y_pos, subtitle)
+
+        y_pos -= 22
+        c.setFont('Helvetica', 10)
+        c.setFillColor(colors.HexColor('#333333'))
+        c.drawString(self.margin_left, y_pos, summary)
+        return y_pos
+
+    def _draw_process_domain_table(self, c: canvas.Canvas, y_pos: float, rows: List, color_fn, label_fn) -> float:
+        """
+        Tabella Processi × Domini (+ Totale): rows è una lista di
+        (processo, [valore per dominio in TABLE_DOMAINS], totale); ogni cella
+        è colorata con color_fn(valore) e riporta label_fn(valore).
+        Restituisce la y dell'ultima riga.
+        """
+        headers = ['Processo', 'Governance', 'M&C', 'Technology', 'Organization', 'Totale']
+        col_widths = [4.5 * cm] + [2.5 * cm] * 5
+        row_height = 0.8 * cm
+
+        y_pos -= 1.2 * cm
+        x = self.margin_left
+        c.setFont('Helvetica-Bold', 9)
+        for header, width in zip(headers, col_widths):
+            c.setFillColor(colors.HexColor('#3DBFBF'))
+            c.rect(x, y_pos, width, row_height, fill=1, stroke=0)
+            c.setFillColor(colors.white)
+            c.drawCentredString(x + width / 2, y_pos + 0.28 * cm, header)
+            x += width
+
+        for process, values, total in rows:
+            y_pos -= row_height
+            x = self.margin_left
+            c.setFillColor(colors.HexColor('#2C3E50'))
+            c.setFont('Helvetica-Bold', 9)
+            c.drawString(x + 0.2 * cm, y_pos + 0.28 * cm, process[:28])
+            x += col_widths[0]
+            c.setFont('Helvetica', 9)
+            for value, width in zip(values + [total], col_widths[1:]):
+                c.setFillColor(color_fn(value))
+                c.rect(x + 1, y_pos + 1, width - 2, row_height - 2, fill=1, stroke=0)
+                c.setFillColor(colors.HexColor('#333333'))
+                c.drawCentredString(x + width / 2, y_pos + 0.28 * cm, label_fn(value))
+                x += width
+        return y_pos
+
+    def _add_benchmark_page(self, c: canvas.Canvas, benchmark: Dict):
+        """Tabella percentili Processi × Domini rispetto al gruppo di pari"""
+        group = benchmark['peer_group']
+        group_labels = {
+            'peer': 'stesso settore e dimensione',
+            'settore': 'stesso settore',
+            'dimensione': 'stessa dimensione',
+            'all': 'tutte le aziende',
+        }
+        group_value = (group.get('value') or '').replace('|', ' / ')
+        subtitle = f"Percentile vs {group_labels.get(group['type'], group['type'])}"
+        if group_value:
+            subtitle += f" ({group_value})"
+
+        overall = benchmark['overall']
+        y_pos = self._draw_table_page_heading(
+            c, "BENCHMARK", subtitle,
+            f"Punteggio complessivo {overall['score']} - percentile {overall['percentile']} "
+            f"(mediana pari {overall['peer_median']}, {group['peers']} aziende)"
+        )
+
+        def percentile_color(pct):
+            if pct is None:
+                return colors.HexColor('#F3F4F6')
+            if pct < 25:
+                return colors.HexColor('#FECACA')
+            if pct < 50:
+                return colors.HexColor('#FEF3C7')
+            if pct < 75:
+                return colors.HexColor('#D1FAE5')
+            return colors.HexColor('#A7F3D0')
+
+        def percentile(cell):
+            return cell.get('percentile') if cell else None
+
+        rows = [
+            (process,
+             [percentile(benchmark['by_process_category'].get(process, {}).get(d)) for d in TABLE_DOMAINS],
+             percentile(benchmark['by_process'].get(process)))
+            for process in benchmark['by_process']
+        ]
+        rows.append(('TOTALE', [percentile(benchmark['by_category'].get(d)) for d in TABLE_DOMAINS],
+                     percentile(overall)))
+        y_pos = self._draw_process_domain_table(
+            c, y_pos, rows, percentile_color, lambda pct: f"P{pct}" if pct is not None else "-"
+        )
+
+        y_pos -= 1 * cm
+        c.setFont('Helvetica-Oblique', 8)
+        c.setFillColor(colors.HexColor('#666666'))
+        c.drawString(
+            self.margin_left, y_pos,
+            "Percentile = quota di aziende del gruppo con punteggio inferiore (sessioni chiuse)."
+        )
+
+    def _add_comparison_page(self, c: canvas.Canvas, comparison: Dict):
+        """Variazioni Processi × Domini rispetto all'assessment precedente e attività più migliorate/peggiorate"""
+        baseline_date = comparison['baseline'].get('creato_il')
+        if hasattr(baseline_date, 'strftime'):
+            baseline_date = baseline_date.strftime('%d/%m/%Y')
+
+        overall = comparison['overall']
+        dimensions = comparison['dimensions']
+        y_pos = self._draw_table_page_heading(
+            c, "CONFRONTO", f"Variazione rispetto all'assessment del {baseline_date or '-'}",
+            f"Punteggio complessivo {overall['baseline']} -> {overall['current']} - "
+            f"{dimensions['improved']} domande migliorate, {dimensions['regressed']} peggiorate "
+            f"su {dimensions['compared']} confrontabili"
+        )
+
+        def delta_color(delta):
+            if delta is None:
+                return colors.HexColor('#F3F4F6')
+            if delta <= -0.5:
+                return colors.HexColor('#FECACA')
+            if delta < 0:
+                return colors.HexColor('#FEF3C7')
+            if delta == 0:
+                return colors.HexColor('#F3F4F6')
+            if delta < 0.5:
+                return colors.HexColor('#D1FAE5')
+            return colors.HexColor('#A7F3D0')
+
+        def delta_label(delta):
+            return f"{delta:+.2f}" if delta is not None else "-"
+
+        cells = {(item['process'], item['category']): item['delta'] for item in comparison['by_process_category']}
+        categories = {item['category']: item['delta'] for item in comparison['by_category']}
+        rows = [
+            (item['process'], [cells.get((item['process'], d)) for d in TABLE_DOMAINS], item['delta'])
+            for item in comparison['by_process']
+        ]
+        rows.append(('TOTALE', [categories.get(d) for d in TABLE_DOMAINS], overall['delta']))
+        y_pos = self._draw_process_domain_table(c, y_pos, rows, delta_color, delta_label)
+
+        # Attività più migliorate / più peggiorate, affiancate
+        rankings = comparison['rankings']['activities']
+        y_pos -= 1.2 * cm
+        column_width = (self.page_width - 2 * self.margin_left) / 2
+        for column, (label, key, color) in enumerate([
+            ("Più migliorate", 'most_improved', '#10B981'),
+            ("Più peggiorate", 'most_regressed', '#EF4444'),
+        ]):
+            x = self.margin_left + column * column_width
+            y = y_pos
+            c.setFont('Helvetica-Bold', 12)
+            c.setFillColor(colors.HexColor(color))
+            c.drawString(x, y, label)
+            c.setFont('Helvetica', 9)
+            c.setFillColor(colors.HexColor('#333333'))
+            items = rankings[key][:5]
+            if not items:
+                y -= 16
+                c.drawString(x, y, "-")
+            for item in items:
+                y -= 16
+                text = f"{item['process'][:18]} / {item['activity'][:30]}"
+                c.drawString(x, y, text)
+                c.drawRightString(x + column_width - 0.5 * cm, y, delta_label(item['delta']))
+
+        y_pos -= 7 * 16 + 0.5 * cm
+        c.setFont('Helvetica-Oblique', 8)
+        c.setFillColor(colors.HexColor('#666666'))
+        c.drawString(
+            self.margin_left, y_pos,
+            "Variazione = punteggio medio attuale - precedente (non applicabili esclusi)."
+        )
+
     def _add_process_radars(self, c: canvas.Canvas, stats_data: Dict):
         """7 radar (uno per processo) con 4 assi (domini)"""
         y_pos = self.page_height - self.margin_top - 2 * cm
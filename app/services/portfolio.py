@@ -0,0 +1,369 @@
+"""
+Rollup di portafoglio: statistiche precalcolate sulle sessioni chiuse
+
+Per ogni gruppo (tutte le sessioni, settore, dimensione, modello) e per ogni
+cella processo × dominio (più i totali per processo, per dominio e complessivo)
+la tabella portfolio_rollup tiene:
+  - n, somma e somma dei quadrati dei punteggi medi di sessione (media e dev. std)
+  - un istogramma a bin fissi su 0-5 (percentili e distribuzione)
+
+Tutti i campi sono additivi, quindi il rollup si aggiorna in modo incrementale
+quando una sessione viene chiusa (data_chiusura impostata), riaperta o
+modificata: il contributo precedente, salvato in portfolio_member, viene
+sottratto e quello nuovo aggiunto. La ricostruzione completa serve solo per
+allineare dati storici (vedi rebuild_rollups).
+
+Convenzione chiavi: process="" e category="" indicano "tutti".
+
+Chi tiene in memoria derivati delle sessioni del portafoglio (es. l'indice
+similar_companies) si registra con on_member_change e viene avvisato quando
+una sessione entra, esce o cambia: dopo il commit della transazione che ha
+scritto portfolio_member, così chi rilegge la tabella vede già il nuovo stato.
+"""
+
+from datetime import datetime
+from math import sqrt
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import event, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session, load_only, undefer_group
+
+from app import models
+
+GROUP_TYPES = ("all", "settore", "dimensione", "model_name", "peer")
+
+# Gruppo "peer": stesso settore e stessa dimensione
+PEER_SEPARATOR = "|"
+
+# Istogramma: un contatore per ogni punto della griglia 0, 0.05, ..., 5
+HIST_MAX = 5.0
+HIST_WIDTH = 0.05
+HIST_BINS = int(round(HIST_MAX / HIST_WIDTH)) + 1
+
+PERCENTILES = (10, 25, 50, 75, 90)
+
+# Bin di visualizzazione della distribuzione (ampiezza 0.5)
+DISTRIBUTION_STEP = 10
+
+# Sotto questa soglia il benchmark settoriale non è considerato affidabile
+MIN_PEERS = 5
+
+RollupKey = Tuple[str, str, str, str]
+
+_listeners: List[Callable[[Optional[UUID]], None]] = []
+# Chiave di Session.info con le sessioni cambiate in attesa del commit
+_PENDING_KEY = "portfolio_member_changes"
+
+
+def on_member_change(callback: Callable[[Optional[UUID]], None]) -> Callable[[Optional[UUID]], None]:
+    """Registra una funzione chiamata con l'id della sessione cambiata (None: ricostruzione completa)"""
+    _listeners.append(callback)
+    return callback
+
+
+def _member_changed(db: Session, session_id: Optional[UUID]) -> None:
+    """Avvisa i listener al commit della transazione di db (annullato dal rollback)"""
+    db.info.setdefault(_PENDING_KEY, []).append(session_id)
+
+
+@event.listens_for(Session, "after_commit")
+def _notify_member_changes(db: Session) -> None:
+    for session_id in db.info.pop(_PENDING_KEY, None) or ():
+        for callback in list(_listeners):
+            try:
+                callback(session_id)
+            except Exception as e:
+                print(f"⚠️ Aggiornamento derivati portafoglio fallito: {e}")
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_member_changes(db: Session) -> None:
+    db.info.pop(_PENDING_KEY, None)
+
+
+def _bin_index(value: float) -> int:
+    return min(max(int(round(value / HIST_WIDTH)), 0), HIST_BINS - 1)
+
+
+def session_groups(session) -> List[List[str]]:
+    """Gruppi di portafoglio a cui appartiene una sessione"""
+    groups = [["all", ""]]
+    for group_type in ("settore", "dimensione", "model_name"):
+        value = getattr(session, group_type, None)
+        if value:
+            groups.append([group_type, value])
+    peer = peer_group_value(session.settore, session.dimensione)
+    if peer:
+        groups.append(["peer", peer])
+    return groups
+
+
+def peer_group_value(settore: Optional[str], dimensione: Optional[str]) -> Optional[str]:
+    """Valore del gruppo "peer" (settore + dimensione), None se manca uno dei due"""
+    if not settore or not dimensione:
+        return None
+    return f"{settore}{PEER_SEPARATOR}{dimensione}"
+
+
+def snapshot_cells(snapshot: Optional[Dict]) -> List[Tuple[str, str, float]]:
+    """Celle (process, category, score) di uno snapshot punteggi_json"""
+    if not snapshot or snapshot.get("overall") is None:
+        return []
+    cells = [("", "", float(snapshot["overall"]))]
+    cells += [("", c, float(v)) for c, v in (snapshot.get("by_category") or {}).items()]
+    cells += [(p, "", float(v)) for p, v in (snapshot.get("by_process") or {}).items()]
+    for process, cats in (snapshot.get("by_process_category") or {}).items():
+        cells += [(process, c, float(v)) for c, v in cats.items()]
+    return cells
+
+
+def _contributions(groups: Iterable[List[str]], snapshot: Optional[Dict]) -> Dict[RollupKey, List[float]]:
+    """Contributo di una sessione: chiave rollup -> lista di punteggi"""
+    cells = snapshot_cells(snapshot)
+    out: Dict[RollupKey, List[float]] = {}
+    for group_type, group_value in groups:
+        for process, category, value in cells:
+            out.setdefault((group_type, group_value, process, category), []).append(value)
+    return out
+
+
+def _apply(db: Session, contributions: Dict[RollupKey, List[float]], sign: int) -> None:
+    """Somma (sign=1) o sottrae (sign=-1) i contributi dalle righe di rollup"""
+    if not contributions:
+        return
+    R = models.PortfolioRollup
+    keys = list(contributions)
+
+    if sign > 0:
+        # Crea le righe mancanti; la riga esistente viene poi bloccata con FOR UPDATE
+        db.execute(
+            pg_insert(R).on_conflict_do_nothing(constraint="uq_portfolio_rollup_key"),
+            [
+                {"group_type": g, "group_value": v, "process": p, "category": c,
+                 "n": 0, "score_sum": 0.0, "score_sum_sq": 0.0, "histogram": [0] * HIST_BINS}
+                for g, v, p, c in keys
+            ],
+        )
+
+    rows = (
+        db.query(R)
+        .filter(tuple_(R.group_type, R.group_value, R.process, R.category).in_(keys))
+        .with_for_update()
+        .all()
+    )
+    now = datetime.now()
+    for row in rows:
+        values = contributions[(row.group_type, row.group_value, row.process, row.category)]
+        histogram = list(row.histogram or [0] * HIST_BINS)
+        for value in values:
+            histogram[_bin_index(value)] += sign
+        row.n = max(row.n + sign * len(values), 0)
+        row.score_sum += sign * sum(values)
+        row.score_sum_sq += sign * sum(v * v for v in values)
+        row.histogram = histogram
+        row.updated_at = now
+
+
+def sync_session_rollup(db: Session, session_id: UUID, commit: bool = True) -> bool:
+    """
+    Allinea il contributo di una sessione ai rollup.
+    Da chiamare quando cambia data_chiusura, lo snapshot punteggi o i campi di
+    raggruppamento (settore, dimensione). Restituisce True se la sessione è inclusa.
+    """
+    member = db.get(models.PortfolioMember, session_id, with_for_update=True)
+    if member is not None:
+        _apply(db, _contributions(member.groups, member.snapshot), -1)
+        db.delete(member)
+        db.flush()
+
+    S = models.AssessmentSession
+    session = db.query(S).options(
+        load_only(S.id, S.settore, S.dimensione, S.model_name, S.data_chiusura),
+        undefer_group("answers"),
+    ).filter(S.id == session_id).first()
+
+    included = bool(session and session.data_chiusura and snapshot_cells(session.punteggi_json))
+    if included:
+        groups = session_groups(session)
+        _apply(db, _contributions(groups, session.punteggi_json), 1)
+        db.add(models.PortfolioMember(session_id=session_id, groups=groups, snapshot=session.punteggi_json))
+
+    _member_changed(db, session_id)
+    if commit:
+        db.commit()
+    return included
+
+
+def remove_session_rollup(db: Session, session_id: UUID) -> None:
+    """Sottrae il contributo di una sessione (es. prima della cancellazione)"""
+    member = db.get(models.PortfolioMember, session_id, with_for_update=True)
+    if member is not None:
+        _apply(db, _contributions(member.groups, member.snapshot), -1)
+        db.delete(member)
+        db.flush()
+        _member_changed(db, session_id)
+
+
+def rebuild_rollups(db: Session) -> Dict:
+    """Ricalcola da zero i rollup da tutte le sessioni chiuse"""
+    S = models.AssessmentSession
+    R = models.PortfolioRollup
+    totals: Dict[RollupKey, List[float]] = {}
+    members = []
+
+    query = db.query(S).options(
+        load_only(S.id, S.settore, S.dimensione, S.model_name, S.data_chiusura),
+        undefer_group("answers"),
+    ).filter(S.data_chiusura.is_not(None), S.punteggi_json.is_not(None))
+
+    for session in query.yield_per(500):
+        if not snapshot_cells(session.punteggi_json):
+            continue
+        groups = session_groups(session)
+        for key, values in _contributions(groups, session.punteggi_json).items():
+            totals.setdefault(key, []).extend(values)
+        members.append({"session_id": session.id, "groups": groups, "snapshot": session.punteggi_json})
+
+    db.query(models.PortfolioMember).delete(synchronize_session=False)
+    db.query(R).delete(synchronize_session=False)
+
+    now = datetime.now()
+    rows = []
+    for (group_type, group_value, process, category), values in totals.items():
+        histogram = [0] * HIST_BINS
+        for value in values:
+            histogram[_bin_index(value)] += 1
+        rows.append({
+            "group_type": group_type, "group_value": group_value,
+            "process": process, "category": category,
+            "n": len(values), "score_sum": sum(values),
+            "score_sum_sq": sum(v * v for v in values),
+            "histogram": histogram, "updated_at": now,
+        })
+    if rows:
+        db.execute(pg_insert(R), rows)
+    if members:
+        db.execute(pg_insert(models.PortfolioMember), members)
+    _member_changed(db, None)
+    db.commit()
+    return {"sessions": len(members), "rollup_rows": len(rows)}
+
+
+# ============================================================================
+# LETTURA
+# ============================================================================
+
+def histogram_percentile(histogram: List[int], n: int, pct: float) -> Optional[float]:
+    """Percentile approssimato al punto di griglia (errore massimo HIST_WIDTH / 2)"""
+    if n <= 0:
+        return None
+    target = max(pct / 100 * n, 1e-9)
+    cumulative = 0
+    for i, count in enumerate(histogram):
+        cumulative += count
+        if cumulative >= target:
+            return round(i * HIST_WIDTH, 2)
+    return HIST_MAX
+
+
+def rollup_stats(row) -> Dict:
+    """Statistiche leggibili di una riga di rollup"""
+    n = row.n
+    mean = row.score_sum / n if n else None
+    variance = max(row.score_sum_sq / n - mean * mean, 0.0) if n else None
+    histogram = row.histogram or [0] * HIST_BINS
+    distribution = []
+    last_start = HIST_BINS - 1 - DISTRIBUTION_STEP
+    for start in range(0, HIST_BINS - 1, DISTRIBUTION_STEP):
+        # L'ultimo intervallo include il punteggio massimo (5.0)
+        end = HIST_BINS if start == last_start else start + DISTRIBUTION_STEP
+        distribution.append({
+            "from": round(start * HIST_WIDTH, 2),
+            "to": round((start + DISTRIBUTION_STEP) * HIST_WIDTH, 2),
+            "count": sum(histogram[start:end]),
+        })
+    return {
+        "n": n,
+        "mean": round(mean, 3) if mean is not None else None,
+        "std": round(sqrt(variance), 3) if variance is not None else None,
+        "percentiles": {f"p{p}": histogram_percentile(histogram, n, p) for p in PERCENTILES},
+        "distribution": distribution,
+    }
+
+
+def get_rollup(db: Session, group_type: str = "all", group_value: str = "") -> Optional[Dict]:
+    """Rollup completo di un gruppo: complessivo, per dominio, per processo e processo × dominio"""
+    R = models.PortfolioRollup
+    rows = db.query(R).filter(
+        R.group_type == group_type, R.group_value == (group_value or ""), R.n > 0
+    ).all()
+    if not rows:
+        return None
+
+    output = {
+        "group_type": group_type,
+        "group_value": group_value or None,
+        "overall": None,
+        "by_category": {},
+        "by_process": {},
+        "by_process_category": {},
+        "updated_at": max(r.updated_at for r in rows).isoformat(),
+    }
+    for row in rows:
+        stats = rollup_stats(row)
+        if not row.process and not row.category:
+            output["overall"] = stats
+            output["sessions"] = row.n
+        elif not row.process:
+            output["by_category"][row.category] = stats
+        elif not row.category:
+            output["by_process"][row.process] = stats
+        else:
+            output["by_process_category"].setdefault(row.process, {})[row.category] = stats
+    return output
+
+
+def list_groups(db: Session) -> List[Dict]:
+    """Gruppi disponibili con numero di sessioni chiuse"""
+    R = models.PortfolioRollup
+    rows = db.query(R.group_type, R.group_value, R.n).filter(
+        R.process == "", R.category == "", R.n > 0
+    ).order_by(R.group_type, R.group_value).all()
+    return [{"group_type": g, "group_value": v or None, "sessions": n} for g, v, n in rows]
+
+
+def sector_benchmark(db: Session, settore: Optional[str]) -> Optional[Dict]:
+    """
+    Statistiche reali sul punteggio complessivo dei pari di settore, nel formato
+    atteso da AIRecommendationEngine._create_sector_benchmark.
+    None se i dati non bastano (il motore usa allora i valori di riferimento statici).
+    """
+    if not settore:
+        return None
+    R = models.PortfolioRollup
+    row = db.query(R).filter(
+        R.group_type == "settore", R.group_value == settore,
+        R.process == "", R.category == ""
+    ).first()
+    if row is None or row.n < MIN_PEERS:
+        return None
+    stats = rollup_stats(row)
+    return {
+        "source": "portfolio",
+        "peers": row.n,
+        "avg": stats["mean"],
+        "excellence": stats["percentiles"]["p90"],
+        "percentiles": stats["percentiles"],
+        "histogram": row.histogram,
+    }
+
+
+def histogram_rank(histogram: List[int], n: int, value: float) -> Optional[int]:
+    """Percentile (0-100) di un valore rispetto all'istogramma dei pari (mid-rank sui pari merito)"""
+    if n <= 0 or value is None:
+        return None
+    idx = _bin_index(value)
+    below = sum(histogram[:idx])
+    return int(round(min(max((below + histogram[idx] / 2) / n, 0.0), 1.0) * 100))
@@ -0,0 +1,277 @@
+"""
+Libreria di raccomandazioni precalcolate: report markdown senza chiamate AI
+
+recommendation_entry contiene testi scritti una volta per (processo, dominio,
+domanda, fascia di punteggio, settore), con "" per "qualsiasi". La tabella è
+piccola e viene tenuta tutta in memoria in un dict per chiave completa,
+caricato all'avvio (main.py) e ricaricato quando cambia (count/max updated_at,
+controllati al più ogni REFRESH_SECONDS).
+
+Il report di una sessione è una ricerca per ogni domanda (media sulle attività
+del processo): si parte dalla chiave più specifica e si risale fino al testo
+generico del dominio, preferendo a ogni livello il settore della sessione
+(riconosciuto per parole chiave, es. "Hotel" o "Turismo e ospitalità" -> turismo).
+Le domande che arrivano allo stesso testo sono raggruppate, così il report
+resta leggibile anche con i soli testi per dominio. Pochi millisecondi per
+sessione, stesso input stesso testo: è il percorso di default dei
+suggerimenti, l'AI resta un arricchimento opzionale (radar.py, enrich=true).
+"""
+
+import argparse
+import csv
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app import models
+
+# Ogni quanto ricontrollare recommendation_entry (modifiche da altri worker o dalla CLI)
+REFRESH_SECONDS = 60
+
+# Limiti superiori (esclusi) delle fasce 0-2; sopra l'ultimo: fascia 3
+BAND_LIMITS = (1.5, 2.5, 3.5)
+BANDS = {
+    0: {"label": "Critico", "section": "🔴 Interventi immediati (0-6 mesi)"},
+    1: {"label": "Debole", "section": "🟠 Breve termine (6-12 mesi)"},
+    2: {"label": "In sviluppo", "section": "🟡 Medio termine (12-24 mesi)"},
+    3: {"label": "Avanzato", "section": "🟢 Punti di forza da consolidare"},
+}
+# Processi elencati per raccomandazione prima di "e altri N"
+MAX_AREAS = 8
+
+# Settori della libreria e parole chiave che li riconoscono nel settore (testo
+# libero) della sessione; usate anche dai prompt di ai_recommendations.py
+SECTOR_KEYWORDS = {
+    "turismo": ("turismo", "hospitality", "hotel", "travel", "restaurant", "ospitalità", "ristorazione", "viaggi"),
+}
+
+CSV_FIELDS = ("process", "category", "dimension", "band", "settore", "title", "body", "priority")
+
+Key = Tuple[str, str, str, int, str]  # (process, category, dimension, band, settore)
+
+
+class Entry(NamedTuple):
+    id: int
+    title: str
+    body: str
+    priority: int
+
+
+class _Library:
+    def __init__(self):
+        self.entries: Dict[Key, Entry] = {}
+        self.signature = None  # (count, max updated_at) al caricamento
+        self.checked_at = 0.0
+
+
+_library = _Library()
+_lock = threading.Lock()
+
+
+def score_band(score: float) -> int:
+    for band, limit in enumerate(BAND_LIMITS):
+        if score < limit:
+            return band
+    return len(BAND_LIMITS)
+
+
+def library_sector(settore: Optional[str]) -> str:
+    """Chiave di settore della libreria: per parola chiave (SECTOR_KEYWORDS), altrimenti il testo minuscolo"""
+    text = (settore or "").strip().lower()
+    for key, keywords in SECTOR_KEYWORDS.items():
+        if any(keyword in text for keyword in keywords):
+            return key
+    return text
+
+
+def _signature(db: Session):
+    E = models.RecommendationEntry
+    return tuple(db.execute(select(func.count(), func.max(E.updated_at)).select_from(E)).one())
+
+
+def refresh(db: Session, force: bool = False) -> _Library:
+    """Libreria in memoria allineata alla tabella (al più ogni REFRESH_SECONDS)"""
+    global _library
+    with _lock:
+        if not force and time.monotonic() - _library.checked_at < REFRESH_SECONDS:
+            return _library
+        signature = _signature(db)
+        if force or signature != _library.signature:
+            library = _Library()
+            E = models.RecommendationEntry
+            for row in db.execute(select(
+                E.id, E.process, E.category, E.dimension, E.band, E.settore, E.title, E.body, E.priority
+            )):
+                library.entries[(row.process, row.category, row.dimension, row.band, row.settore)] = Entry(
+                    row.id, row.title, row.body, row.priority
+                )
+            library.signature = signature
+            print(f"📚 Libreria raccomandazioni caricata: {len(library.entries)} testi")
+            _library = library
+        _library.checked_at = time.monotonic()
+        return _library
+
+
+def lookup(library: _Library, process: str, category: str, dimension: str, band: int,
+           settore: str = "") -> Optional[Entry]:
+    """Testo più specifico per la cella: domanda, dominio, poi processo; a ogni livello prima il settore"""
+    entries = library.entries
+    for p, d in ((process, dimension), ("", dimension), (process, ""), ("", "")):
+        for s in ((settore, "") if settore else ("",)):
+            entry = entries.get((p, category, d, band, s))
+            if entry is not None:
+                return entry
+    return None
+
+
+def _format_areas(items: List[Tuple[str, str, str, float]]) -> str:
+    by_process: Dict[str, List[float]] = defaultdict(list)
+    for process, _, _, score in items:
+        by_process[process].append(score)
+    ranked = sorted(
+        ((process, sum(scores) / len(scores)) for process, scores in by_process.items()),
+        key=lambda item: (item[1], item[0]),
+    )
+    text = ", ".join(f"{process} ({score:.1f})" for process, score in ranked[:MAX_AREAS])
+    if len(ranked) > MAX_AREAS:
+        text += f" e altri {len(ranked) - MAX_AREAS}"
+    return text
+
+
+def build_report(db: Session, answers: Iterable, settore: Optional[str] = None,
+                 azienda_nome: Optional[str] = None) -> Dict:
+    """
+    Report markdown per le risposte applicabili di una sessione (righe con
+    process/category/dimension/score, come answer_grid.Answer).
+    """
+    library = refresh(db)
+    settore = library_sector(settore)
+
+    cells: Dict[Tuple[str, str, str], List[int]] = defaultdict(list)
+    for answer in answers:
+        cells[(answer.process, answer.category, answer.dimension)].append(answer.score or 0)
+    if not cells:
+        return {"content": "Nessuna risposta applicabile: impossibile generare raccomandazioni.",
+                "source": "library", "entries": 0, "bands": {}}
+
+    # (band, entry id) -> testo e domande che lo usano
+    groups: Dict[Tuple[int, Optional[int]], Dict] = {}
+    band_counts = {band: 0 for band in BANDS}
+    total = 0.0
+    for (process, category, dimension), scores in cells.items():
+        score = sum(scores) / len(scores)
+        total += score
+        band = score_band(score)
+        band_counts[band] += 1
+        entry = lookup(library, process, category, dimension, band, settore)
+        key = (band, entry.id if entry else None)
+        group = groups.setdefault(key, {"entry": entry, "category": category, "items": []})
+        group["items"].append((process, category, dimension, score))
+    overall = total / len(cells)
+
+    lines = [f"# Piano di miglioramento{f' - {azienda_nome}' if azienda_nome else ''}", ""]
+    lines.append(f"**Punteggio medio:** {overall:.2f}/5 ({BANDS[score_band(overall)]['label']})  ")
+    lines.append("**Domande per fascia:** " + " · ".join(
+        f"{BANDS[b]['label']} {band_counts[b]}" for b in BANDS if band_counts[b]
+    ))
+
+    for band, info in BANDS.items():
+        band_groups = [g for (b, _), g in groups.items() if b == band]
+        if not band_groups:
+            continue
+        band_groups.sort(key=lambda g: (
+            g["entry"].priority if g["entry"] else sys.maxsize,
+            min(item[3] for item in g["items"]),
+        ))
+        lines += ["", f"## {info['section']}"]
+        for group in band_groups:
+            entry = group["entry"]
+            title = entry.title if entry else f"{group['category']}: aree senza testo in libreria"
+            lines += ["", f"### {title}", f"*{group['category']}* · {_format_areas(group['items'])}", ""]
+            if band < 3 or entry is None:
+                weakest = sorted(group["items"], key=lambda item: item[3])[:3]
+                lines.append("Domande con il punteggio più basso:")
+                lines += [f"- [{p}] {d} ({s:.1f}/5)" for p, _, d, s in weakest]
+                lines.append("")
+            if entry is not None:
+                lines.append(entry.body.strip())
+
+    lines += ["", "---", "*Raccomandazioni dalla libreria standard; la versione personalizzata con AI è opzionale.*"]
+    return {
+        "content": "\n".join(lines),
+        "source": "library",
+        "entries": sum(1 for _, entry_id in groups if entry_id is not None),
+        "bands": {BANDS[b]["label"]: n for b, n in band_counts.items() if n},
+    }
+
+
+def import_csv(db: Session, path: str) -> int:
+    """Inserisce o aggiorna i testi da CSV (colonne CSV_FIELDS) sulla chiave completa"""
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = [
+            {
+                "process": row.get("process") or "",
+                "category": row.get("category") or "",
+                "dimension": row.get("dimension") or "",
+                "band": int(row["band"]),
+                "settore": library_sector(row.get("settore")),
+                "title": row["title"],
+                "body": row["body"],
+                "priority": int(row.get("priority") or 0),
+            }
+            for row in csv.DictReader(f)
+        ]
+    if not rows:
+        return 0
+    stmt = pg_insert(models.RecommendationEntry).values(rows)
+    db.execute(stmt.on_conflict_do_update(
+        constraint="uq_recommendation_entry_key",
+        set_={"title": stmt.excluded.title, "body": stmt.excluded.body,
+              "priority": stmt.excluded.priority, "updated_at": func.now()},
+    ))
+    db.commit()
+    refresh(db, force=True)
+    return len(rows)
+
+
+def export_csv(db: Session, path: str) -> int:
+    E = models.RecommendationEntry
+    rows = db.execute(
+        select(*(getattr(E, field) for field in CSV_FIELDS))
+        .order_by(E.category, E.band, E.process, E.dimension, E.settore)
+    ).all()
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_FIELDS)
+        writer.writerows(rows)
+    return len(rows)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Libreria di raccomandazioni")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("import", help="inserisce o aggiorna i testi da CSV").add_argument("path")
+    commands.add_parser("export", help="esporta la libreria in CSV").add_argument("path")
+    args = parser.parse_args(argv)
+
+    from app.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        if args.command == "import":
+            print(f"✅ {import_csv(db, args.path)} testi importati")
+        else:
+            print(f"✅ {export_csv(db, args.path)} testi esportati in {args.path}")
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
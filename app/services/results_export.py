@@ -0,0 +1,225 @@
+"""
+Export in streaming delle risposte grezze (assessment_result) su più sessioni
+
+Le righe vengono lette con un cursore lato server (yield_per) e scritte a
+blocchi, quindi la memoria resta costante anche su milioni di righe:
+  - CSV: ogni blocco diventa un chunk di testo
+  - Parquet: ogni blocco diventa un row group, i byte vengono emessi appena scritti
+
+Sono esportate le righe salvate: con lo storage sparso (vedi answer_grid) le
+celle mai risposte non compaiono e valgono score 0, applicabili.
+
+Uso da riga di comando:
+  python -m app.services.results_export --format parquet --output risposte.parquet \\
+      --model i40_assessment_fto --settore Automotive --date-from 2025-01-01
+"""
+
+import argparse
+import csv
+import io
+import sys
+from datetime import date, datetime, time
+from typing import Dict, Iterator, List, Optional
+
+from sqlalchemy import select
+
+from app import models
+from app.database import SessionLocal
+
+CHUNK_SIZE = 5000
+
+EXPORT_FORMATS = ("csv", "parquet")
+
+EXPORT_COLUMNS = [
+    "session_id", "azienda_nome", "settore", "dimensione", "model_name",
+    "creato_il", "data_chiusura",
+    "process", "activity", "category", "dimension",
+    "score", "is_not_applicable", "note",
+]
+
+
+def _export_statement(
+    model_name: Optional[str] = None,
+    settore: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    closed_only: bool = False,
+):
+    S = models.AssessmentSession
+    R = models.AssessmentResult
+    stmt = (
+        select(
+            R.session_id, S.azienda_nome, S.settore, S.dimensione, S.model_name,
+            S.creato_il, S.data_chiusura,
+            R.process, R.activity, R.category, R.dimension,
+            R.score, R.is_not_applicable, R.note,
+        )
+        .join(S, S.id == R.session_id)
+        .order_by(R.session_id)
+    )
+    if model_name:
+        stmt = stmt.where(S.model_name == model_name)
+    if settore:
+        stmt = stmt.where(S.settore == settore)
+    if date_from:
+        stmt = stmt.where(S.creato_il >= datetime.combine(date_from, time.min))
+    if date_to:
+        stmt = stmt.where(S.creato_il <= datetime.combine(date_to, time.max))
+    if closed_only:
+        stmt = stmt.where(S.data_chiusura.is_not(None))
+    return stmt
+
+
+def _iter_partitions(filters: Dict, chunk_size: int) -> Iterator[List]:
+    """Blocchi di righe letti con cursore lato server; apre e chiude la propria sessione DB"""
+    db = SessionLocal()
+    try:
+        result = db.execute(_export_statement(**filters).execution_options(yield_per=chunk_size))
+        for partition in result.partitions():
+            yield partition
+    finally:
+        db.close()
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def iter_csv(filters: Dict, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """CSV (UTF-8 con BOM, leggibile da Excel) a blocchi"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    yield ("\ufeff" + buffer.getvalue()).encode("utf-8")
+
+    for partition in _iter_partitions(filters, chunk_size):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([[_csv_value(v) for v in row] for row in partition])
+        yield buffer.getvalue().encode("utf-8")
+
+
+class _ChunkSink:
+    """File-like in sola scrittura: accumula i byte finché non vengono prelevati"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _parquet_schema():
+    import pyarrow as pa
+    return pa.schema([
+        ("session_id", pa.string()),
+        ("azienda_nome", pa.string()),
+        ("settore", pa.string()),
+        ("dimensione", pa.string()),
+        ("model_name", pa.string()),
+        ("creato_il", pa.timestamp("us")),
+        ("data_chiusura", pa.timestamp("us")),
+        ("process", pa.string()),
+        ("activity", pa.string()),
+        ("category", pa.string()),
+        ("dimension", pa.string()),
+        ("score", pa.int32()),
+        ("is_not_applicable", pa.bool_()),
+        ("note", pa.string()),
+    ])
+
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow.parquet  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def iter_parquet(filters: Dict, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Parquet a row group, emesso in streaming (richiede pyarrow)"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _parquet_schema()
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="snappy")
+    try:
+        for partition in _iter_partitions(filters, chunk_size):
+            columns = list(zip(*partition))
+            arrays = {name: list(values) for name, values in zip(EXPORT_COLUMNS, columns)}
+            arrays["session_id"] = [str(v) for v in arrays["session_id"]]
+            writer.write_table(pa.Table.from_pydict(arrays, schema=schema))
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def iter_export(fmt: str, filters: Dict, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    if fmt == "csv":
+        return iter_csv(filters, chunk_size)
+    if fmt == "parquet":
+        return iter_parquet(filters, chunk_size)
+    raise ValueError(f"Formato non supportato: {fmt}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Export in streaming delle risposte degli assessment")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    parser.add_argument("--output", "-o", help="File di destinazione (default: stdout)")
+    parser.add_argument("--model", dest="model_name")
+    parser.add_argument("--settore")
+    parser.add_argument("--date-from", type=date.fromisoformat)
+    parser.add_argument("--date-to", type=date.fromisoformat)
+    parser.add_argument("--closed-only", action="store_true")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    if args.format == "parquet" and not parquet_available():
+        print("❌ Export Parquet non disponibile: installare pyarrow", file=sys.stderr)
+        return 1
+
+    filters = {
+        "model_name": args.model_name, "settore": args.settore,
+        "date_from": args.date_from, "date_to": args.date_to,
+        "closed_only": args.closed_only,
+    }
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for chunk in iter_export(args.format, filters, args.chunk_size):
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,232 @@
+"""
+Confronto longitudinale tra due sessioni (es. ri-assessment annuale della stessa azienda)
+
+Le griglie delle due sessioni sono allineate sulle celle del modello della
+sessione più recente: se le sessioni sono su versioni diverse del modello le
+risposte della sessione di riferimento passano per la stessa mappatura delle
+migrazioni (model_migration.plan: domande rinominate seguite, domande nuove
+senza confronto, domande tolte ignorate).
+
+Le risposte di ciascuna sessione arrivano come tre array (array_agg) e sono
+messe in posizione con una tabella densa dimension_id -> indice nel modello;
+punteggi e validità sono vettori numpy nell'ordine del modello e le medie per
+processo, attività, dominio e processo × dominio si ottengono con np.bincount
+sui codici di gruppo delle celle. Tabella e codici sono precalcolati per
+versione del modello (e in cache senza scadenza, come i template).
+Le medie seguono le regole dei radar: non applicabili esclusi, celle senza
+risposta a 0.
+"""
+
+import threading
+from typing import Dict, List, NamedTuple, Optional
+from uuid import UUID
+
+import numpy as np
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+
+from app import models
+from app.services import session_factory
+
+# Voci nelle classifiche migliorati/peggiorati
+TOP_N = 10
+
+# Livello di aggregazione -> campi della cella che identificano il gruppo
+GROUP_LEVELS = {
+    "process": ("process",),
+    "activity": ("process", "activity"),
+    "category": ("category",),
+    "process_category": ("process", "category"),
+}
+CELL_FIELDS = ("process", "activity", "category", "dimension")
+
+ANSWERS_SQL = text("""
+    SELECT session_id, array_agg(dimension_id) AS dimension_ids,
+           array_agg(score) AS scores, array_agg(is_not_applicable) AS not_applicable
+    FROM assessment_answer
+    WHERE session_id IN (:baseline_id, :current_id)
+    GROUP BY session_id
+""")
+
+
+class _GroupIndex(NamedTuple):
+    lookup: np.ndarray              # dimension_id -> indice in template.cells, -1 se assente
+    codes: Dict[str, np.ndarray]    # livello -> codice del gruppo di ogni cella
+    labels: Dict[str, List[tuple]]  # livello -> gruppi, nell'ordine del modello
+
+
+_indexes: Dict[str, _GroupIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def _group_index(template: session_factory.AnswerTemplate) -> _GroupIndex:
+    with _indexes_lock:
+        index = _indexes.get(template.version)
+    if index is not None:
+        return index
+    ids = np.asarray(template.dimension_ids, dtype=np.int64)
+    lookup = np.full(int(ids.max()) + 1 if len(ids) else 0, -1, dtype=np.int64)
+    lookup[ids] = np.arange(len(ids))
+    codes, labels = {}, {}
+    for level, fields in GROUP_LEVELS.items():
+        positions = [CELL_FIELDS.index(f) for f in fields]
+        seen: Dict[tuple, int] = {}
+        codes[level] = np.fromiter(
+            (seen.setdefault(tuple(c[i] for i in positions), len(seen)) for c in template.cells),
+            dtype=np.int32, count=len(template.cells),
+        )
+        labels[level] = list(seen)
+    index = _GroupIndex(lookup, codes, labels)
+    with _indexes_lock:
+        _indexes[template.version] = index
+    return index
+
+
+def _session_row(db: Session, session_id: UUID):
+    S = models.AssessmentSession
+    return db.execute(
+        select(S.id, S.azienda_nome, S.company_id, S.model_name, S.model_version, S.creato_il, S.data_chiusura)
+        .where(S.id == session_id)
+    ).first()
+
+
+def previous_session_id(db: Session, session_id: UUID) -> Optional[UUID]:
+    """Sessione precedente della stessa azienda (company_id, altrimenti nome), None se non c'è"""
+    current = _session_row(db, session_id)
+    if current is None:
+        return None
+    S = models.AssessmentSession
+    same_company = S.company_id == current.company_id if current.company_id is not None else S.azienda_nome == current.azienda_nome
+    return db.execute(
+        select(S.id).where(same_company, S.id != current.id, S.creato_il <= current.creato_il)
+        .order_by(S.creato_il.desc(), S.id.desc()).limit(1)
+    ).scalar()
+
+
+def _positions(lookup: np.ndarray, dimension_ids: np.ndarray) -> np.ndarray:
+    """Indici nel modello delle domande, -1 per quelle che non ne fanno parte"""
+    inside = (dimension_ids >= 0) & (dimension_ids < len(lookup))
+    return np.where(inside, lookup[np.where(inside, dimension_ids, 0)], -1)
+
+
+def _grid(answers, index: _GroupIndex, size: int, present: Optional[np.ndarray] = None, remap=None):
+    """
+    (score, valida) sulle celle del modello: valida = cella presente e
+    applicabile. Per una sessione su un'altra versione remap porta i suoi
+    dimension_id su quelli del modello e present segna le celle che la sua
+    versione conteneva (le altre non sono confrontabili).
+    """
+    scores = np.zeros(size)
+    applicable = np.ones(size, dtype=bool)
+    if present is None:
+        present = np.ones(size, dtype=bool)
+    if answers is not None:
+        ids = np.asarray(answers.dimension_ids, dtype=np.int64)
+        if remap is not None:
+            ids = remap(ids)
+        positions = _positions(index.lookup, ids)
+        keep = positions >= 0
+        keep[keep] = present[positions[keep]]
+        scores[positions[keep]] = np.asarray(answers.scores, dtype=float)[keep]
+        not_applicable = np.asarray(answers.not_applicable, dtype=bool)
+        applicable[positions[keep & not_applicable]] = False
+        scores[~applicable] = 0
+    return scores, applicable & present
+
+
+def _averages(scores, valid, codes, size):
+    weights = valid.astype(float)
+    counts = np.bincount(codes, weights=weights, minlength=size)
+    sums = np.bincount(codes, weights=scores * weights, minlength=size)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan), counts
+
+
+def _value(x) -> Optional[float]:
+    return None if np.isnan(x) else round(float(x), 2)
+
+
+def _ranking(items: List[Dict], key: str = "delta") -> Dict[str, List[Dict]]:
+    changed = [item for item in items if item[key] is not None]
+    improved = sorted((i for i in changed if i[key] > 0), key=lambda i: -i[key])[:TOP_N]
+    regressed = sorted((i for i in changed if i[key] < 0), key=lambda i: i[key])[:TOP_N]
+    return {"most_improved": improved, "most_regressed": regressed}
+
+
+def compare_sessions(db: Session, baseline_id: UUID, current_id: UUID) -> Optional[Dict]:
+    """Differenze current - baseline; None se una delle due sessioni non esiste"""
+    baseline, current = _session_row(db, baseline_id), _session_row(db, current_id)
+    if baseline is None or current is None:
+        return None
+    model_name = current.model_name or session_factory.DEFAULT_MODEL
+    if (baseline.model_name or session_factory.DEFAULT_MODEL) != model_name:
+        raise ValueError("Le sessioni usano modelli diversi")
+
+    template = session_factory.session_template(current.model_name, current.model_version)
+    base_template = session_factory.session_template(baseline.model_name, baseline.model_version)
+    if template is None or base_template is None:
+        raise ValueError(f"Modello {model_name} non trovato")
+    index = _group_index(template)
+    size = len(template.cells)
+    answers = {str(row.session_id): row for row in db.execute(
+        ANSWERS_SQL, {"baseline_id": baseline.id, "current_id": current.id}
+    )}
+
+    cur_scores, cur_valid = _grid(answers.get(str(current.id)), index, size)
+    if base_template.version == template.version:
+        base_scores, base_valid = _grid(answers.get(str(baseline.id)), index, size)
+    else:
+        # Stessa mappatura delle migrazioni tra le due versioni
+        from app.services import model_migration
+        id_map = model_migration.plan(model_name, base_template.version, template.version).id_map
+        remap = np.vectorize(lambda i: id_map.get(int(i), int(i)), otypes=[np.int64])
+        mapped = _positions(index.lookup, remap(np.asarray(base_template.dimension_ids, dtype=np.int64)))
+        present = np.zeros(size, dtype=bool)
+        present[mapped[mapped >= 0]] = True
+        base_scores, base_valid = _grid(answers.get(str(baseline.id)), index, size, present, remap)
+
+    result = {
+        "baseline": {"id": str(baseline.id), "creato_il": baseline.creato_il, "model_version": baseline.model_version},
+        "current": {"id": str(current.id), "creato_il": current.creato_il, "model_version": current.model_version},
+        "model_name": model_name,
+        "same_version": base_template.version == template.version,
+    }
+
+    cur_all = cur_scores[cur_valid].mean() if cur_valid.any() else np.nan
+    base_all = base_scores[base_valid].mean() if base_valid.any() else np.nan
+    result["overall"] = {"baseline": _value(base_all), "current": _value(cur_all), "delta": _value(cur_all - base_all)}
+
+    for level, fields in GROUP_LEVELS.items():
+        labels = index.labels[level]
+        cur_avg, _ = _averages(cur_scores, cur_valid, index.codes[level], len(labels))
+        base_avg, _ = _averages(base_scores, base_valid, index.codes[level], len(labels))
+        delta = cur_avg - base_avg
+        result[f"by_{level}"] = [
+            {**dict(zip(fields, label)),
+             "baseline": _value(base_avg[i]), "current": _value(cur_avg[i]), "delta": _value(delta[i])}
+            for i, label in enumerate(labels)
+        ]
+
+    # Domande confrontabili (applicabili in entrambe) con punteggio cambiato
+    both = cur_valid & base_valid
+    diff = np.where(both, cur_scores - base_scores, 0.0)
+    changed = np.flatnonzero(diff)
+    dimensions = [
+        {
+            **dict(zip(CELL_FIELDS, template.cells[i])),
+            "baseline": float(base_scores[i]), "current": float(cur_scores[i]), "delta": float(diff[i]),
+        }
+        for i in changed[np.argsort(-np.abs(diff[changed]), kind="stable")]
+    ]
+    result["dimensions"] = {
+        "compared": int(both.sum()),
+        "improved": int((diff > 0).sum()),
+        "regressed": int((diff < 0).sum()),
+        "not_comparable": int((~both).sum()),
+        "changed": dimensions,
+    }
+    result["rankings"] = {
+        "dimensions": _ranking(dimensions),
+        "activities": _ranking(result["by_activity"]),
+    }
+    return result
@@ -0,0 +1,346 @@
+"""
+Creazione delle sessioni di assessment
+
+Con SPARSE_ANSWERS (default) la sessione nasce senza righe assessment_result:
+le celle non risposte valgono score 0 e vengono ricostruite in lettura dal
+template del modello (vedi answer_grid). Con SPARSE_ANSWERS=0 si torna alle
+sessioni "dense" con tutte le risposte vuote (score=0) già inserite.
+
+Ogni sessione è legata alla versione corrente del suo modello
+(model_versions): per ogni versione si precalcola una volta il "template"
+delle risposte, tenuto in cache senza scadenza perché le versioni sono immutabili: le celle processo/attività/dominio/domanda con il loro id nel
+catalogo model_dimension (vedi dimension_catalog), le righe assessment_answer
+già serializzate in CSV e lo snapshot punteggi della sessione vuota. In modalità
+densa creare una sessione è quindi un INSERT della sessione più un COPY delle
+risposte, nella stessa transazione; con l'import CSV di un lotto di aziende un solo COPY
+inserisce le risposte di tutte le sessioni.
+
+Se il driver non espone COPY (copy_expert di psycopg2) si ripiega su un
+INSERT executemany.
+
+clone_session crea la sessione del ri-assessment da una esistente: sessione e
+risposte sono copiate dentro Postgres con un solo statement (INSERT ... SELECT
+in CTE), rimappando le domande rinominate se la copia passa a una versione più
+recente del modello (vedi model_migration).
+"""
+
+import csv
+import io
+import os
+import threading
+import uuid
+from datetime import datetime
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import insert, text
+from sqlalchemy.orm import Session
+
+from app import models
+from app.services import dimension_catalog, model_store, model_versions
+from app.services.session_scores import build_score_snapshot
+
+DEFAULT_MODEL = "i40_assessment_fto"
+
+COPY_SQL = (
+    "COPY assessment_answer (session_id, dimension_id, score, is_not_applicable, note) "
+    "FROM STDIN WITH (FORMAT csv)"
+)
+
+# Numero massimo di aziende per import CSV
+MAX_BATCH_SIZE = 1000
+
+# Salva solo le risposte date (le celle vuote si ricostruiscono dal modello)
+SPARSE_ANSWERS = os.getenv("SPARSE_ANSWERS", "1").strip().lower() in ("1", "true", "yes", "on")
+
+
+class AnswerTemplate(NamedTuple):
+    version: str                                    # id model_version
+    cells: Tuple[Tuple[str, str, str, str], ...]   # (process, activity, category, dimension)
+    dimension_ids: Tuple[int, ...]                  # id model_dimension, paralleli a cells
+    positions: Dict[int, int]                       # dimension_id -> indice in cells
+    csv_tails: Tuple[str, ...]                      # ",dimension_id,0,f,\"\"\n"
+    aggregate_rows: Tuple[Tuple[str, str, float, int, int], ...]  # per build_score_snapshot
+
+
+_templates: Dict[str, AnswerTemplate] = {}  # id versione -> template
+_templates_lock = threading.Lock()
+
+
+def _build_template(model_name: str, version: str, model_data: list, ordinals: bool) -> AnswerTemplate:
+    cells = []
+    seen = set()
+    counts: Dict[Tuple[str, str], int] = {}
+    for process_data in model_data:
+        process_name = process_data.get('process', '')
+        for activity in process_data.get('activities', []):
+            activity_name = activity.get('name', '')
+            for category_name, dimensions in activity.get('categories', {}).items():
+                for dimension_name in dimensions.keys():
+                    cell = (process_name, activity_name, category_name, dimension_name)
+                    # Una sola risposta per cella anche se il modello ripete un'attività
+                    if cell in seen:
+                        continue
+                    seen.add(cell)
+                    cells.append(cell)
+                    key = (process_name, category_name)
+                    counts[key] = counts.get(key, 0) + 1
+
+    ids = dimension_catalog.ensure_cells(model_name, cells, ordinals=ordinals)
+    dimension_ids = tuple(ids[cell] for cell in cells)
+    return AnswerTemplate(
+        version=version,
+        cells=tuple(cells),
+        dimension_ids=dimension_ids,
+        positions={dimension_id: i for i, dimension_id in enumerate(dimension_ids)},
+        # note '' (non NULL) e is_not_applicable false, come le righe ORM
+        csv_tails=tuple(f",{dimension_id},0,f,\"\"\n" for dimension_id in dimension_ids),
+        aggregate_rows=tuple((p, c, 0.0, n, 0) for (p, c), n in counts.items()),
+    )
+
+
+def version_template(version: str, model_name: Optional[str] = None, ordinals: bool = False) -> Optional[AnswerTemplate]:
+    """Template delle risposte vuote di una versione del modello, None se la versione non esiste"""
+    with _templates_lock:
+        template = _templates.get(version)
+    if template is not None:
+        return template
+    model_data = model_versions.load_version(version)
+    if model_data is None:
+        return None
+    # ordinals: la versione è quella corrente, le posizioni nel catalogo seguono il suo ordine
+    template = _build_template(
+        model_name or model_versions.version_model_name(version), version, model_data, ordinals
+    )
+    with _templates_lock:
+        _templates.setdefault(version, template)
+    return template
+
+
+def answer_template(model_name: str) -> Optional[AnswerTemplate]:
+    """Template della versione corrente del modello, None se il modello non esiste"""
+    version = model_versions.current_version(model_name)
+    if version is None:
+        return None
+    return version_template(version, model_name, ordinals=True)
+
+
+def session_template(model_name: Optional[str], version: Optional[str]) -> Optional[AnswerTemplate]:
+    """Template di una sessione: la versione a cui è legata, altrimenti quella corrente del modello"""
+    if version:
+        template = version_template(version)
+        if template is not None:
+            return template
+    return answer_template(model_name or DEFAULT_MODEL)
+
+
+@model_store.on_model_change
+def refresh_template(model_name: str) -> None:
+    """Prepara il template (e registra le nuove domande nel catalogo) appena il modello viene salvato"""
+    template = answer_template(model_name)
+    if template is not None:
+        # Versione già nota (es. ripristino di un contenuto precedente): riallinea le posizioni
+        dimension_catalog.ensure_cells(model_name, template.cells)
+
+
+def _insert_answers(db: Session, batch: Iterable[Tuple[uuid.UUID, AnswerTemplate]]) -> int:
+    """Inserisce le risposte vuote di più sessioni nella transazione corrente"""
+    batch = [(session_id, template) for session_id, template in batch if template and template.cells]
+    if SPARSE_ANSWERS or not batch:
+        return 0
+
+    cursor = db.connection().connection.dbapi_connection.cursor()
+    try:
+        if hasattr(cursor, "copy_expert"):
+            payload = io.StringIO()
+            for session_id, template in batch:
+                prefix = str(session_id)
+                payload.writelines(prefix + tail for tail in template.csv_tails)
+            payload.seek(0)
+            cursor.copy_expert(COPY_SQL, payload)
+            return sum(len(template.csv_tails) for _, template in batch)
+    finally:
+        cursor.close()
+
+    rows = [
+        {"session_id": session_id, "dimension_id": dimension_id, "score": 0, "note": "", "is_not_applicable": False}
+        for session_id, template in batch
+        for dimension_id in template.dimension_ids
+    ]
+    db.execute(insert(models.AssessmentAnswer), rows)
+    return len(rows)
+
+
+def _new_session(data: Dict, template: Optional[AnswerTemplate]) -> models.AssessmentSession:
+    session = models.AssessmentSession(**data)
+    session.id = uuid.uuid4()
+    session.model_version = template.version if template else None
+    # Snapshot della sessione vuota (lo stesso che darebbe refresh_session_scores)
+    session.punteggi_json = build_score_snapshot(list(template.aggregate_rows) if template else [])
+    return session
+
+
+def create_session(db: Session, data: Dict) -> models.AssessmentSession:
+    """Crea la sessione (e, in modalità densa, le sue risposte vuote) in un'unica transazione"""
+    model_name = data.get("model_name") or DEFAULT_MODEL
+    template = answer_template(model_name)
+    if template is None:
+        print(f"⚠️ Modello {model_name} non trovato")
+
+    session = _new_session(data, template)
+    db.add(session)
+    try:
+        db.flush()
+        count = _insert_answers(db, [(session.id, template)])
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    db.refresh(session)
+    if count:
+        print(f"✅ Pre-popolate {count} risposte")
+    return session
+
+
+def create_sessions(db: Session, items: List[Dict]) -> List[models.AssessmentSession]:
+    """
+    Crea un lotto di sessioni (es. import CSV): INSERT delle sessioni e, in
+    modalità densa, un solo COPY per tutte le risposte; tutto o niente.
+    I modelli devono esistere.
+    """
+    templates: Dict[str, AnswerTemplate] = {}
+    for data in items:
+        model_name = data.get("model_name") or DEFAULT_MODEL
+        if model_name not in templates:
+            template = answer_template(model_name)
+            if template is None:
+                raise ValueError(f"Modello {model_name} non trovato")
+            templates[model_name] = template
+
+    sessions = []
+    batch = []
+    for data in items:
+        template = templates[data.get("model_name") or DEFAULT_MODEL]
+        session = _new_session(data, template)
+        sessions.append(session)
+        batch.append((session.id, template))
+
+    db.add_all(sessions)
+    try:
+        db.flush()
+        count = _insert_answers(db, batch)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    print(f"✅ Create {len(sessions)} sessioni con {count} risposte")
+    return sessions
+
+
+CLONE_SQL = text("""
+    WITH new_session AS (
+        INSERT INTO assessment_session (
+            id, user_id, company_id, azienda_nome, settore, dimensione, referente,
+            effettuato_da, email, model_name, model_version, creato_il
+        )
+        SELECT CAST(:new_id AS uuid), COALESCE(:user_id, user_id), company_id, azienda_nome, settore, dimensione,
+               COALESCE(:referente, referente), COALESCE(:effettuato_da, effettuato_da),
+               COALESCE(:email, email), model_name, :model_version, :creato_il
+        FROM assessment_session WHERE id = CAST(:source_id AS uuid)
+        RETURNING id
+    )
+    INSERT INTO assessment_answer (session_id, dimension_id, score, is_not_applicable, note)
+    SELECT new_session.id, COALESCE(m.new_id, a.dimension_id), a.score, a.is_not_applicable, a.note
+    FROM new_session
+    JOIN assessment_answer a ON a.session_id = CAST(:source_id AS uuid)
+    LEFT JOIN unnest(CAST(:old_ids AS integer[]), CAST(:new_ids AS integer[])) AS m(old_id, new_id)
+           ON m.old_id = a.dimension_id
+    WHERE COALESCE(m.new_id, a.dimension_id) = ANY(CAST(:dimension_ids AS integer[]))
+    ON CONFLICT (session_id, dimension_id) DO NOTHING
+    RETURNING dimension_id, score, note, is_not_applicable
+""")
+
+
+def clone_session(db: Session, source_id: uuid.UUID, to_version: Optional[str] = None,
+                  overrides: Optional[Dict] = None) -> Optional[models.AssessmentSession]:
+    """
+    Nuova sessione aperta con intestazione e risposte di source_id, sulla
+    versione to_version (default: la stessa della sessione di partenza).
+    Dell'intestazione si copiano azienda (company_id, azienda_nome, settore,
+    dimensione), user_id, referente, effettuato_da, email (sostituibili con
+    overrides) e model_name; non il logo, il cui file appartiene alla sessione
+    di partenza e viene cancellato quando questa lo sostituisce o lo elimina.
+    Si copiano solo le risposte alle domande della versione di destinazione;
+    None se la sessione di partenza non esiste.
+    """
+    from app.services import answer_grid, model_migration
+
+    S = models.AssessmentSession
+    source = db.query(S.id, S.model_name, S.model_version).filter(S.id == source_id).first()
+    if source is None:
+        return None
+    model_name = source.model_name or DEFAULT_MODEL
+    from_version = source.model_version or model_versions.current_version(model_name)
+    to_version = to_version or from_version
+    if to_version is None or model_versions.version_model_name(to_version) != model_name:
+        raise ValueError(f"Versione del modello {model_name} non trovata")
+
+    id_map = {}
+    if from_version != to_version:
+        id_map = model_migration.plan(model_name, from_version, to_version).id_map
+    template = version_template(to_version)
+
+    new_id = uuid.uuid4()
+    params = {
+        "new_id": str(new_id), "source_id": str(source_id), "model_version": to_version,
+        "creato_il": datetime.now(), "old_ids": list(id_map), "new_ids": list(id_map.values()),
+        "dimension_ids": list(template.dimension_ids),
+        **{key: (overrides or {}).get(key) for key in ("user_id", "referente", "effettuato_da", "email")},
+    }
+    try:
+        rows = db.execute(CLONE_SQL, params).all()
+        aggregate = [
+            (process, category, s.score_sum, s.applicable, s.not_applicable)
+            for (process, category), s in answer_grid.process_category_stats(rows, template).items()
+        ]
+        db.query(S).filter(S.id == new_id).update(
+            {S.punteggi_json: build_score_snapshot(aggregate)}, synchronize_session=False
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    print(f"✅ Sessione {source_id} clonata in {new_id} con {len(rows)} risposte")
+    return db.get(S, new_id)
+
+
+def read_sessions_csv(fileobj) -> Tuple[List[Dict], List[str]]:
+    """
+    Righe di un CSV di onboarding (una azienda per riga, intestazioni = campi di
+    AssessmentSessionCreate, separatore , o ;) validate; restituisce (dati, errori)
+    """
+    from pydantic import ValidationError
+    from app import schemas
+
+    text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+    sample = text.read(4096)
+    text.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;")
+    except csv.Error:
+        dialect = csv.excel
+
+    items, errors = [], []
+    reader = csv.DictReader(text, dialect=dialect)
+    for line, row in enumerate(reader, start=2):
+        row = {k.strip(): (v.strip() if isinstance(v, str) else v) for k, v in row.items() if k}
+        row = {k: v for k, v in row.items() if v not in (None, "")}
+        try:
+            items.append(schemas.AssessmentSessionCreate(**row).dict())
+        except ValidationError as e:
+            fields = ", ".join(".".join(str(p) for p in err["loc"]) for err in e.errors())
+            errors.append(f"Riga {line}: campi non validi ({fields})")
+        if len(items) > MAX_BATCH_SIZE:
+            errors.append(f"Massimo {MAX_BATCH_SIZE} aziende per import")
+            break
+    text.detach()
+    return items, errors
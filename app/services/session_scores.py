@@ -0,0 +1,182 @@
+"""
+Snapshot dei punteggi di una sessione salvato in assessment_session.punteggi_json (JSONB)
+
+Struttura:
+{
+  "version": 1,
+  "overall": 2.4,
+  "applicable": 724,
+  "not_applicable": 46,
+  "by_category": {"Governance": 2.1, "Technology": 1.8, ...},
+  "by_process": {"MKTG": 2.6, ...},
+  "by_process_category": {"MKTG": {"Governance": 2.5, ...}, ...},
+  "updated_at": "2025-11-20T10:00:00"
+}
+
+Le medie escludono le domande non applicabili, come gli endpoint radar.
+Tenendo il riepilogo in JSONB le analisi cross-sessione diventano query
+indicizzate (vedi migrations/002) invece di scansioni in Python.
+"""
+
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import func, cast, literal, Float, Text
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Session
+
+from app import models
+
+SNAPSHOT_VERSION = 1
+
+# Domini standard del modello Politecnico
+DOMAINS = ["Governance", "Monitoring & Control", "Technology", "Organization"]
+
+# Operatori ammessi nei filtri sul punteggio
+SCORE_OPERATORS = {
+    "lt": lambda col, v: col < v,
+    "lte": lambda col, v: col <= v,
+    "gt": lambda col, v: col > v,
+    "gte": lambda col, v: col >= v,
+    "eq": lambda col, v: col == v,
+}
+
+
+def build_score_snapshot(rows: List[Tuple[str, str, float, int, int]]) -> Dict:
+    """
+    Costruisce lo snapshot da righe aggregate
+    (process, category, somma score applicabili, n applicabili, n non applicabili)
+    """
+    by_pc_sum: Dict[str, Dict[str, List[float]]] = {}
+    cat_acc: Dict[str, List[float]] = {}
+    proc_acc: Dict[str, List[float]] = {}
+    total_sum, total_app, total_na = 0.0, 0, 0
+
+    for process, category, score_sum, applicable, not_applicable in rows:
+        score_sum = float(score_sum or 0)
+        applicable = int(applicable or 0)
+        total_na += int(not_applicable or 0)
+        if applicable == 0:
+            continue
+        total_sum += score_sum
+        total_app += applicable
+        by_pc_sum.setdefault(process, {})[category] = [score_sum, applicable]
+        acc = cat_acc.setdefault(category, [0.0, 0])
+        acc[0] += score_sum
+        acc[1] += applicable
+        acc = proc_acc.setdefault(process, [0.0, 0])
+        acc[0] += score_sum
+        acc[1] += applicable
+
+    return {
+        "version": SNAPSHOT_VERSION,
+        "overall": round(total_sum / total_app, 4) if total_app else None,
+        "applicable": total_app,
+        "not_applicable": total_na,
+        "by_category": {c: round(s / n, 4) for c, (s, n) in cat_acc.items()},
+        "by_process": {p: round(s / n, 4) for p, (s, n) in proc_acc.items()},
+        "by_process_category": {
+            p: {c: round(s / n, 4) for c, (s, n) in cats.items()}
+            for p, cats in by_pc_sum.items()
+        },
+        "updated_at": datetime.now().isoformat(),
+    }
+
+
+def _aggregate_rows(db: Session, session_id: UUID) -> List[Tuple[str, str, float, int, int]]:
+    # Griglia completa (risposte salvate + celle vuote del modello), vedi answer_grid
+    from app.services import answer_grid
+
+    answers = answer_grid.load_answers(db, session_id)
+    return [
+        (process, category, s.score_sum, s.applicable, s.not_applicable)
+        for (process, category), s in answer_grid.group_stats(answers, "process", "category").items()
+    ]
+
+
+def refresh_session_scores(db: Session, session_id: UUID, commit: bool = True) -> Optional[Dict]:
+    """Ricalcola e salva lo snapshot JSONB della sessione"""
+    # Le sessioni hanno autoflush disattivato: le modifiche pendenti devono
+    # arrivare al database prima dell'aggregazione
+    db.flush()
+    snapshot = build_score_snapshot(_aggregate_rows(db, session_id))
+    db.query(models.AssessmentSession).filter(
+        models.AssessmentSession.id == session_id
+    ).update({models.AssessmentSession.punteggi_json: snapshot}, synchronize_session=False)
+    if commit:
+        db.commit()
+    return snapshot
+
+
+def json_score_expr(*keys: str):
+    """
+    Espressione SQL (punteggi_json -> k1 -> ... ->> kn)::float.
+    Usa gli operatori -> / ->> con chiavi letterali (non il subscripting jsonb[...])
+    così Postgres riconosce le espressioni indicizzate della migrations/002.
+    """
+    expr = models.AssessmentSession.punteggi_json
+    for key in keys[:-1]:
+        expr = expr.op("->", return_type=JSONB)(literal(key, literal_execute=True))
+    expr = expr.op("->>", return_type=Text)(literal(keys[-1], literal_execute=True))
+    return cast(expr, Float)
+
+
+def category_score_expr(category: str):
+    """Media del dominio dallo snapshot JSONB (indicizzata per i 4 domini)"""
+    return json_score_expr("by_category", category)
+
+
+def process_score_expr(process: str):
+    """Media del processo dallo snapshot JSONB"""
+    return json_score_expr("by_process", process)
+
+
+def process_category_score_expr(process: str, category: str):
+    """Media processo × dominio dallo snapshot JSONB"""
+    return json_score_expr("by_process_category", process, category)
+
+
+def overall_score_expr():
+    return json_score_expr("overall")
+
+
+def score_filter(expr, op: str, value: float):
+    """Filtro SQL sul punteggio, es. score_filter(category_score_expr('Technology'), 'lt', 2)"""
+    if op not in SCORE_OPERATORS:
+        raise ValueError(f"Operatore non supportato: {op}")
+    return SCORE_OPERATORS[op](expr, value)
+
+
+def aggregate_category_scores(db: Session, group_by: Optional[str] = None, filters: Optional[list] = None) -> List[Dict]:
+    """
+    Media per dominio su tutte le sessioni, calcolata dal database.
+    group_by: None, "settore", "dimensione" o "model_name"
+    """
+    S = models.AssessmentSession
+    group_col = getattr(S, group_by) if group_by else None
+    columns = [func.count(S.id).label("sessions")]
+    columns += [func.avg(category_score_expr(d)).label(d) for d in DOMAINS]
+    columns.append(func.avg(overall_score_expr()).label("overall"))
+    if group_col is not None:
+        columns.insert(0, group_col.label("group"))
+
+    query = db.query(*columns).filter(S.punteggi_json.is_not(None))
+    for f in filters or []:
+        query = query.filter(f)
+    if group_col is not None:
+        query = query.group_by(group_col).order_by(group_col)
+
+    output = []
+    for row in query.all():
+        data = row._asdict()
+        item = {
+            "group": data.get("group"),
+            "sessions": data["sessions"],
+            "overall": round(float(data["overall"]), 2) if data["overall"] is not None else None,
+            "by_category": {
+                d: round(float(data[d]), 2) if data[d] is not None else None for d in DOMAINS
+            },
+        }
+        output.append(item)
+    return output
@@ -0,0 +1,170 @@
+"""
+Benchmark storage delle risposte: layout storico di assessment_result (UUID +
+quattro stringhe per riga, tutte le celle pre-popolate) contro assessment_answer
+(session_id, dimension_id) con il catalogo model_dimension, denso e sparso.
+
+Le tre tabelle sono create come TEMP sul database di DATABASE_URL (spariscono
+alla disconnessione) e riempite con COPY con le stesse risposte casuali sulle
+celle di un modello. Per ciascuna si misurano dimensione (heap + indici), tempo
+di lettura delle risposte di una sessione (quello che fanno radar, risultati e
+PDF) e tempo dell'aggregazione per sessione × processo × dominio su tutte le
+sessioni (backfill dello snapshot punteggi, vedi migrations/002).
+La tabella storica ha solo la chiave primaria su id, come in produzione.
+
+Uso (dalla root del repository, con le migrazioni applicate):
+  python -m benchmarks.answer_storage --sessions 500 --answered 0.3
+"""
+
+import argparse
+import io
+import random
+import statistics
+import time
+import uuid
+
+from app.database import engine
+from app.services import session_factory
+
+LAYOUTS = {
+    "assessment_result (storico)": """
+        CREATE TEMP TABLE bench_result (
+            id UUID PRIMARY KEY, session_id UUID NOT NULL,
+            process VARCHAR NOT NULL, activity VARCHAR NOT NULL,
+            category VARCHAR NOT NULL, dimension VARCHAR NOT NULL,
+            score INTEGER NOT NULL, note TEXT, is_not_applicable BOOLEAN NOT NULL
+        )""",
+    "assessment_answer densa": """
+        CREATE TEMP TABLE bench_answer_dense (
+            session_id UUID NOT NULL, dimension_id INTEGER NOT NULL,
+            score SMALLINT NOT NULL, is_not_applicable BOOLEAN NOT NULL, note TEXT,
+            PRIMARY KEY (session_id, dimension_id)
+        )""",
+    "assessment_answer sparsa": """
+        CREATE TEMP TABLE bench_answer_sparse (
+            session_id UUID NOT NULL, dimension_id INTEGER NOT NULL,
+            score SMALLINT NOT NULL, is_not_applicable BOOLEAN NOT NULL, note TEXT,
+            PRIMARY KEY (session_id, dimension_id)
+        )""",
+}
+
+TABLES = {
+    "assessment_result (storico)": "bench_result",
+    "assessment_answer densa": "bench_answer_dense",
+    "assessment_answer sparsa": "bench_answer_sparse",
+}
+
+AGGREGATE_LEGACY = """
+    SELECT session_id, process, category,
+           SUM(CASE WHEN NOT is_not_applicable THEN score ELSE 0 END),
+           COUNT(*) FILTER (WHERE NOT is_not_applicable),
+           COUNT(*) FILTER (WHERE is_not_applicable)
+    FROM bench_result GROUP BY session_id, process, category
+"""
+
+AGGREGATE_ANSWER = """
+    SELECT a.session_id, d.process, d.category,
+           SUM(CASE WHEN NOT a.is_not_applicable THEN a.score ELSE 0 END),
+           COUNT(*) FILTER (WHERE NOT a.is_not_applicable),
+           COUNT(*) FILTER (WHERE a.is_not_applicable)
+    FROM {table} a JOIN model_dimension d ON d.id = a.dimension_id
+    GROUP BY a.session_id, d.process, d.category
+"""
+
+READ_LEGACY = """
+    SELECT process, activity, category, dimension, score, note, is_not_applicable
+    FROM bench_result WHERE session_id = %s
+"""
+
+READ_ANSWER = """
+    SELECT dimension_id, score, note, is_not_applicable FROM {table} WHERE session_id = %s
+"""
+
+
+def _csv_field(value: str) -> str:
+    return '"' + value.replace('"', '""') + '"'
+
+
+def _payloads(template, sessions: int, answered: float, seed: int):
+    """Righe CSV per i tre layout con le stesse risposte"""
+    rng = random.Random(seed)
+    legacy, dense, sparse = io.StringIO(), io.StringIO(), io.StringIO()
+    cells = [",".join(_csv_field(v) for v in cell) for cell in template.cells]
+    session_ids = [uuid.uuid4() for _ in range(sessions)]
+    for session_id in session_ids:
+        for cell, dimension_id in zip(cells, template.dimension_ids):
+            score, not_applicable = 0, "f"
+            if rng.random() < answered:
+                not_applicable = "t" if rng.random() < 0.05 else "f"
+                score = 0 if not_applicable == "t" else rng.randint(1, 5)
+            legacy.write(f"{uuid.uuid4()},{session_id},{cell},{score},\"\",{not_applicable}\n")
+            dense.write(f"{session_id},{dimension_id},{score},{not_applicable},\"\"\n")
+            if score or not_applicable == "t":
+                sparse.write(f"{session_id},{dimension_id},{score},{not_applicable},\n")
+    return session_ids, {
+        "assessment_result (storico)": legacy,
+        "assessment_answer densa": dense,
+        "assessment_answer sparsa": sparse,
+    }
+
+
+def run_benchmark(model_name: str, sessions: int, answered: float, repeat: int) -> None:
+    template = session_factory.answer_template(model_name)
+    if template is None:
+        raise SystemExit(f"Modello {model_name} non trovato")
+    session_ids, payloads = _payloads(template, sessions, answered, seed=0)
+    sample = random.Random(1).sample(session_ids, min(50, len(session_ids)))
+
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        results = {}
+        for layout, ddl in LAYOUTS.items():
+            table = TABLES[layout]
+            cursor.execute(ddl)
+            payload = payloads[layout]
+            payload.seek(0)
+            cursor.copy_expert(f"COPY {table} FROM STDIN WITH (FORMAT csv)", payload)
+            cursor.execute(f"ANALYZE {table}")
+            cursor.execute(f"SELECT count(*), pg_total_relation_size('{table}') FROM {table}")
+            rows, size = cursor.fetchone()
+
+            read = READ_LEGACY if table == "bench_result" else READ_ANSWER.format(table=table)
+            reads = []
+            for session_id in sample:
+                start = time.perf_counter()
+                cursor.execute(read, (str(session_id),))
+                cursor.fetchall()
+                reads.append(time.perf_counter() - start)
+
+            query = AGGREGATE_LEGACY if table == "bench_result" else AGGREGATE_ANSWER.format(table=table)
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                cursor.execute(query)
+                cursor.fetchall()
+                timings.append(time.perf_counter() - start)
+            results[layout] = (rows, size, statistics.median(reads), statistics.median(timings))
+        raw.rollback()
+    finally:
+        raw.close()
+
+    print(f"{sessions} sessioni × {len(template.cells)} celle, {answered:.0%} risposte ({model_name})")
+    _, base_size, base_read, base_aggregate = results["assessment_result (storico)"]
+    for layout, (rows, size, read, aggregate) in results.items():
+        print(f"  {layout:<28} {rows:>9} righe  {size / 1024 / 1024:7.1f} MB ({base_size / size:4.1f}x)  "
+              f"sessione {read * 1000:7.2f} ms ({base_read / read:5.1f}x)  "
+              f"aggregazione {aggregate * 1000:7.1f} ms ({base_aggregate / aggregate:4.1f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark storage risposte")
+    parser.add_argument("--model", default=session_factory.DEFAULT_MODEL)
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument("--answered", type=float, default=0.3, help="quota di celle con una risposta")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    run_benchmark(args.model, args.sessions, args.answered, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
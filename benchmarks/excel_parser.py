@@ -0,0 +1,164 @@
+"""
+Benchmark parser dei modelli Excel: backend pandas (read_excel + DataFrame)
+contro backend openpyxl in streaming (read_only, values_only, una passata).
+
+Verifica che i due backend restituiscano lo stesso dizionario, sui workbook
+indicati oppure su workbook di esempio generati nel layout atteso dal parser
+(titolo in riga 1, domande in riga 3, una riga per processo::attività).
+Con --fuzz genera anche workbook con celle "sporche" (N/A, testi, vuoti,
+numeri come testo) per confrontare i casi limite.
+
+Uso (dalla root del repository):
+  python -m benchmarks.excel_parser --rows 2000 --repeat 5
+  python -m benchmarks.excel_parser modello1.xlsx modello2.xlsx
+  python -m benchmarks.excel_parser --fuzz 200
+"""
+
+import argparse
+import logging
+import os
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+from openpyxl import Workbook
+
+from app.services.excel_parser import ExcelAssessmentParser
+
+# Colonne domande per dimensione (vedi ExcelAssessmentParser.dimension_mapping)
+QUESTION_COLUMNS = list(range(1, 7)) + list(range(8, 12)) + list(range(14, 17)) + list(range(19, 21))
+NOTE_COLUMNS = [7, 12, 17, 21]
+
+
+def sample_workbook(path: str, rows: int, seed: int = 0) -> None:
+    """Workbook di esempio: `rows` attività distribuite su 10 processi"""
+    rng = random.Random(seed)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Modello")
+    width = max(QUESTION_COLUMNS + NOTE_COLUMNS) + 1
+
+    ws.append(["Modello di esempio"])
+    header = [None] * width
+    for col, label in ((1, "Governance"), (8, "Monitoring & Control"), (14, "Technology"), (19, "Organization")):
+        header[col] = label
+    ws.append(header)
+    questions = [None] * width
+    for col in QUESTION_COLUMNS:
+        questions[col] = f"Domanda {col}"
+    for col in NOTE_COLUMNS:
+        questions[col] = "note"
+    ws.append(questions)
+
+    for i in range(rows):
+        row = [None] * width
+        row[0] = f"PROCESSO {i % 10}::Attività {i}"
+        for col in QUESTION_COLUMNS:
+            roll = rng.random()
+            row[col] = "N/A" if roll < 0.05 else (None if roll < 0.1 else rng.randint(0, 5))
+        for col in NOTE_COLUMNS:
+            if rng.random() < 0.2:
+                row[col] = f"Nota {i}"
+        ws.append(row)
+    wb.save(path)
+
+
+_NOISE = [None, "", " ", "N/A", "NA", "null", "#DIV/0!", "testo", "3", " 2 ", "1.5", "0",
+          0, 1, 2.0, 2.5, 4.75, -1, True]
+
+
+def fuzz_workbook(path: str, seed: int) -> None:
+    """Workbook piccolo con celle scelte a caso tra valori validi e casi limite"""
+    rng = random.Random(seed)
+    wb = Workbook()
+    ws = wb.active
+    height = rng.randint(0, 12) if seed % 10 == 0 else rng.randint(4, 12)
+    width = rng.randint(1, 24) if seed % 10 == 0 else rng.randint(21, 24)
+    for r in range(1, height + 1):
+        for c in range(1, width + 1):
+            roll = rng.random()
+            if roll < 0.35:
+                continue
+            if r == 3 and c > 1 and roll < 0.9:
+                ws.cell(r, c, f"Domanda {c}")
+            elif c == 1 and roll < 0.7:
+                ws.cell(r, c, rng.choice([f"P{r}::A{r}", f"Processo {r}", 7, 3.0, "0"]))
+            else:
+                ws.cell(r, c, rng.choice(_NOISE))
+    wb.save(path)
+
+
+def _parse(backend: str, path: str):
+    try:
+        return ExcelAssessmentParser(backend).parse_excel_file(path)
+    except ValueError as e:
+        # Confronta solo il tipo di errore (i messaggi interni di pandas differiscono)
+        return ("errore", "Domande mancanti" in str(e))
+
+
+def _measure(backend: str, path: str, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        _parse(backend, path)
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    _parse(backend, path)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return timings, peak
+
+
+def run_fuzz(count: int) -> int:
+    mismatches = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "fuzz.xlsx")
+        for seed in range(count):
+            fuzz_workbook(path, seed)
+            expected, actual = _parse("pandas", path), _parse("openpyxl", path)
+            if expected != actual:
+                mismatches += 1
+                print(f"  seed {seed}: differenze\n    pandas:   {expected}\n    openpyxl: {actual}")
+    print(f"Fuzz: {count - mismatches}/{count} workbook identici")
+    return mismatches
+
+
+def run_benchmark(paths: list, repeat: int) -> None:
+    for path in paths:
+        same = _parse("pandas", path) == _parse("openpyxl", path)
+        print(f"{os.path.basename(path)} ({os.path.getsize(path) / 1024:.0f} KB) - output identico: {'sì' if same else 'NO'}")
+        results = {backend: _measure(backend, path, repeat) for backend in ("pandas", "openpyxl")}
+        for backend, (timings, peak) in results.items():
+            print(f"  {backend:>8}: mediana {statistics.median(timings) * 1000:8.1f} ms  "
+                  f"picco memoria {peak / 1024 / 1024:6.1f} MB")
+        speedup = statistics.median(results["pandas"][0]) / statistics.median(results["openpyxl"][0])
+        print(f"   speedup: {speedup:.1f}x (mediane)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parser modelli Excel")
+    parser.add_argument("paths", nargs="*", help="workbook da confrontare (default: esempi generati)")
+    parser.add_argument("--rows", type=int, default=1000, help="attività nei workbook di esempio")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--fuzz", type=int, default=0, help="numero di workbook casuali da confrontare")
+    args = parser.parse_args()
+    logging.disable(logging.ERROR)
+
+    if args.fuzz:
+        raise SystemExit(1 if run_fuzz(args.fuzz) else 0)
+
+    if args.paths:
+        run_benchmark(args.paths, args.repeat)
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for rows in sorted({max(args.rows // 10, 1), args.rows}):
+            path = os.path.join(tmp, f"esempio_{rows}.xlsx")
+            sample_workbook(path, rows)
+            paths.append(path)
+        run_benchmark(paths, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
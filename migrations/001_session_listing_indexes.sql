@@ -0,0 +1,17 @@
+-- Indici per la lista sessioni paginata (/api/assessment/sessions/page)
+-- Applicare con: psql "$DATABASE_URL" -f migrations/001_session_listing_indexes.sql
+
+-- Keyset pagination su (creato_il, id) in ordine decrescente
+CREATE INDEX IF NOT EXISTS ix_assessment_session_creato_il_id
+    ON assessment_session (creato_il DESC, id DESC);
+
+-- Filtri più usati dalla dashboard
+CREATE INDEX IF NOT EXISTS ix_assessment_session_settore ON assessment_session (settore);
+CREATE INDEX IF NOT EXISTS ix_assessment_session_dimensione ON assessment_session (dimensione);
+CREATE INDEX IF NOT EXISTS ix_assessment_session_open
+    ON assessment_session (creato_il DESC, id DESC) WHERE data_chiusura IS NULL;
+
+-- Ricerca testuale ILIKE '%...%' su azienda_nome
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS ix_assessment_session_azienda_nome_trgm
+    ON assessment_session USING gin (azienda_nome gin_trgm_ops);
@@ -0,0 +1,87 @@
+-- risposte_json / punteggi_json: da TEXT a JSONB + snapshot punteggi per analytics
+-- Applicare con: psql "$DATABASE_URL" -f migrations/002_jsonb_session_payload.sql
+-- raccomandazioni e pareto_recommendations restano TEXT: sono markdown, non JSON.
+
+BEGIN;
+
+-- Conversione tollerante: il testo non JSON viene scartato (NULL) invece di far fallire la migrazione
+CREATE OR REPLACE FUNCTION pg_temp.try_jsonb(value text) RETURNS jsonb AS $$
+BEGIN
+    IF value IS NULL OR btrim(value) = '' THEN
+        RETURN NULL;
+    END IF;
+    RETURN value::jsonb;
+EXCEPTION WHEN others THEN
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
+
+ALTER TABLE assessment_session
+    ALTER COLUMN risposte_json TYPE jsonb USING pg_temp.try_jsonb(risposte_json),
+    ALTER COLUMN punteggi_json TYPE jsonb USING pg_temp.try_jsonb(punteggi_json);
+
+-- Backfill dello snapshot punteggi (stesso formato di app/services/session_scores.py)
+WITH pc AS (
+    SELECT session_id, process, category,
+           SUM(CASE WHEN NOT is_not_applicable THEN score ELSE 0 END)::numeric AS s,
+           COUNT(*) FILTER (WHERE NOT is_not_applicable) AS n,
+           COUNT(*) FILTER (WHERE is_not_applicable) AS na
+    FROM assessment_result
+    GROUP BY session_id, process, category
+),
+tot AS (
+    SELECT session_id, SUM(s) AS s, SUM(n) AS n, SUM(na) AS na
+    FROM pc GROUP BY session_id
+),
+cat AS (
+    SELECT session_id, jsonb_object_agg(category, round(s / n, 4)) AS j
+    FROM (SELECT session_id, category, SUM(s) AS s, SUM(n) AS n FROM pc GROUP BY session_id, category) x
+    WHERE n > 0 GROUP BY session_id
+),
+proc AS (
+    SELECT session_id, jsonb_object_agg(process, round(s / n, 4)) AS j
+    FROM (SELECT session_id, process, SUM(s) AS s, SUM(n) AS n FROM pc GROUP BY session_id, process) x
+    WHERE n > 0 GROUP BY session_id
+),
+proc_cat AS (
+    SELECT session_id, jsonb_object_agg(process, j) AS j
+    FROM (
+        SELECT session_id, process, jsonb_object_agg(category, round(s / n, 4)) AS j
+        FROM pc WHERE n > 0 GROUP BY session_id, process
+    ) x
+    GROUP BY session_id
+)
+UPDATE assessment_session a
+SET punteggi_json = jsonb_build_object(
+        'version', 1,
+        'overall', CASE WHEN tot.n > 0 THEN round(tot.s / tot.n, 4) END,
+        'applicable', tot.n,
+        'not_applicable', tot.na,
+        'by_category', COALESCE(cat.j, '{}'::jsonb),
+        'by_process', COALESCE(proc.j, '{}'::jsonb),
+        'by_process_category', COALESCE(proc_cat.j, '{}'::jsonb),
+        'updated_at', to_char(now(), 'YYYY-MM-DD"T"HH24:MI:SS')
+    )
+FROM tot
+LEFT JOIN cat USING (session_id)
+LEFT JOIN proc USING (session_id)
+LEFT JOIN proc_cat USING (session_id)
+WHERE a.id = tot.session_id;
+
+-- Containment / jsonpath (@>, @?) su tutto lo snapshot
+CREATE INDEX IF NOT EXISTS ix_assessment_session_punteggi_gin
+    ON assessment_session USING gin (punteggi_json jsonb_path_ops);
+
+-- Filtri di range sui 4 domini e sul punteggio complessivo (es. Technology < 2)
+CREATE INDEX IF NOT EXISTS ix_assessment_session_score_overall
+    ON assessment_session (((punteggi_json ->> 'overall')::float));
+CREATE INDEX IF NOT EXISTS ix_assessment_session_score_governance
+    ON assessment_session (((punteggi_json -> 'by_category' ->> 'Governance')::float));
+CREATE INDEX IF NOT EXISTS ix_assessment_session_score_monitoring
+    ON assessment_session (((punteggi_json -> 'by_category' ->> 'Monitoring & Control')::float));
+CREATE INDEX IF NOT EXISTS ix_assessment_session_score_technology
+    ON assessment_session (((punteggi_json -> 'by_category' ->> 'Technology')::float));
+CREATE INDEX IF NOT EXISTS ix_assessment_session_score_organization
+    ON assessment_session (((punteggi_json -> 'by_category' ->> 'Organization')::float));
+
+COMMIT;
@@ -0,0 +1,29 @@
+-- Rollup di portafoglio precalcolati sulle sessioni chiuse
+-- (vedi app/services/portfolio.py). Dopo la creazione popolare con
+-- POST /api/analytics/portfolio/rebuild; da lì in poi l'aggiornamento è incrementale.
+-- Applicare con: psql "$DATABASE_URL" -f migrations/003_portfolio_rollup.sql
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS portfolio_rollup (
+    id           SERIAL PRIMARY KEY,
+    group_type   VARCHAR NOT NULL,
+    group_value  VARCHAR NOT NULL DEFAULT '',
+    process      VARCHAR NOT NULL DEFAULT '',
+    category     VARCHAR NOT NULL DEFAULT '',
+    n            INTEGER NOT NULL DEFAULT 0,
+    score_sum    DOUBLE PRECISION NOT NULL DEFAULT 0,
+    score_sum_sq DOUBLE PRECISION NOT NULL DEFAULT 0,
+    histogram    JSONB NOT NULL,
+    updated_at   TIMESTAMP NOT NULL DEFAULT now(),
+    CONSTRAINT uq_portfolio_rollup_key UNIQUE (group_type, group_value, process, category)
+);
+
+CREATE TABLE IF NOT EXISTS portfolio_member (
+    session_id UUID PRIMARY KEY REFERENCES assessment_session(id) ON DELETE CASCADE,
+    groups     JSONB NOT NULL,
+    snapshot   JSONB NOT NULL,
+    added_at   TIMESTAMP NOT NULL DEFAULT now()
+);
+
+COMMIT;
@@ -0,0 +1,19 @@
+-- Storage sparso delle risposte (vedi app/services/answer_grid.py):
+-- elimina le righe assessment_result pre-popolate e mai modificate
+-- (score 0, nessuna nota, applicabili). In lettura le celle mancanti
+-- vengono ricostruite dal modello con gli stessi valori, quindi radar,
+-- risultati, PDF e snapshot non cambiano.
+-- Opzionale: le sessioni dense restano leggibili anche senza questa migrazione.
+-- Non applicare se il backend gira con SPARSE_ANSWERS=0.
+-- Applicare con: psql "$DATABASE_URL" -f migrations/004_sparse_answers.sql
+
+BEGIN;
+
+DELETE FROM assessment_result
+WHERE score = 0
+  AND NOT is_not_applicable
+  AND COALESCE(note, '') = '';
+
+COMMIT;
+
+VACUUM ANALYZE assessment_result;
@@ -0,0 +1,100 @@
+-- Catalogo delle domande dei modelli e risposte compatte per chiave intera
+-- (vedi app/services/dimension_catalog.py).
+--
+-- model_dimension: una riga per domanda (processo, attività, dominio, domanda)
+-- di ciascun modello, con id intero e posizione nel modello. Le domande che
+-- restano uguali tra una revisione e l'altra del modello mantengono l'id.
+-- assessment_answer: (session_id, dimension_id) → score, nota, non applicabile,
+-- al posto delle quattro stringhe e dell'UUID ripetuti su ogni riga.
+--
+-- assessment_result diventa una vista con le colonne di prima, per le query
+-- (report, export, analisi ad hoc) che leggono ancora per stringhe; la vista
+-- è in sola lettura, le scritture vanno su assessment_answer.
+-- La tabella originale resta come assessment_result_legacy: eliminarla con
+--   DROP TABLE assessment_result_legacy;
+-- dopo aver verificato il backfill.
+--
+-- Applicare con: psql "$DATABASE_URL" -f migrations/005_model_dimension.sql
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS model_dimension (
+    id         SERIAL PRIMARY KEY,
+    model_name TEXT NOT NULL,
+    ordinal    INTEGER NOT NULL DEFAULT 0,
+    process    TEXT NOT NULL,
+    activity   TEXT NOT NULL,
+    category   TEXT NOT NULL,
+    dimension  TEXT NOT NULL,
+    CONSTRAINT uq_model_dimension_cell UNIQUE (model_name, process, activity, category, dimension)
+);
+
+-- Colonne in ordine di allineamento (uuid, int4, int2, bool, text)
+CREATE TABLE IF NOT EXISTS assessment_answer (
+    session_id        UUID NOT NULL REFERENCES assessment_session(id) ON DELETE CASCADE,
+    dimension_id      INTEGER NOT NULL REFERENCES model_dimension(id),
+    score             SMALLINT NOT NULL DEFAULT 0,
+    is_not_applicable BOOLEAN NOT NULL DEFAULT false,
+    note              TEXT,
+    PRIMARY KEY (session_id, dimension_id)
+);
+
+-- Backfill solo se assessment_result è ancora la tabella originale
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM information_schema.tables
+        WHERE table_schema = current_schema()
+          AND table_name = 'assessment_result' AND table_type = 'BASE TABLE'
+    ) THEN
+        -- Domande presenti nelle risposte; la posizione viene riallineata al
+        -- modello dall'applicazione quando il modello viene caricato o salvato
+        INSERT INTO model_dimension (model_name, ordinal, process, activity, category, dimension)
+        SELECT model_name, row_number() OVER (PARTITION BY model_name ORDER BY process, activity, category, dimension),
+               process, activity, category, dimension
+        FROM (
+            SELECT DISTINCT COALESCE(s.model_name, 'i40_assessment_fto') AS model_name,
+                   r.process, r.activity, r.category, r.dimension
+            FROM assessment_result r
+            JOIN assessment_session s ON s.id = r.session_id
+        ) cells
+        ON CONFLICT ON CONSTRAINT uq_model_dimension_cell DO NOTHING;
+
+        -- Le righe vuote (score 0, senza nota, applicabili) non servono:
+        -- vengono ricostruite dal modello in lettura (migrations/004)
+        INSERT INTO assessment_answer (session_id, dimension_id, score, is_not_applicable, note)
+        SELECT DISTINCT ON (r.session_id, d.id)
+               r.session_id, d.id, r.score, r.is_not_applicable, r.note
+        FROM assessment_result r
+        JOIN assessment_session s ON s.id = r.session_id
+        JOIN model_dimension d
+          ON d.model_name = COALESCE(s.model_name, 'i40_assessment_fto')
+         AND d.process = r.process AND d.activity = r.activity
+         AND d.category = r.category AND d.dimension = r.dimension
+        WHERE r.score <> 0 OR r.is_not_applicable OR COALESCE(r.note, '') <> ''
+        ORDER BY r.session_id, d.id
+        ON CONFLICT (session_id, dimension_id) DO NOTHING;
+
+        ALTER TABLE assessment_result RENAME TO assessment_result_legacy;
+    END IF;
+END $$;
+
+-- Vista di compatibilità con le colonne della vecchia tabella
+CREATE OR REPLACE VIEW assessment_result AS
+SELECT md5(a.session_id::text || ':' || a.dimension_id)::uuid AS id,
+       a.session_id,
+       d.process,
+       d.activity,
+       d.category,
+       d.dimension,
+       a.score::integer AS score,
+       a.note,
+       a.is_not_applicable,
+       a.dimension_id
+FROM assessment_answer a
+JOIN model_dimension d ON d.id = a.dimension_id;
+
+COMMIT;
+
+ANALYZE model_dimension;
+ANALYZE assessment_answer;
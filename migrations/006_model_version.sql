@@ -0,0 +1,33 @@
+-- Versioni immutabili dei modelli, indirizzate per contenuto
+-- (vedi app/services/model_versions.py).
+--
+-- model_version: una riga per contenuto distinto di un modello; l'id è lo
+-- SHA-256 di nome del modello + JSON in forma canonica, per cui salvare di
+-- nuovo lo stesso modello non crea righe. Le versioni non vengono mai modificate.
+-- assessment_session.model_version: versione su cui la sessione è stata
+-- creata. Le sessioni esistenti restano NULL e continuano a usare il file
+-- corrente del modello; le versioni vengono pubblicate dall'applicazione
+-- la prima volta che carica (o salva) ciascun modello.
+--
+-- Applicare con: psql "$DATABASE_URL" -f migrations/006_model_version.sql
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS model_version (
+    id         TEXT PRIMARY KEY,
+    model_name TEXT NOT NULL,
+    content    JSON NOT NULL,  -- JSON (non JSONB): conserva l'ordine delle chiavi del modello
+    size       INTEGER NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS ix_model_version_model_created
+    ON model_version (model_name, created_at DESC);
+
+ALTER TABLE assessment_session
+    ADD COLUMN IF NOT EXISTS model_version TEXT REFERENCES model_version(id);
+
+CREATE INDEX IF NOT EXISTS ix_assessment_session_model_version
+    ON assessment_session (model_version);
+
+COMMIT;
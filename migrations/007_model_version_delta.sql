@@ -0,0 +1,31 @@
+-- Storico dei modelli compresso a delta (vedi app/services/model_versions.py).
+--
+-- Le nuove versioni non salvano più il JSON completo in content ma payload:
+--   base_id NULL      -> testo del modello compresso (zlib), "keyframe"
+--   base_id NOT NULL  -> differenze per righe rispetto alla versione base, compresse
+-- depth è la lunghezza della catena fino al keyframe (limitata
+-- dall'applicazione), per cui ricostruire una versione richiede al più
+-- qualche decina di righe lette con una sola query.
+-- Le versioni già presenti (content JSON) restano valide e fanno da keyframe.
+--
+-- Sostituisce le copie complete in backups/models: per importarle nello storico
+--   python -m app.services.model_history import-backups backups/models
+--
+-- Applicare con: psql "$DATABASE_URL" -f migrations/007_model_version_delta.sql
+
+BEGIN;
+
+ALTER TABLE model_version ALTER COLUMN content DROP NOT NULL;
+ALTER TABLE model_version ADD COLUMN IF NOT EXISTS base_id TEXT REFERENCES model_version(id);
+ALTER TABLE model_version ADD COLUMN IF NOT EXISTS depth SMALLINT NOT NULL DEFAULT 0;
+ALTER TABLE model_version ADD COLUMN IF NOT EXISTS payload BYTEA;
+ALTER TABLE model_version ADD COLUMN IF NOT EXISTS stored_size INTEGER;
+
+UPDATE model_version SET stored_size = size WHERE stored_size IS NULL;
+ALTER TABLE model_version ALTER COLUMN stored_size SET NOT NULL;
+
+ALTER TABLE model_version DROP CONSTRAINT IF EXISTS ck_model_version_body;
+ALTER TABLE model_version ADD CONSTRAINT ck_model_version_body
+    CHECK (content IS NOT NULL OR payload IS NOT NULL);
+
+COMMIT;
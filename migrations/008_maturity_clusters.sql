@@ -0,0 +1,47 @@
+-- Cluster dei profili di maturità delle sessioni (vedi app/services/maturity_clusters.py).
+--
+-- maturity_clustering: una riga per modello con le celle processo × dominio
+-- che compongono i vettori (nell'ordine dei centroidi) e i dati dell'ultima
+-- ricostruzione completa.
+-- maturity_cluster: centroidi (cluster 0 = profilo meno maturo) con il numero
+-- di sessioni assegnate e le raccomandazioni generate una volta per cluster.
+-- session_cluster: cluster di ogni sessione; assigned_at è confrontato con
+-- punteggi_json->>'updated_at' per riassegnare solo le sessioni cambiate.
+--
+-- Dopo la creazione popolare con:
+--   python -m app.services.maturity_clusters run --full
+-- Applicare con: psql "$DATABASE_URL" -f migrations/008_maturity_clusters.sql
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS maturity_clustering (
+    model_name TEXT PRIMARY KEY,
+    columns    JSONB NOT NULL,            -- [[process, category], ...]
+    k          SMALLINT NOT NULL,
+    sessions   INTEGER NOT NULL,          -- sessioni nell'ultima ricostruzione completa
+    inertia    DOUBLE PRECISION,          -- distanza quadratica media dal centroide
+    built_at   TIMESTAMP NOT NULL DEFAULT now(),
+    updated_at TIMESTAMP NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS maturity_cluster (
+    model_name         TEXT NOT NULL REFERENCES maturity_clustering(model_name) ON DELETE CASCADE,
+    cluster            SMALLINT NOT NULL,
+    centroid           JSONB NOT NULL,    -- valori nell'ordine di maturity_clustering.columns
+    size               INTEGER NOT NULL DEFAULT 0,
+    recommendations    TEXT,
+    recommendations_at TIMESTAMP,
+    PRIMARY KEY (model_name, cluster)
+);
+
+CREATE TABLE IF NOT EXISTS session_cluster (
+    session_id  UUID PRIMARY KEY REFERENCES assessment_session(id) ON DELETE CASCADE,
+    model_name  TEXT NOT NULL,
+    cluster     SMALLINT NOT NULL,
+    distance    REAL NOT NULL,
+    assigned_at TIMESTAMP NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS ix_session_cluster_model ON session_cluster (model_name, cluster);
+
+COMMIT;
@@ -0,0 +1,134 @@
+-- Libreria di raccomandazioni precalcolate (vedi app/services/recommendation_library.py).
+--
+-- Una riga per (processo, dominio, domanda, fascia di punteggio, settore);
+-- la stringa vuota vale "qualsiasi", così la stessa tabella contiene testi
+-- generici per dominio e testi specifici per una domanda o un settore. La
+-- ricerca parte dalla chiave più specifica e risale fino a quella generica.
+-- band: 0 critico (< 1.5), 1 debole (< 2.5), 2 in sviluppo (< 3.5), 3 avanzato.
+-- body è markdown, inserito così com'è nel report.
+--
+-- Le righe seed coprono i quattro domini del modello in tutte le fasce;
+-- per importare o esportare la libreria completa:
+--   python -m app.services.recommendation_library import libreria.csv
+--   python -m app.services.recommendation_library export libreria.csv
+-- Applicare con: psql "$DATABASE_URL" -f migrations/009_recommendation_library.sql
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS recommendation_entry (
+    id         SERIAL PRIMARY KEY,
+    process    TEXT NOT NULL DEFAULT '',
+    category   TEXT NOT NULL DEFAULT '',
+    dimension  TEXT NOT NULL DEFAULT '',
+    band       SMALLINT NOT NULL CHECK (band BETWEEN 0 AND 3),
+    settore    TEXT NOT NULL DEFAULT '',    -- minuscolo, '' = tutti i settori
+    title      TEXT NOT NULL,
+    body       TEXT NOT NULL,
+    priority   SMALLINT NOT NULL DEFAULT 0, -- ordine nel report a parità di fascia
+    updated_at TIMESTAMP NOT NULL DEFAULT now(),
+    CONSTRAINT uq_recommendation_entry_key UNIQUE (process, category, dimension, band, settore)
+);
+
+INSERT INTO recommendation_entry (category, band, title, body, priority) VALUES
+('Governance', 0, 'Definire e documentare il processo',
+ '- Mappare il processo attuale (attori, input, output, passaggi) in un workshop con i responsabili.
+- Redigere una procedura essenziale e renderla accessibile a tutti gli operatori.
+- Nominare un owner del processo con il compito di mantenerla aggiornata.
+- **KPI:** percentuale di attività svolte secondo procedura.', 10),
+('Governance', 1, 'Standardizzare procedure e flussi informativi',
+ '- Uniformare moduli, checklist e modelli di documento tra i reparti.
+- Definire i punti di scambio dati con i processi a monte e a valle.
+- Raccogliere le best practice interne in un manuale operativo condiviso.
+- **KPI:** tempo di attraversamento del processo, numero di rilavorazioni.', 10),
+('Governance', 2, 'Ottimizzare e integrare il processo',
+ '- Rivedere il processo con tecniche lean per eliminare attività a basso valore.
+- Integrare le procedure con quelle dei processi collegati (interfacce, responsabilità, dati).
+- Pianificare revisioni periodiche della documentazione.
+- **KPI:** lead time, costo per pratica, conformità alle procedure.', 10),
+('Governance', 3, 'Consolidare la governance del processo',
+ '- Mantenere il processo come riferimento interno e diffonderne il modello ad altre aree.
+- Introdurre audit periodici e un registro delle modifiche.
+- Valutare certificazioni o standard di settore che valorizzino il livello raggiunto.', 10),
+('Monitoring & Control', 0, 'Introdurre indicatori di base',
+ '- Scegliere 3-5 KPI essenziali del processo e un responsabile della rilevazione.
+- Registrare i dati con cadenza fissa, anche su foglio di calcolo condiviso.
+- Discutere i valori in una riunione periodica con i responsabili.
+- **KPI:** copertura della rilevazione (periodi con dati / periodi totali).', 20),
+('Monitoring & Control', 1, 'Strutturare il monitoraggio delle prestazioni',
+ '- Definire target e soglie di allarme per ogni KPI.
+- Automatizzare la raccolta dai sistemi esistenti dove possibile.
+- Pubblicare una dashboard periodica e collegarla a un ciclo di azioni correttive.
+- **KPI:** scostamento dal target, tempo di reazione alle anomalie.', 20),
+('Monitoring & Control', 2, 'Decisioni guidate dai dati e miglioramento continuo',
+ '- Passare a dashboard aggiornate in tempo quasi reale.
+- Introdurre analisi delle cause (Pareto, 5 perché) sulle deviazioni ricorrenti.
+- Collegare i feedback di clienti e operatori alla revisione del processo.
+- **KPI:** numero di azioni di miglioramento chiuse, trend dei KPI principali.', 20),
+('Monitoring & Control', 3, 'Analisi predittiva e riconfigurazione rapida',
+ '- Sperimentare modelli predittivi sui dati storici del processo.
+- Definire scenari di riconfigurazione e simularne l''impatto prima di applicarli.
+- Condividere il sistema di monitoraggio come riferimento per gli altri processi.', 20),
+('Organization', 0, 'Chiarire ruoli e responsabilità',
+ '- Redigere o aggiornare l''organigramma e una matrice RACI del processo.
+- Comunicare a ogni persona coinvolta le proprie responsabilità.
+- Stabilire un momento fisso di coordinamento tra i processi collegati.
+- **KPI:** attività con responsabile assegnato.', 30),
+('Organization', 1, 'Rafforzare la collaborazione tra processi',
+ '- Introdurre riunioni di coordinamento interfunzionali con ordine del giorno e verbale.
+- Definire i canali di comunicazione ufficiali tra i reparti.
+- Pianificare formazione sulle competenze digitali richieste dal processo.
+- **KPI:** ore di formazione per addetto, tempo di risoluzione dei problemi interfunzionali.', 30),
+('Organization', 2, 'Team interfunzionali e sviluppo delle competenze',
+ '- Costituire team di progetto trasversali sui temi di miglioramento.
+- Mappare le competenze e pianificare percorsi di crescita individuali.
+- Coinvolgere gli operatori nelle decisioni sul processo.
+- **KPI:** copertura della matrice delle competenze.', 30),
+('Organization', 3, 'Cultura organizzativa dell''innovazione',
+ '- Valorizzare le persone chiave come referenti interni di innovazione.
+- Estendere il modello organizzativo ai processi meno maturi.
+- Condividere i risultati ottenuti per sostenere la motivazione.', 30),
+('Technology', 0, 'Digitalizzare i dati del processo',
+ '- Sostituire registri cartacei e file sparsi con un archivio digitale condiviso.
+- Individuare un software gestionale adatto alla dimensione aziendale (anche in cloud).
+- Formare gli operatori all''uso degli strumenti scelti.
+- **KPI:** percentuale di dati di processo disponibili in formato digitale.', 40),
+('Technology', 1, 'Adottare e collegare i sistemi gestionali',
+ '- Consolidare i dati in un gestionale unico o in sistemi integrati (ERP, CRM).
+- Automatizzare le attività ripetitive a maggior volume.
+- Eliminare le doppie digitazioni tra sistemi diversi.
+- **KPI:** attività automatizzate, errori di inserimento dati.', 40),
+('Technology', 2, 'Integrare e automatizzare',
+ '- Integrare i sistemi tramite API o piattaforme di integrazione.
+- Estendere l''automazione ai flussi end-to-end del processo.
+- Centralizzare i dati in un repository unico per l''analisi.
+- **KPI:** flussi end-to-end senza interventi manuali.', 40),
+('Technology', 3, 'Tecnologie avanzate',
+ '- Valutare casi d''uso di intelligenza artificiale e analisi avanzata sui dati raccolti.
+- Rivedere periodicamente lo stack tecnologico e la sicurezza dei sistemi.
+- Misurare il ritorno degli investimenti tecnologici già fatti.', 40)
+ON CONFLICT ON CONSTRAINT uq_recommendation_entry_key DO NOTHING;
+
+-- Esempi specifici per settore: prevalgono sui testi generici della stessa chiave
+INSERT INTO recommendation_entry (category, band, settore, title, body, priority) VALUES
+('Technology', 0, 'turismo', 'Digitalizzare prenotazioni e dati cliente',
+ '- Adottare un gestionale di prenotazione (PMS o software per agenzie) in cloud.
+- Raccogliere i dati cliente in un archivio unico nel rispetto del GDPR.
+- Collegare il sito web a un motore di prenotazione.
+- **KPI:** prenotazioni registrate digitalmente, tasso di conversione online.', 40),
+('Technology', 1, 'turismo', 'Integrare canali di vendita e CRM',
+ '- Collegare i canali di vendita online tramite un channel manager.
+- Integrare prenotazioni e CRM per comunicazioni personalizzate.
+- Automatizzare conferme, promemoria e richieste di recensione.
+- **KPI:** ADR, tasso di occupazione, punteggio medio delle recensioni.', 40),
+('Monitoring & Control', 0, 'turismo', 'Monitorare prenotazioni e soddisfazione',
+ '- Rilevare ogni settimana prenotazioni, annullamenti e recensioni.
+- Introdurre un questionario di soddisfazione a fine servizio.
+- **KPI:** NPS, tasso di cancellazione, punteggio delle recensioni.', 20),
+('Monitoring & Control', 1, 'turismo', 'Dashboard commerciale e revenue',
+ '- Costruire una dashboard con RevPAR, ADR e conversione per canale.
+- Confrontare i dati con lo stesso periodo dell''anno precedente.
+- Usare i dati per decidere prezzi e promozioni.
+- **KPI:** RevPAR, conversione per canale.', 20)
+ON CONFLICT ON CONSTRAINT uq_recommendation_entry_key DO NOTHING;
+
+COMMIT;